@@ -0,0 +1,24 @@
+import subprocess
+
+import numpy as np
+
+# Decoded audio is read back from ffmpeg a block at a time, so memory stays
+# at one block however long the file is.
+DEFAULT_SAMPLE_RATE = 8000
+DEFAULT_BLOCK_SECONDS = 30
+
+def stream_pcm_blocks(path, sample_rate=DEFAULT_SAMPLE_RATE, block_seconds=DEFAULT_BLOCK_SECONDS):
+    """Yields the file's audio as mono 16-bit NumPy blocks, decoded by ffmpeg on the fly."""
+    cmd = ["ffmpeg", "-v", "error", "-i", path, "-vn",
+           "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-"]
+    block_bytes = sample_rate * block_seconds * 2
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        while chunk := proc.stdout.read(block_bytes):
+            yield np.frombuffer(chunk[:len(chunk) - len(chunk) % 2], dtype=np.int16)
+    finally:
+        # If the caller stops early, closing the pipe makes ffmpeg exit too
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
@@ -0,0 +1,118 @@
+import concurrent.futures
+import contextlib
+import glob
+import io
+import os
+import re
+import time
+
+# What a folder or glob is searched for
+MEDIA_EXTS = (".mp3", ".m4a", ".opus", ".ogg", ".flac", ".aac", ".webm", ".wav",
+              ".mp4", ".mov", ".m4v", ".mkv", ".avi")
+# Names the tools give their outputs (song_cut90s, song_+10, song_-3.0dB, song_-14LUFS).
+# Folders and globs leave these out when the file they were made from is
+# listed too, so a rerun - or another tool run over the same folder - doesn't
+# work on earlier results, while a song that is simply called "Mix_-2" is kept.
+DERIVED_NAME = re.compile(r"_(cut[\d.]+s(_f[\d.]+s)?|[+-]\d+|[+-][\d.]+dB|-?[\d.]+LUFS)$")
+
+def add_batch_args(parser):
+    """The options every tool gets for running over many files."""
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 4, help="Files to process at the same time (each is one ffmpeg)")
+    parser.add_argument("--force", action="store_true", help="Redo files whose output already exists and is newer than the source")
+
+def expand_sources(patterns, exts=MEDIA_EXTS):
+    """
+    Files named by `patterns`: files as given, folders (not recursive) and
+    globs filtered to `exts` and without the tools' own outputs (a derived
+    name whose base file is in the same listing).
+    """
+    sources = []
+    for pattern in patterns:
+        pattern = os.path.expanduser(pattern)
+        if os.path.isfile(pattern):
+            sources.append(pattern)
+            continue
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, f) for f in os.listdir(pattern)]
+        else:
+            matches = glob.glob(pattern)
+        media = {}
+        for path in sorted(matches):
+            name, ext = os.path.splitext(os.path.basename(path))
+            if os.path.isfile(path) and ext.lower() in exts and not name.startswith("."):
+                media[path] = name
+        # Any extension counts: an output may be in another container than its source
+        names = set(media.values())
+        for path, name in media.items():
+            derived = DERIVED_NAME.search(name)
+            if not (derived and name[:derived.start()] in names):
+                sources.append(path)
+
+    # Same file named twice (a folder and a glob inside it) is only done once
+    return list(dict.fromkeys(sources))
+
+def is_up_to_date(source_path, output_path):
+    return (os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(source_path))
+
+def run_captured(func, source_path, *args):
+    """
+    Runs one file in a worker process, catching what it prints so the
+    workers' output doesn't interleave. ffmpeg's own errors still go
+    straight to the terminal.
+    """
+    log = io.StringIO()
+    started = time.time()
+    try:
+        with contextlib.redirect_stdout(log):
+            output_path = func(source_path, *args)
+    except Exception as e:
+        log.write(f"❌ {type(e).__name__}: {e}\n")
+        output_path = None
+    return output_path, log.getvalue(), time.time() - started
+
+def run_batch(func, sources, args, output_path_for, workers, force=False):
+    """
+    Calls `func(source, *args)` for every source on a pool of `workers`
+    processes, skipping sources whose output (`output_path_for(source, *args)`)
+    is newer than they are. `func` returns the output path, or None if it
+    failed. Prints one line per file as it finishes, then a summary.
+    Returns the number of failures.
+    """
+    todo = []
+    skipped = 0
+    for source in sources:
+        if not force and is_up_to_date(source, output_path_for(source, *args)):
+            print(f"   ⏭️  {os.path.basename(source)} (up to date)")
+            skipped += 1
+        else:
+            todo.append(source)
+
+    if not todo:
+        print(f"\nNothing to do: all {skipped} files are up to date.")
+        return 0
+
+    workers = max(1, min(workers, len(todo)))
+    print(f"🚀 Processing {len(todo)} files ({workers} at a time)...")
+    started = time.time()
+    done = failed = 0
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_captured, func, source, *args): source for source in todo}
+        for future in concurrent.futures.as_completed(futures):
+            source = futures[future]
+            try:
+                output_path, log, elapsed = future.result()
+            except Exception as e:  # worker process died
+                output_path, log, elapsed = None, f"❌ {e}", 0.0
+            name = os.path.basename(source)
+            if output_path:
+                done += 1
+                print(f"   ✅ {name} -> {os.path.basename(output_path)} ({elapsed:.1f}s)")
+            else:
+                failed += 1
+                errors = [line.strip() for line in log.splitlines() if "❌" in line]
+                print(f"   ❌ {name}: {errors[-1].lstrip('❌ ') if errors else 'failed'}")
+
+    print(f"\nBatch complete in {time.time() - started:.0f}s: {done} done, {skipped} up to date, {failed} failed.")
+    return failed
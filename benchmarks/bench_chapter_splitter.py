@@ -0,0 +1,74 @@
+"""
+Splitting a long synthetic mix: the old way (one ffmpeg per chapter, '-ss'
+after '-i') against chapter_splitter (one demux for every copied chapter,
+input-side seeking and a worker pool for re-encodes).
+
+    python benchmarks/bench_chapter_splitter.py --minutes 60 --chapters 40
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chapter_splitter  # noqa: E402
+
+MP3_ARGS = ["-vn", "-c:a", "libmp3lame", "-b:a", "192k"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark chapter splitting on a long synthetic source.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=60, help="Length of the synthetic source")
+    parser.add_argument("--chapters", type=int, default=40, help="Chapters to cut it into")
+    parser.add_argument("--workers", "-w", type=int, default=chapter_splitter.DEFAULT_WORKERS, help="Re-encodes at the same time")
+    parser.add_argument("--source", help="Use this file instead of generating one")
+    return parser.parse_args()
+
+def make_source(path, seconds):
+    print(f"🎬 Generating a {seconds / 60:.0f} minute source...")
+    subprocess.run(["ffmpeg", "-y", "-v", "error",
+                    "-f", "lavfi", "-i", f"testsrc=size=320x180:rate=25:duration={seconds}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-g", "50", "-c:a", "aac", "-shortest", path],
+                   check=True)
+
+def old_split(source, chapters, codec_args):
+    """What video_splitter and split_manual did before: one output-seeking ffmpeg per chapter, in order."""
+    for c in chapters:
+        cmd = ["ffmpeg", "-y", "-v", "error", "-i", source, "-ss", str(c['start_time'])]
+        if c['end_time'] is not None:
+            cmd += ["-to", str(c['end_time'])]
+        subprocess.run(cmd + codec_args + [c['output_path']], check=True)
+
+def timed(label, func):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"   {label:<40} {elapsed:7.1f}s")
+    return elapsed
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_split_") as tmp:
+        seconds = args.minutes * 60
+        source = args.source or os.path.join(tmp, "source.mp4")
+        if not args.source:
+            make_source(source, seconds)
+
+        step = seconds / args.chapters
+        def chapters(tag, ext):
+            return [{'start_time': round(i * step, 3),
+                     'end_time': round((i + 1) * step, 3) if i < args.chapters - 1 else None,
+                     'output_path': os.path.join(tmp, f"{tag}_{i:03d}{ext}")}
+                    for i in range(args.chapters)]
+
+        print(f"⏱️  {args.chapters} chapters of a {args.minutes:g} minute source:")
+        old_copy = timed("copy, one ffmpeg per chapter (old)", lambda: old_split(source, chapters("oc", ".mp4"), ["-c", "copy"]))
+        new_copy = timed("copy, single pass (split_chapters)", lambda: chapter_splitter.split_chapters(source, chapters("nc", ".mp4")))
+        old_mp3 = timed("MP3, one ffmpeg per chapter (old)", lambda: old_split(source, chapters("om", ".mp3"), MP3_ARGS))
+        new_mp3 = timed(f"MP3, input seek, {args.workers} workers", lambda: chapter_splitter.split_chapters(source, chapters("nm", ".mp3"), MP3_ARGS, args.workers))
+        print(f"\n   Copy: {old_copy / new_copy:.1f}x faster, MP3: {old_mp3 / new_mp3:.1f}x faster")
+
+if __name__ == "__main__":
+    main()
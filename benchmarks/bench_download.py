@@ -0,0 +1,106 @@
+"""
+Per-track overhead of the batch downloader: the old way (a yt-dlp CLI process
+per URL) against download.DownloaderPool (one long-lived YoutubeDL reused
+for the whole queue), on a fixture list served from a local HTTP server.
+
+    python benchmarks/bench_download.py --tracks 20
+"""
+import argparse
+import functools
+import http.server
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import download  # noqa: E402
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the batch downloader on a local fixture list.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--tracks", type=int, default=20, help="Tracks in the fixture list")
+    parser.add_argument("--seconds", type=float, default=5, help="Length of each fixture track")
+    parser.add_argument("--audio-format", choices=sorted(download.AUDIO_FORMATS), default="native", help="Audio format for both downloaders")
+    parser.add_argument("--browser", "-b", help="Also load cookies from this browser, as a real run would")
+    return parser.parse_args()
+
+def make_fixtures(folder, tracks, seconds):
+    print(f"🎵 Generating {tracks} fixture tracks...")
+    for i in range(tracks):
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+                        "-i", f"sine=frequency={220 + 20 * i}:sample_rate=44100:duration={seconds}",
+                        "-c:a", "aac", os.path.join(folder, f"track_{i:03d}.m4a")], check=True)
+
+def serve(folder):
+    """Serves `folder` over HTTP on a free local port; returns the server."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=folder))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_list(path, base_url, tracks):
+    """The fixture list, in download.py's 'URL | Name' format."""
+    with open(path, "w") as f:
+        for i in range(tracks):
+            f.write(f"{base_url}/track_{i:03d}.m4a | Track {i:03d}\n")
+    return path
+
+def yt_dlp_command():
+    return [shutil.which("yt-dlp")] if shutil.which("yt-dlp") else [sys.executable, "-m", "yt_dlp"]
+
+def old_download(queue, out_dir, audio_format, browser):
+    """What download.py did before: one yt-dlp process per URL."""
+    extract = download.AUDIO_FORMATS[audio_format][0]
+    for i, (url, _) in enumerate(queue):
+        cmd = yt_dlp_command() + ["-x", "--audio-format", extract['preferredcodec'],
+                                  "-o", os.path.join(out_dir, f"old_{i:03d}", "source.%(ext)s"),
+                                  "--no-playlist", "--no-warnings", "--quiet", "--user-agent", download.USER_AGENT]
+        if 'preferredquality' in extract:
+            cmd += ["--audio-quality", extract['preferredquality']]
+        if browser:
+            cmd += ["--cookies-from-browser", browser]
+        subprocess.run(cmd + [url], check=True)
+
+def pool_download(queue, out_dir, audio_format, browser):
+    """download.py now: one DownloaderPool for the whole queue."""
+    pool = download.DownloaderPool(browser, audio_format)
+    try:
+        for i, (url, _) in enumerate(queue):
+            pool.download(url, os.path.join(out_dir, f"pool_{i:03d}"))
+    finally:
+        pool.close()
+
+def timed(label, func, tracks):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print(f"   {label:<36} {elapsed:7.2f}s  ({elapsed / tracks * 1000:6.0f} ms per track)")
+    return elapsed
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_download_") as tmp:
+        site = os.path.join(tmp, "site")
+        os.makedirs(site)
+        make_fixtures(site, args.tracks, args.seconds)
+        server = serve(site)
+        try:
+            base_url = f"http://127.0.0.1:{server.server_address[1]}"
+            queue = download.read_queue(write_list(os.path.join(tmp, "downloads.txt"), base_url, args.tracks))
+
+            print(f"⏱️  {len(queue)} tracks, one at a time ({args.audio_format}):")
+            old = timed("yt-dlp process per URL (old)", lambda: old_download(queue, tmp, args.audio_format, args.browser), len(queue))
+            new = timed("DownloaderPool", lambda: pool_download(queue, tmp, args.audio_format, args.browser), len(queue))
+            print(f"\n   {old / new:.1f}x faster, {(old - new) / len(queue) * 1000:.0f} ms less per track")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == "__main__":
+    main()
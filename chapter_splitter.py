@@ -0,0 +1,327 @@
+import bisect
+import concurrent.futures
+import os
+import subprocess
+import tempfile
+
+from media_probe import probe
+
+# Re-encoding is CPU-bound, one ffmpeg per chapter, so one per core
+DEFAULT_WORKERS = os.cpu_count() or 4
+# Each output holds its own muxer and file handle; very long chapter lists are
+# written over a few passes instead of one enormous command line.
+MAX_OUTPUTS_PER_PASS = 64
+# Stream-copy every stream the default selection picks
+COPY_ALL = ["-c", "copy"]
+
+# --- SMART CUT ---
+# Encoders able to rebuild the first partial GOP of a chapter in the same codec
+# as the source, so it can be joined to the stream-copied remainder.
+SMART_CUT_ENCODERS = {
+    "h264": ["-c:v", "libx264", "-preset", "fast", "-crf", "18"],
+    "hevc": ["-c:v", "libx265", "-preset", "fast", "-crf", "20"],
+}
+# Copied audio can't start mid-GOP either, so the head's audio is re-encoded too
+SMART_CUT_AUDIO_ENCODERS = {
+    "aac": ["-c:a", "aac", "-b:a", "256k"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "192k"],
+    "opus": ["-c:a", "libopus", "-b:a", "160k"],
+}
+# ffprobe's profile names -> the encoders' (profiles not listed are left to the encoder)
+SMART_CUT_PROFILES = {
+    "h264": {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+             "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444"},
+    "hevc": {"Main": "main", "Main 10": "main10", "Main Still Picture": "mainstillpicture"},
+}
+# Cuts this close to a keyframe are treated as landing on it
+KEYFRAME_TOLERANCE = 0.001
+# A joined chapter whose length is off by more than this (s) is re-encoded instead
+JOIN_DURATION_TOLERANCE = 0.25
+# Seconds either side of the join decoded to check it plays
+JOIN_CHECK_SECONDS = 1.0
+
+def partial_path(output_path):
+    # Example: "clips/01_Waltz.mp4" -> "clips/01_Waltz.part.mp4" (same extension, so ffmpeg picks the same muxer)
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.part{ext}"
+
+def finish_output(output_path, ok):
+    """Moves a finished partial output into place, or deletes it if its ffmpeg failed."""
+    partial = partial_path(output_path)
+    if ok and os.path.exists(partial) and os.path.getsize(partial) > 0:
+        os.replace(partial, output_path)
+        return True
+    if os.path.exists(partial):
+        os.remove(partial)
+    return False
+
+def run_to_output(cmd, output_path):
+    """
+    Runs ffmpeg `cmd` with `output_path` appended, writing to a partial name
+    first, so a failed or interrupted run never leaves a truncated file (or
+    an older one from an earlier run) that looks like a result.
+    """
+    ok = subprocess.run(cmd + [partial_path(output_path)]).returncode == 0
+    return finish_output(output_path, ok)
+
+def copy_chapter(source_path, chapter, copy_args=COPY_ALL):
+    """Stream-copies one chapter, seeking on the input side."""
+    cmd = ["ffmpeg", "-y", "-v", "error", "-ss", str(chapter['start_time'])]
+    if chapter.get('end_time') is not None:
+        cmd += ["-t", str(chapter['end_time'] - chapter['start_time'])]
+    return run_to_output(cmd + ["-i", source_path, *copy_args], chapter['output_path'])
+
+def split_copy(source_path, chapters, copy_args=COPY_ALL):
+    """
+    Stream-copies every chapter out of the source in a single ffmpeg run.
+
+    Running one ffmpeg per chapter with '-ss' after '-i' makes each run demux
+    the file from the very start up to its chapter, so a long video gets read
+    over and over. Here the source is opened once and every chapter is its
+    own output with its own '-ss'/'-to' window, so the file is demuxed once
+    and each output keeps only the packets that fall inside its window.
+
+    One exit code covers the whole pass, so if it fails its chapters are
+    redone one at a time (input-seeking) to find out which ones can be cut.
+    Returns the chapters written.
+    """
+    written = []
+    for i in range(0, len(chapters), MAX_OUTPUTS_PER_PASS):
+        batch = chapters[i:i + MAX_OUTPUTS_PER_PASS]
+        cmd = ["ffmpeg", "-y", "-v", "error", "-i", source_path]
+        for chapter in batch:
+            cmd += ["-ss", str(chapter['start_time'])]
+            if chapter.get('end_time') is not None:
+                cmd += ["-to", str(chapter['end_time'])]
+            cmd += [*copy_args, partial_path(chapter['output_path'])]
+        ok = subprocess.run(cmd).returncode == 0
+        for chapter in batch:
+            if finish_output(chapter['output_path'], ok) or (not ok and copy_chapter(source_path, chapter, copy_args)):
+                written.append(chapter)
+    return written
+
+def encode_chapter(source_path, chapter, codec_args):
+    """Re-encodes one chapter, seeking on the input side so only its own span is decoded."""
+    cmd = ["ffmpeg", "-y", "-v", "error", "-ss", str(chapter['start_time'])]
+    if chapter.get('end_time') is not None:
+        cmd += ["-t", str(chapter['end_time'] - chapter['start_time'])]
+    return run_to_output(cmd + ["-i", source_path, *codec_args], chapter['output_path'])
+
+def split_encode(source_path, chapters, codec_args, workers=DEFAULT_WORKERS):
+    """Re-encodes chapters over a bounded pool of ffmpeg processes. Returns the chapters written."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = executor.map(lambda chapter: encode_chapter(source_path, chapter, codec_args), chapters)
+        return [chapter for chapter, ok in zip(chapters, results) if ok]
+
+def keyframe_index(source_path):
+    """
+    Lists the source's video keyframe times (seconds), sorted.
+
+    Reads packet flags only, so the whole file is demuxed once but nothing
+    is decoded.
+    """
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", source_path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            keyframes.add(float(pts))
+    return sorted(keyframes)
+
+def video_encoder_args(video):
+    """
+    Encoder args for a head that matches the source stream as closely as the
+    encoder allows: same codec, profile, level, pixel format, frame size and
+    frame rate, so decoders see one consistent stream across the join.
+    """
+    args = list(SMART_CUT_ENCODERS[video.codec_name])
+    profile = SMART_CUT_PROFILES[video.codec_name].get(video.profile)
+    if video.codec_name == "h264":
+        if profile:
+            args += ["-profile:v", profile]
+        if video.level:
+            # ffprobe gives 41 for level 4.1
+            args += ["-level:v", f"{video.level / 10:g}"]
+    else:
+        if profile:
+            args += ["-profile:v", profile]
+        if video.level:
+            # ffprobe gives 30x the HEVC level: 123 for 4.1
+            args += ["-x265-params", f"level-idc={video.level / 30:g}"]
+    if video.pix_fmt:
+        args += ["-pix_fmt", video.pix_fmt]
+    if video.width and video.height:
+        args += ["-s", f"{video.width}x{video.height}"]
+    if video.frame_rate:
+        args += ["-r", video.frame_rate]
+    return args
+
+def smart_cut_settings(source_path):
+    """Returns encoder args matching the source's codecs, or None if it can't be smart-cut."""
+    info = probe(source_path)
+    if info is None:
+        return None
+
+    video, audio = info.video, info.audio
+    if not video or video.codec_name not in SMART_CUT_ENCODERS:
+        return None
+
+    args = video_encoder_args(video)
+    if audio:
+        if audio.codec_name not in SMART_CUT_AUDIO_ENCODERS:
+            return None
+        # The joined parts must agree on rate and layout to be concatenated by copy
+        args += SMART_CUT_AUDIO_ENCODERS[audio.codec_name]
+        args += ["-ar", str(audio.sample_rate), "-ac", str(audio.channels)]
+    return args
+
+def decode_errors(path, start=0.0, duration=None):
+    """
+    Decodes (part of) a file and returns the errors the decoders logged.
+    The null muxer's complaints about frame timestamps rounding to the same
+    tick are left out: they're about ffmpeg's output, not the file.
+    """
+    cmd = ["ffmpeg", "-v", "error", "-xerror", "-ss", f"{start:.6f}"]
+    if duration is not None:
+        cmd += ["-t", f"{duration:.6f}"]
+    result = subprocess.run(cmd + ["-i", path, "-f", "null", "-"], capture_output=True, text=True)
+    errors = [line for line in result.stderr.splitlines() if line.strip() and not line.startswith("[null @")]
+    if result.returncode != 0 and not errors:
+        errors.append(f"ffmpeg exited with {result.returncode}")
+    return errors
+
+def join_plays(path, join_at, expected_duration, source_video):
+    """
+    Checks a smart-cut chapter: the video stream still has the source's
+    format, the length is what was asked for, and the second either side of
+    the join decodes without a single error.
+    """
+    info = probe(path, cache=False)
+    video = info.video if info else None
+    if (video is None or video.codec_name != source_video.codec_name
+            or (video.width, video.height) != (source_video.width, source_video.height)
+            or (source_video.pix_fmt and video.pix_fmt != source_video.pix_fmt)):
+        return False
+    if expected_duration and abs(info.duration - expected_duration) > JOIN_DURATION_TOLERANCE:
+        return False
+    return not decode_errors(path, max(0.0, join_at - JOIN_CHECK_SECONDS), 2 * JOIN_CHECK_SECONDS)
+
+def smart_cut_chapter(source_path, chapter, keyframes, encoder_args, source_info=None):
+    """
+    Cuts one chapter frame-accurately while copying almost all of it.
+
+    Stream copy can only start on a keyframe, so a copied chapter really
+    begins at the keyframe before the cut. Instead, the stretch from the cut
+    to the next keyframe is re-encoded (at most one GOP of video) with the
+    source's profile, level, pixel format, size and frame rate, the rest is
+    stream-copied from that keyframe on, and the two parts are joined
+    losslessly through MPEG-TS, which carries each part's codec headers
+    in-band. Encoders can't reproduce the source's headers exactly, so the
+    joined chapter is checked (see join_plays) before it is kept.
+    Returns False if the chapter couldn't be cut or the join didn't check out.
+    """
+    start, end = chapter['start_time'], chapter.get('end_time')
+    output_path = chapter['output_path']
+
+    i = bisect.bisect_left(keyframes, start - KEYFRAME_TOLERANCE)
+    next_key = keyframes[i] if i < len(keyframes) else None
+
+    def window(cmd, a, b):
+        cmd += ["-ss", f"{a:.6f}"]
+        if b is not None:
+            cmd += ["-t", f"{b - a:.6f}"]
+        return cmd + ["-i", source_path]
+
+    # Already on a keyframe: plain input-seeking copy is exact
+    if next_key is not None and next_key - start <= KEYFRAME_TOLERANCE:
+        cmd = window(["ffmpeg", "-y", "-v", "error"], next_key, end)
+        return run_to_output(cmd + ["-c", "copy"], output_path)
+
+    # No keyframe inside the chapter: it's short enough to just re-encode
+    if next_key is None or (end is not None and next_key >= end):
+        cmd = window(["ffmpeg", "-y", "-v", "error"], start, end)
+        return run_to_output(cmd + encoder_args, output_path)
+
+    with tempfile.TemporaryDirectory(prefix="smartcut_") as tmp:
+        head = os.path.join(tmp, "head.ts")
+        tail = os.path.join(tmp, "tail.ts")
+        parts = os.path.join(tmp, "parts.txt")
+
+        cmd = window(["ffmpeg", "-y", "-v", "error"], start, next_key)
+        if subprocess.run(cmd + [*encoder_args, head]).returncode != 0:
+            return False
+        cmd = window(["ffmpeg", "-y", "-v", "error"], next_key, end)
+        if subprocess.run(cmd + ["-c", "copy", tail]).returncode != 0:
+            return False
+
+        with open(parts, "w") as f:
+            f.write(f"file '{head}'\nfile '{tail}'\n")
+        cmd = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", parts, "-c", "copy"]
+        video = source_info.video if source_info else None
+        if (video and video.time_base and video.time_base.startswith("1/")
+                and output_path.lower().endswith((".mp4", ".m4v", ".mov"))):
+            # Back to the source's own timescale rather than MPEG-TS's 90 kHz
+            cmd += ["-video_track_timescale", video.time_base[2:]]
+        partial = partial_path(output_path)
+        ok = subprocess.run(cmd + [partial]).returncode == 0
+        if ok and video:
+            full_end = end if end is not None else source_info.duration
+            ok = join_plays(partial, next_key - start, full_end - start if full_end else 0, video)
+        return finish_output(output_path, ok)
+
+def split_smart(source_path, chapters, workers=DEFAULT_WORKERS):
+    """
+    Frame-accurate splitting at close to stream-copy cost. Falls back to a
+    plain copy if the codec isn't supported. Returns the chapters written.
+    """
+    encoder_args = smart_cut_settings(source_path)
+    if not encoder_args:
+        print("⚠️  Smart cut not supported for this video codec, falling back to keyframe copy.")
+        return split_copy(source_path, chapters)
+
+    try:
+        keyframes = keyframe_index(source_path)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        keyframes = []
+    if not keyframes:
+        print("⚠️  Could not index keyframes, falling back to keyframe copy.")
+        return split_copy(source_path, chapters)
+
+    print(f"🔑 Indexed {len(keyframes)} keyframes; re-encoding only up to the first keyframe of each clip.")
+    info = probe(source_path)
+
+    def cut(chapter):
+        if smart_cut_chapter(source_path, chapter, keyframes, encoder_args, info):
+            return True
+        # Still frame-accurate, just not cheap
+        print(f"   ⚠️ Smart cut of '{os.path.basename(chapter['output_path'])}' failed its check, re-encoding the whole clip.")
+        return encode_chapter(source_path, chapter, encoder_args)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = executor.map(cut, chapters)
+        return [c for c, ok in zip(chapters, results) if ok]
+
+def split_chapters(source_path, chapters, codec_args=None, workers=DEFAULT_WORKERS, smart=False, copy_args=COPY_ALL):
+    """
+    Splits `source_path` into chapters.
+
+    Each chapter is a dict with 'start_time' and 'end_time' in seconds
+    ('end_time' None runs to the end of the file) and the 'output_path' to
+    write. With no `codec_args` everything is stream-copied in one pass
+    (`copy_args` picks which streams), or with `smart` cut frame-accurately
+    (see smart_cut_chapter); otherwise each chapter is re-encoded with those
+    ffmpeg arguments.
+    Returns the chapters whose ffmpeg succeeded. Outputs are written under a
+    partial name and only moved into place on success, so a failed chapter
+    leaves neither a truncated file nor a stale one passed off as new.
+    """
+    if not chapters:
+        return []
+
+    if codec_args:
+        return split_encode(source_path, chapters, codec_args, workers)
+    if smart:
+        return split_smart(source_path, chapters, workers)
+    return split_copy(source_path, chapters, copy_args)
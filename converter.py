@@ -1,9 +1,16 @@
 import argparse
+import concurrent.futures
 import os
 import subprocess
 import sys
 
+from batch_runner import add_batch_args, is_up_to_date
+from media_probe import probe_many, NATIVE_AUDIO_CONTAINERS, AUDIO_MUXERS
+
 # === CONFIGURATION ===
+# Each conversion is one CPU-bound ffmpeg, so one per core
+DEFAULT_WORKERS = os.cpu_count() or 4
+
 # Primary Font (Chinese support)
 PRIMARY_FONT_CANDIDATES = [
     "/System/Library/Fonts/Supplemental/Arial Unicode.ttf", # Best (.ttf is safer than .ttc)
@@ -36,6 +43,19 @@ def escape_ffmpeg_text(text):
     text = text.replace("%", "\\%")
     return text
 
+# Test string for the font check: a font that can't draw this falls back
+FONT_CHECK_TEXT = "Aa 中文"
+
+# Source and target extensions. mp4_extract_audio picks the target per file:
+# the container matching the audio codec, so the track is copied out as it is
+# (MP3 if it can't be).
+MODES = {
+    "mp4_to_mp3": (".mp4", ".mp3"),
+    "mp3_to_mp4": (".mp3", ".mp4"),
+    "mp4_extract_audio": (".mp4", None),
+}
+MP3_ARGS = ["-acodec", "libmp3lame", "-q:a", "2"]
+
 def run_ffmpeg_command(cmd, filename):
     """Runs FFmpeg and captures stderr for debugging."""
     try:
@@ -45,7 +65,78 @@ def run_ffmpeg_command(cmd, filename):
     except subprocess.CalledProcessError as e:
         return False, e.stderr
 
-def convert_media(source_dir, target_dir, mode):
+def drawtext_filter(font_path, text):
+    # Note: We put the path in single quotes inside the string
+    return (
+        f"drawtext=fontfile='{font_path}':"
+        f"text='{escape_ffmpeg_text(text)}':"
+        "fontcolor=white:fontsize=60:"
+        "x=(w-text_w)/2:y=(h-text_h)/2"
+    )
+
+def resolve_font():
+    """
+    Picks the font for the whole run: the best Chinese-capable one if FFmpeg
+    can actually draw with it (.ttc files and some fonts break drawtext),
+    otherwise the plain fallback. One tiny test render instead of a failed
+    conversion per file.
+    """
+    font = get_best_font()
+    if font != FALLBACK_FONT:
+        cmd = ["ffmpeg", "-v", "error", "-f", "lavfi", "-i", "color=c=black:s=320x240:r=1",
+               "-vf", drawtext_filter(font, FONT_CHECK_TEXT), "-frames:v", "1", "-f", "null", "-"]
+        ok, _ = run_ffmpeg_command(cmd, FONT_CHECK_TEXT)
+        if not ok:
+            print(f"⚠️  FFmpeg can't draw with {os.path.basename(font)}, using the fallback font.")
+            font = FALLBACK_FONT
+    return font
+
+def build_command(mode, src_path, out_path, fmt, name_part, font_path, copy_audio=False):
+    if mode == "mp4_extract_audio" and copy_audio:
+        # Demux only: the audio packets are copied into the new container untouched
+        return [
+            "ffmpeg", "-y", "-v", "error",
+            "-i", src_path, "-map", "0:a:0",
+            "-c:a", "copy",
+            "-f", fmt, out_path
+        ]
+    if mode in ("mp4_to_mp3", "mp4_extract_audio"):
+        return [
+            "ffmpeg", "-y", "-v", "error",
+            "-i", src_path, "-vn",
+            *MP3_ARGS,
+            "-f", fmt, out_path
+        ]
+    return [
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", "color=c=black:s=1280x720:r=1",
+        "-i", src_path,
+        "-filter_complex", f"[0:v]{drawtext_filter(font_path, name_part)}[v]",
+        "-map", "[v]", "-map", "1:a",
+        "-c:v", "libx264", "-tune", "stillimage", "-pix_fmt", "yuv420p",
+        "-c:a", "copy", "-shortest",
+        "-f", fmt, out_path
+    ]
+
+def convert_file(mode, src_path, tgt_path, font_path, copy_audio=False):
+    """
+    Converts one file (run in a worker process). Writes to a temporary name
+    and renames when done, so an interrupted run never leaves a half-written
+    target that looks up to date. Returns (ok, error message).
+    """
+    name_part = os.path.splitext(os.path.basename(src_path))[0]
+    part_path = tgt_path + ".part"
+    # The temporary name hides the extension, so the muxer is named explicitly
+    fmt = AUDIO_MUXERS.get(os.path.splitext(tgt_path)[1].lower(), "mp4")
+    cmd = build_command(mode, src_path, part_path, fmt, name_part, font_path, copy_audio)
+    success, error_msg = run_ffmpeg_command(cmd, src_path)
+    if success:
+        os.replace(part_path, tgt_path)
+    elif os.path.exists(part_path):
+        os.remove(part_path)
+    return success, error_msg
+
+def convert_media(source_dir, target_dir, mode, workers=DEFAULT_WORKERS, force=False):
     # 1. Setup Directories
     if not os.path.exists(source_dir):
         print(f"❌ Error: Source directory '{source_dir}' not found.")
@@ -58,102 +149,76 @@ def convert_media(source_dir, target_dir, mode):
         os.makedirs(target_dir)
         print(f"📂 Created target directory: {target_dir}")
 
-    # 2. Setup Fonts
-    primary_font = get_best_font()
-    print(f"🔤 Primary Font: {os.path.basename(primary_font)}")
-    print(f"🔤 Fallback Font: {os.path.basename(FALLBACK_FONT)}")
-
-    # 3. Determine Mode
-    if mode == "mp4_to_mp3":
-        src_ext = ".mp4"
-        tgt_ext = ".mp3"
-    elif mode == "mp3_to_mp4":
-        src_ext = ".mp3"
-        tgt_ext = ".mp4"
-    else:
+    # 2. Determine Mode
+    if mode not in MODES:
         print("❌ Error: Invalid mode.")
         return
+    src_ext, tgt_ext = MODES[mode]
 
-    # 4. Find Files
-    files = [f for f in os.listdir(source_dir) if f.lower().endswith(src_ext)]
+    # 3. Find Files
+    files = sorted(f for f in os.listdir(source_dir) if f.lower().endswith(src_ext))
     if not files:
         print(f"⚠️  No {src_ext} files found in '{source_dir}'.")
         return
 
-    print(f"   Found {len(files)} files to convert.")
-    
-    # 5. Process Loop
-    success_count = 0
-    
+    # Extraction copies each file's audio into the container its codec calls for
+    codecs = {}
+    if mode == "mp4_extract_audio":
+        probes = probe_many(os.path.join(source_dir, f) for f in files)
+        codecs = {path: info.audio.codec_name for path, info in probes.items() if info and info.audio}
+
+    # Targets newer than their source were converted on an earlier run
+    jobs = []
+    copied = 0
     for filename in files:
         src_path = os.path.join(source_dir, filename)
-        name_part = os.path.splitext(filename)[0]
-        tgt_filename = f"{name_part}{tgt_ext}"
-        tgt_path = os.path.join(target_dir, tgt_filename)
-
-        print(f"⏳ Converting: {filename} ...", end="\r")
-
-        # --- COMMAND GENERATION ---
-        # We define a helper to build the command so we can easily swap fonts
-        def build_command(font_path_to_use):
-            if mode == "mp4_to_mp3":
-                return [
-                    "ffmpeg", "-y", "-v", "error",
-                    "-i", src_path, "-vn",
-                    "-acodec", "libmp3lame", "-q:a", "2",
-                    tgt_path
-                ]
-            elif mode == "mp3_to_mp4":
-                clean_name = escape_ffmpeg_text(name_part)
-                # Note: We put the path in single quotes inside the string
-                filter_str = (
-                    f"drawtext=fontfile='{font_path_to_use}':"
-                    f"text='{clean_name}':"
-                    "fontcolor=white:fontsize=60:"
-                    "x=(w-text_w)/2:y=(h-text_h)/2"
-                )
-                return [
-                    "ffmpeg", "-y", "-v", "error",
-                    "-f", "lavfi", "-i", "color=c=black:s=1280x720:r=1",
-                    "-i", src_path,
-                    "-filter_complex", f"[0:v]{filter_str}[v]",
-                    "-map", "[v]", "-map", "1:a",
-                    "-c:v", "libx264", "-tune", "stillimage", "-pix_fmt", "yuv420p",
-                    "-c:a", "copy", "-shortest",
-                    tgt_path
-                ]
-
-        # --- ATTEMPT 1: Primary Font ---
-        cmd = build_command(primary_font)
-        success, error_msg = run_ffmpeg_command(cmd, filename)
-
-        if not success and mode == "mp3_to_mp4":
-            # --- ATTEMPT 2: Fallback Font ---
-            # If the fancy font failed, try the boring one.
-            # This fixes issues where .ttc files or chinese characters break FFmpeg.
-            cmd_fallback = build_command(FALLBACK_FONT)
-            success, error_msg_fallback = run_ffmpeg_command(cmd_fallback, filename)
-            
+        copy_audio = codecs.get(src_path) in NATIVE_AUDIO_CONTAINERS
+        ext = NATIVE_AUDIO_CONTAINERS[codecs[src_path]] if copy_audio else (tgt_ext or ".mp3")
+        tgt_path = os.path.join(target_dir, f"{os.path.splitext(filename)[0]}{ext}")
+        if force or not is_up_to_date(src_path, tgt_path):
+            jobs.append((src_path, tgt_path, copy_audio))
+            copied += copy_audio
+
+    print(f"   Found {len(files)} files, {len(files) - len(jobs)} already converted.")
+    if mode == "mp4_extract_audio" and jobs:
+        print(f"   {copied} can be copied out as they are, {len(jobs) - copied} need transcoding to MP3.")
+    if not jobs:
+        print("\n✅ Nothing to do, everything is up to date.")
+        print(f"📂 Output: {target_dir}")
+        return
+
+    # 4. Setup Fonts (once for the run)
+    font = None
+    if mode == "mp3_to_mp4":
+        font = resolve_font()
+        print(f"🔤 Font: {os.path.basename(font)}")
+
+    # 5. Convert in parallel
+    success_count = 0
+    workers = max(1, min(workers, len(jobs)))
+    print(f"🚀 Converting {len(jobs)} files ({workers} at a time)...")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, mode, src, tgt, font, copy_audio): src
+                   for src, tgt, copy_audio in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            filename = os.path.basename(futures[future])
+            success, error_msg = future.result()
             if success:
-                print(f"⚠️  Used fallback font for: {filename}      ")
+                success_count += 1
+                print(f"⏳ Converted [{success_count}/{len(jobs)}]: {filename}")
             else:
-                print(f"\n❌ Failed to convert {filename}")
-                print(f"   Error: {error_msg_fallback}") # Print the ACTUAL error
-        elif not success:
-             print(f"\n❌ Failed to convert {filename}")
-             print(f"   Error: {error_msg}")
-
-        if success:
-            success_count += 1
+                print(f"❌ Failed to convert {filename}")
+                print(f"   Error: {error_msg}") # Print the ACTUAL error
             
-    print(f"\n✅ Done! {success_count}/{len(files)} converted.")
+    print(f"\n✅ Done! {success_count}/{len(jobs)} converted ({len(files) - len(jobs)} already up to date).")
     print(f"📂 Output: {target_dir}")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Batch convert MP3 <-> MP4", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser = argparse.ArgumentParser(description="Batch convert MP3 <-> MP4, or pull the audio out of MP4s without re-encoding (mp4_extract_audio)", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--source", "-s", required=True, help="Source Directory")
     parser.add_argument("--target", "-t", help="Target Directory")
-    parser.add_argument("--mode", "-m", required=True, choices=['mp4_to_mp3', 'mp3_to_mp4'], help="Mode")
+    parser.add_argument("--mode", "-m", required=True, choices=list(MODES), help="Mode")
+    add_batch_args(parser)
     args = parser.parse_args()
     
-    convert_media(args.source, args.target, args.mode)
\ No newline at end of file
+    convert_media(args.source, args.target, args.mode, args.workers, args.force)
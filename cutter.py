@@ -5,7 +5,9 @@ import sys
 
 from pydub import AudioSegment
 
-from process import smooth_fade_out, FADE_CURVE, FADE_FLOOR_DB
+from batch_runner import add_batch_args, expand_sources, run_batch
+from media_probe import probe, probe_duration
+from process import smooth_fade_out, fade_taper_frames, FADE_CURVE, FADE_FLOOR_DB
 from speed_adjuster import probe_streams
 
 # pydub needs the container name and codec, which don't always match the extension
@@ -16,20 +18,67 @@ EXPORT_FORMATS = {
     ".wav": ("wav", None),
     ".flac": ("flac", None),
     ".ogg": ("ogg", "libvorbis"),
+    ".opus": ("opus", "libopus"),
+    ".webm": ("webm", "libopus"),
 }
 
-def probe_duration(path):
-    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration",
-           "-of", "csv=p=0", path]
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return float(result.stdout.strip())
-    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
-        return 0.0
+def output_path_for(source_path, length_s, fade_s):
+    # Both settings are in the name, so a rerun with another --fade isn't taken as up to date
+    directory, filename = os.path.split(os.path.expanduser(source_path))
+    name, ext = os.path.splitext(filename)
+    return os.path.join(directory, f"{name}_cut{length_s:g}s_f{fade_s:g}s{ext.lower()}")
+
+def fade_out_expr(start, frames, fade_ms, curve=FADE_CURVE, floor_db=FADE_FLOOR_DB):
+    """
+    aeval expression applying smooth_fade_out's gain to samples
+    [start, start + frames): the same bent dB ramp, indexed by sample like
+    the NumPy version, and the same linear taper to silence at the end.
+    """
+    t = f"(n-{start})/{frames - 1}"
+    gain = f"pow(10,({floor_db}*pow({t},{max(0.1, curve)}))/20)"
+    taper = fade_taper_frames(frames, fade_ms)
+    if taper > 1:
+        taper_start = start + frames - taper
+        gain += f"*if(lt(n,{taper_start}),1,1-(n-{taper_start})/{taper - 1})"
+    return f"val(ch)*if(lt(n,{start}),1,{gain})"
+
+def cut_audio_stream(source_path, output_path, ext, total_ms, fade_ms, sample_rate):
+    """
+    Cuts and fades in one ffmpeg pass. The input-side -t stops decoding at
+    the cut, so only the part that's kept is ever read. Sample positions are
+    worked out exactly as pydub slices by milliseconds, so the fade lands on
+    the same samples as cut_audio's pydub path.
+    """
+    frames_total = int(total_ms * sample_rate / 1000)
+    kept_ms = round(frames_total * 1000 / sample_rate)
+    fade_ms = min(int(round(fade_ms)), kept_ms)
+    fade_start = int((kept_ms - fade_ms) * sample_rate / 1000)
+    fade_frames = frames_total - fade_start
+
+    filters = f"atrim=end_sample={frames_total}"
+    if fade_ms > 0 and fade_frames >= 2:
+        filters += f",aeval=exprs='{fade_out_expr(fade_start, fade_frames, fade_ms)}':channel_layout=same"
+
+    fmt, codec = EXPORT_FORMATS.get(ext, ("mp3", None))
+    cmd = ["ffmpeg", "-y", "-v", "error", "-t", f"{total_ms / 1000}", "-i", source_path,
+           "-vn", "-af", filters, "-f", fmt]
+    if codec:
+        cmd += ["-c:a", codec]
+    cmd.append(output_path)
+    subprocess.run(cmd, check=True)
 
 def cut_audio(source_path, output_path, ext, length_s, fade_s):
-    audio = AudioSegment.from_file(source_path)
     total_ms = int(round((length_s + fade_s) * 1000))
+
+    # Sources that run past the cut stream through ffmpeg. A shorter one is
+    # faded at its real end, which only a full decode finds exactly - but it's
+    # short, so decoding it whole costs no more than the cut itself.
+    info = probe(source_path)
+    if info and info.audio and info.audio.sample_rate and info.duration * 1000 > total_ms:
+        cut_audio_stream(source_path, output_path, ext, total_ms, fade_s * 1000, info.audio.sample_rate)
+        return
+
+    audio = AudioSegment.from_file(source_path)
     if len(audio) > total_ms:
         audio = audio[:total_ms]
 
@@ -58,22 +107,23 @@ def cut_video(source_path, output_path, length_s, fade_s, fade_start, has_audio)
     subprocess.run(cmd, check=True)
 
 def cut(source_path, length_s, fade_s):
+    """Cuts one file. Returns the output path, or None if it failed."""
     # 1. Validation
     source_path = os.path.expanduser(source_path)
     if not os.path.exists(source_path):
         print(f"❌ Error: File not found: {source_path}")
-        return
+        return None
     if length_s <= 0:
         print(f"❌ Error: --length must be greater than 0 (got {length_s}).")
-        return
+        return None
     if fade_s < 0:
         print(f"❌ Error: --fade cannot be negative (got {fade_s}).")
-        return
+        return None
 
     has_video, has_audio = probe_streams(source_path)
     if not has_audio and not has_video:
         print(f"❌ Error: No audio or video streams found in: {source_path}")
-        return
+        return None
 
     # 2. Work out where the fade sits
     # --length is full-volume material; the fade is added after it, matching how
@@ -92,7 +142,7 @@ def cut(source_path, length_s, fade_s):
         total_s = duration
         fade_start = max(0.0, duration - fade_s)
 
-    output_path = os.path.join(directory, f"{name}_cut{length_s:g}s{ext}")
+    output_path = output_path_for(source_path, length_s, fade_s)
 
     print(f"{'🎬' if has_video else '🎧'} Cutting:  {filename}")
     print(f"   Keeping:   {min(length_s, max(0.0, total_s - fade_s)):g}s at full volume, "
@@ -107,10 +157,12 @@ def cut(source_path, length_s, fade_s):
         else:
             cut_audio(source_path, output_path, ext, length_s, fade_s)
         print(f"✅ Success! Created: {output_path}")
+        return output_path
     except subprocess.CalledProcessError as e:
         print(f"❌ FFmpeg Error: {e}")
     except FileNotFoundError:
         print("❌ Error: FFmpeg is not installed or not in your PATH.")
+    return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -118,10 +170,19 @@ if __name__ == "__main__":
                     "The fade is added after --length, so you keep the full length you asked for.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("--source", required=True, help="Path to the audio file (MP3, M4A...) or video file (MP4...)")
+    parser.add_argument("--source", required=True, nargs="+", help="Audio (MP3, M4A...) or video (MP4...) files, folders or globs (e.g. 'Samba/*.m4a')")
     parser.add_argument("--length", required=True, type=float, help="Length to keep at full volume, in seconds")
     parser.add_argument("--fade", type=float, default=3, help="Fade out (s), added on top of --length")
+    add_batch_args(parser)
 
     args = parser.parse_args()
 
-    cut(args.source, args.length, args.fade)
+    if len(args.source) == 1 and os.path.isfile(os.path.expanduser(args.source[0])):
+        cut(args.source[0], args.length, args.fade)
+    else:
+        sources = expand_sources(args.source)
+        if not sources:
+            print("❌ Error: No audio or video files found.")
+            sys.exit(1)
+        if run_batch(cut, sources, (args.length, args.fade), output_path_for, args.workers, args.force):
+            sys.exit(1)
@@ -1,95 +1,219 @@
 import os
-import subprocess
 import argparse
 import shutil
+import random
+import re
+import threading
+import time
+import collections
+import concurrent.futures
+from urllib.parse import urlparse
 
-# File to store URLs of songs we have already downloaded
-HISTORY_FILE = "download_history.log"
+import yt_dlp
+from yt_dlp.utils import DownloadError
+
+import source_cache
+from fingerprint import FingerprintIndex, FINGERPRINT_INDEX
+from job_history import JobHistory
+
+# Several URLs for one service share its rate limits, so they share a host slot
+HOST_ALIASES = {"youtu.be": "youtube.com", "music.youtube.com": "youtube.com"}
+# yt-dlp errors worth another try; anything else (private, removed...) fails at once
+TRANSIENT_ERRORS = re.compile(
+    r"HTTP Error (429|5\d\d)|timed? ?out|Connection (reset|refused|aborted)|"
+    r"Temporary failure|Remote end closed|IncompleteRead|Unable to download webpage",
+    re.IGNORECASE)
+# ...unless the site answered with a client error: a 404 or 403 won't change on a retry
+PERMANENT_ERRORS = re.compile(r"HTTP Error (?!429)4\d\d")
+# --audio-format: how yt-dlp extracts the audio, and the cache format it's stored under.
+# 'best' keeps the site's own codec (at most remuxed into its usual container,
+# e.g. Opus out of WebM); 'mp3' decodes and re-encodes through LAME.
+AUDIO_FORMATS = {
+    "native": ({'preferredcodec': 'best'}, "audio|native"),
+    "mp3": ({'preferredcodec': 'mp3', 'preferredquality': '0'}, "audio|mp3|q0"),
+}
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Universal Batch Downloader (YouTube, SoundCloud, TikTok, etc.)", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--list", "-l", default="downloads.txt", help="Path to the list file (Format: URL | Name)")
     parser.add_argument("--output", "-o", default="input_mp3s", help="Folder to save downloads")
     parser.add_argument("--browser", "-b", help="Load cookies from browser (e.g. 'chrome', 'safari', 'firefox')")
+    parser.add_argument("--audio-format", choices=sorted(AUDIO_FORMATS), default="native", help="'native' keeps the original audio stream (m4a/opus/...) with no transcode; 'mp3' converts everything to MP3")
     parser.add_argument("--force", action="store_true", help="Ignore history and force re-download")
+    parser.add_argument("--fingerprints", default=FINGERPRINT_INDEX, help="Fingerprint index from fingerprint.py; new downloads of songs already in it are not kept")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Keep new downloads even if the fingerprint index already has the song")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Downloads to run at the same time")
+    parser.add_argument("--per-host", type=int, default=2, help="Max simultaneous downloads from any one site")
+    parser.add_argument("--retries", type=int, default=3, help="Retries for network errors (rate limits, timeouts, 5xx)")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Base delay (s) before a retry; doubles on each attempt")
     return parser.parse_args()
 
-def load_history():
-    """Loads the set of previously downloaded URLs."""
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
+def host_key(url):
+    """The site a URL belongs to, for per-host limits ('www.' and known aliases folded together)."""
+    host = (urlparse(url).netloc or url).lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return HOST_ALIASES.get(host, host)
 
-def update_history(url):
-    """Appends a new URL to the history file."""
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(url + "\n")
+class QueueProgress:
+    """Thread-safe counters for the running batch, printed as a one-line summary."""
 
-def download_track(url, custom_name, output_dir, browser=None):
-    """Calls yt-dlp to download and convert to MP3."""
-    
-    output_template = os.path.join(output_dir, f"{custom_name}.%(ext)s")
-    
-    print(f"⬇️  Downloading: {custom_name}...")
-    
-    cmd = [
-        "yt-dlp",
-        "-x",                       # Extract audio
-        "--audio-format", "mp3",    # Convert to MP3
-        "--audio-quality", "0",     # Best quality
-        "-o", output_template,      # Output template
-        "--no-playlist",            # Ensure we only get the single video
-        "--ignore-errors",          # Don't crash batch on error
-        "--no-warnings",
-        "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36", 
-    ]
-
-    if browser:
-        cmd.extend(["--cookies-from-browser", browser])
-
-    cmd.append(url)
+    def __init__(self, total):
+        self.total = total
+        self.done = self.failed = self.active = 0
+        self.lock = threading.Lock()
 
-    try:
-        # Run process
-        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        print(f"✅ Success: {custom_name}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Failed: {custom_name}")
-        if e.stderr:
-            error_lines = e.stderr.strip().split('\n')
-            print(f"   Error: {error_lines[-1]}")
-        return False
+    def started(self):
+        with self.lock:
+            self.active += 1
 
-def main():
-    args = parse_args()
+    def finished(self, ok):
+        with self.lock:
+            self.active -= 1
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            finished = self.done + self.failed
+            print(f"   📊 [{finished}/{self.total}] ✅ {self.done}  ❌ {self.failed}  "
+                  f"⏳ {self.active} running, {self.total - finished - self.active} queued")
 
-    if not shutil.which("ffmpeg"):
-        print("❌ Error: 'ffmpeg' is not installed.")
-        return
+class QuietLogger:
+    """Swallows yt-dlp's console output; failures reach us as DownloadError instead."""
 
-    if not os.path.exists(args.list):
-        print(f"Error: List file '{args.list}' not found.")
-        return
+    def debug(self, msg):
+        pass
 
-    if not os.path.exists(args.output):
-        os.makedirs(args.output)
+    def info(self, msg):
+        pass
 
-    # 1. Load History
-    history = load_history()
-    if not args.force:
-        print(f"📚 Loaded {len(history)} previously downloaded URLs.")
-    
-    print(f"Reading queue from {args.list}...")
-    if args.browser:
-        print(f"🔓 Masquerading as {args.browser}...")
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+class DownloaderPool:
+    """
+    Long-lived yt-dlp instances, one per worker thread, reused for the whole queue.
+
+    Starting the yt-dlp CLI for every track re-imports all of its extractors,
+    re-reads the browser's cookie store and opens fresh connections each
+    time. Here the extractors are loaded once, the browser cookies are read
+    once and shared by every instance, and each instance keeps its HTTP
+    connections open from one track to the next.
+    """
+
+    def __init__(self, browser=None, audio_format="native"):
+        extract, self.cache_format = AUDIO_FORMATS[audio_format]
+        self.options = {
+            'format': 'bestaudio/best',
+            'postprocessors': [dict(extract, key='FFmpegExtractAudio')],
+            'noplaylist': True,                 # Ensure we only get the single video
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'logger': QuietLogger(),
+            'http_headers': {'User-Agent': USER_AGENT},
+        }
+        self.cookies = None
+        if browser:
+            # Read the browser's cookies once; every instance shares the jar
+            with yt_dlp.YoutubeDL(dict(self.options, cookiesfrombrowser=(browser,))) as ydl:
+                self.cookies = ydl.cookiejar
+        self.local = threading.local()
+        self.instances = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """This thread's YoutubeDL, created on first use."""
+        ydl = getattr(self.local, "ydl", None)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(dict(self.options))
+            if self.cookies is not None:
+                ydl.cookiejar = self.cookies
+            self.local.ydl = ydl
+            with self.lock:
+                self.instances.append(ydl)
+        return ydl
+
+    def download(self, url, output_dir):
+        """Downloads one URL's audio into `output_dir` as 'source.<ext>'."""
+        ydl = self.get()
+        ydl.params['outtmpl'] = {'default': os.path.join(output_dir, "source.%(ext)s")}
+        ydl.extract_info(url, download=True)
+
+    def close(self):
+        with self.lock:
+            for ydl in self.instances:
+                ydl.close()
+            self.instances.clear()
+
+def download_track(url, custom_name, output_dir, pool, retries=0, backoff=2.0):
+    """
+    Downloads the audio with yt-dlp, in the pool's audio format (via the shared download cache).
+    Network errors are retried with exponential backoff. Returns the saved path, or None.
+    """
     
-    with open(args.list, 'r') as f:
+    print(f"⬇️  Downloading: {custom_name}...")
+
+    def fetch(tmp_dir):
+        pool.download(url, tmp_dir)
+
+    for attempt in range(retries + 1):
+        try:
+            # Download (or reuse an earlier download of the same media)
+            with source_cache.cached_source(source_cache.source_id_for(url), pool.cache_format, fetch) as cached:
+                if not cached:
+                    print(f"❌ Failed: {custom_name}")
+                    return None
+                output_path = os.path.join(output_dir, f"{custom_name}{os.path.splitext(cached)[1]}")
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                source_cache.export(cached, output_path)
+            print(f"✅ Success: {custom_name}")
+            return output_path
+        except DownloadError as e:
+            error = str(e).strip().split('\n')[-1]
+            if attempt < retries and TRANSIENT_ERRORS.search(str(e)) and not PERMANENT_ERRORS.search(str(e)):
+                # Exponential backoff with jitter, so parallel workers don't retry in lockstep
+                delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+                print(f"🔁 Retrying {custom_name} in {delay:.1f}s ({attempt + 1}/{retries}): {error}")
+                time.sleep(delay)
+                continue
+            print(f"❌ Failed: {custom_name}")
+            if error:
+                print(f"   Error: {error}")
+            return None
+
+def find_duplicate(dedupe, path):
+    """The library file `path` duplicates per the fingerprint index, or None (also if it can't be fingerprinted)."""
+    try:
+        return dedupe.check_new_file(path)
+    except Exception as e:
+        print(f"   ⚠️ Could not fingerprint {os.path.basename(path)}: {e}")
+        return None
+
+def load_dedupe_index(path, keep_duplicates=False):
+    """The fingerprint index to check new downloads against, or None if there isn't one (or it's turned off)."""
+    if keep_duplicates or not path or not os.path.exists(path):
+        return None
+    index = FingerprintIndex(path)
+    print(f"🧬 Checking new downloads against {len(index)} fingerprinted songs.")
+    return index
+
+def read_queue(list_path, history=None):
+    """
+    Reads a 'URL | Name' list into (url, name) pairs, skipping comments,
+    duplicate URLs and anything already finished in `history`.
+    """
+    with open(list_path, 'r') as f:
         lines = f.readlines()
 
     # Track URLs seen in THIS run (to catch duplicates inside the text file itself)
     seen_in_batch = set()
+    queue = []
 
     for line in lines:
         line = line.strip()
@@ -111,22 +235,136 @@ def main():
             seen_in_batch.add(url)
 
             # CHECK 2: History (Already downloaded previously)
-            if not args.force and url in history:
+            if history is not None and url in history:
                 print(f"⏭️  Skipping (Already in history): {name}")
                 continue
-            
-            # Attempt Download
-            success = download_track(url, name, args.output, args.browser)
-            
-            # If successful, save to history immediately
-            if success:
-                update_history(url)
-                history.add(url)
-                
+
+            queue.append((url, name))
         else:
             print(f"⚠️ Skipped invalid line: {line}")
+    return queue
+
+def download_queue(queue, output_dir, pool, history, workers=4, per_host=2, retries=3, backoff=2.0,
+                   on_finished=None, tool="download", params=None, dedupe=None, on_duplicate=None):
+    """
+    Downloads every (url, name) in `queue` concurrently and returns the QueueProgress.
+
+    A bounded pool runs overall, with a cap per site so a long list from one
+    host doesn't get us rate limited. Workers take the next track whose site
+    has a free slot, so one busy site never holds up tracks from the others.
+    `on_finished(url, name, output_path)` is called from the worker as soon
+    as a track is saved; if it blocks, that worker waits before taking more.
+    With a FingerprintIndex as `dedupe`, a download of a song already in the
+    library is deleted again and recorded as the existing file, and is not
+    handed to `on_finished`; `on_duplicate(url, name, original)` hears of it instead.
+    """
+    queue = list(queue)
+    progress = QueueProgress(len(queue))
+    per_host = max(1, per_host)
+    running_per_host = collections.Counter()
+    slot_freed = threading.Condition()
+
+    def take_next():
+        with slot_freed:
+            while queue:
+                for i, (url, _) in enumerate(queue):
+                    if running_per_host[host_key(url)] < per_host:
+                        running_per_host[host_key(url)] += 1
+                        return queue.pop(i)
+                slot_freed.wait()
+            return None
+
+    def fetch(url, name):
+        """Downloads (and dedupes) one track. Returns (output_path or None, duplicate)."""
+        # Record it in history as it runs
+        history.start(url, tool, dict(params or {}, name=name, output=output_dir))
+        output_path = download_track(url, name, output_dir, pool, retries, backoff)
+        if output_path and dedupe:
+            original = find_duplicate(dedupe, output_path)
+            if original:
+                print(f"🧬 {name} is already in the library as {os.path.basename(original)}; not keeping the new copy.")
+                os.remove(output_path)
+                return original, True
+        return output_path, False
+
+    def worker():
+        while item := take_next():
+            url, name = item
+            progress.started()
+            output_path, duplicate = None, False
+            try:
+                output_path, duplicate = fetch(url, name)
+            except Exception as e:
+                # One bad track (a failed move, a locked database...) fails on
+                # its own; the worker carries on with the rest of the queue
+                print(f"❌ Failed: {name}")
+                print(f"   Error: {type(e).__name__}: {e}")
+            finally:
+                try:
+                    history.finish(url, [output_path] if output_path else None, "done" if output_path else "failed")
+                except Exception as e:
+                    print(f"   ⚠️ Could not record {name} in the download history: {e}")
+                progress.finished(bool(output_path))
+                with slot_freed:
+                    running_per_host[host_key(url)] -= 1
+                    slot_freed.notify_all()
+            callback = on_duplicate if duplicate else on_finished
+            if output_path and callback:
+                try:
+                    callback(url, name, output_path)
+                except Exception as e:
+                    print(f"   ⚠️ {name} was downloaded but could not be passed on: {e}")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for future in [executor.submit(worker) for _ in range(max(1, workers))]:
+            future.result()
+    return progress
+
+def main():
+    args = parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("❌ Error: 'ffmpeg' is not installed.")
+        return
+
+    if not os.path.exists(args.list):
+        print(f"Error: List file '{args.list}' not found.")
+        return
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    # 1. Load History
+    history = JobHistory()
+    if not args.force:
+        print(f"📚 {len(history)} completed jobs in download history.")
+    
+    print(f"Reading queue from {args.list}...")
+    if args.browser:
+        print(f"🔓 Masquerading as {args.browser}...")
+    
+    queue = read_queue(args.list, None if args.force else history)
+    if not queue:
+        print("\nNothing to download.")
+        return
+
+    try:
+        pool = DownloaderPool(args.browser, args.audio_format)
+    except DownloadError as e:
+        print(f"❌ Error: could not load cookies from '{args.browser}': {e}")
+        return
+
+    dedupe = load_dedupe_index(args.fingerprints, args.keep_duplicates)
+
+    # 2. Download concurrently
+    print(f"🚀 Downloading {len(queue)} tracks ({args.workers} at a time, max {args.per_host} per site)...")
+    try:
+        progress = download_queue(queue, args.output, pool, history, args.workers, args.per_host,
+                                  args.retries, args.backoff, params={"audio_format": args.audio_format}, dedupe=dedupe)
+    finally:
+        pool.close()
         
-    print(f"\nBatch complete.")
+    print(f"\nBatch complete: {progress.done} downloaded, {progress.failed} failed.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
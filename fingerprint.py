@@ -0,0 +1,386 @@
+import argparse
+import concurrent.futures
+import os
+import threading
+
+import numpy as np
+
+from audio_stream import stream_pcm_blocks
+
+# Built by this tool, read by process.py and download.py
+FINGERPRINT_INDEX = "fingerprints.npz"
+
+# --- SPECTRAL PEAKS ---
+# Fingerprints only need the band where melody and harmony live, so ffmpeg
+# hands us mono 8 kHz and we look at 64 ms windows every 16 ms. The windows
+# of a copy cut at another point fall up to half a hop away from the
+# original's, and a peak can move a frame with them; the short hop keeps
+# that within 8 ms.
+FP_SAMPLE_RATE = 8000
+FFT_SIZE = 512
+HOP = 128
+# A peak has to be the loudest point this many frames/bins around it
+PEAK_FRAMES = 20
+PEAK_BINS = 30
+# ...and stand this far (dB) above the block's typical level, so noise and
+# near-silence don't produce peaks
+PEAK_MIN_DB = 10.0
+# Spectrogram is computed a minute at a time, so hour-long mixes fit in memory
+BLOCK_SECONDS = 60
+
+# --- HASHES ---
+# A hash is three peaks: an anchor and two of the FAN_OUT peaks that follow
+# it (at least MIN_DT, at most MAX_DT frames later). It combines their
+# frequencies with where the middle peak falls between the outer two, as a
+# fraction of the gap. Speed-adjusted copies (atempo keeps pitch) stretch
+# every gap by the same factor, so the hashes come out the same.
+FAN_OUT = 5
+MIN_DT = 8
+MAX_DT = 128
+# Coarse steps for the ratio, and frequency bins taken in pairs, so a peak a
+# frame or a bin away from where it was (another cut, a lossy re-encode)
+# usually still gives the same hash
+RATIO_STEPS = 8
+BIN_SHIFT = 1
+# Stored with the index; hashes from another version never match these
+HASH_VERSION = 2
+
+# --- MATCHING ---
+# Share of the smaller file's hashes found in the other. Using the smaller
+# file means a chapter split matches the full mix it was cut from.
+DEFAULT_THRESHOLD = 0.05
+MIN_SHARED = 40
+# Hashes present in more files than this say nothing about any of them
+MAX_BUCKET = 50
+
+AUDIO_EXTS = (".mp3", ".m4a", ".opus", ".ogg", ".flac", ".aac", ".webm", ".wav", ".mp4")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fingerprint music folders and find duplicate songs (re-downloads, chapter splits, speed-adjusted copies).", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("folders", nargs="+", help="Folders to scan (recursively)")
+    parser.add_argument("--index", default=FINGERPRINT_INDEX, help="Fingerprint index file to create or update")
+    parser.add_argument("--workers", "-w", type=int, default=os.cpu_count() or 4, help="Files to fingerprint at the same time")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Share of the shorter file's hashes two files must have in common to count as duplicates")
+    return parser.parse_args()
+
+def spectral_peaks(samples):
+    """(frame, bin) of every spectral peak in a block of mono samples."""
+    if len(samples) < FFT_SIZE:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FFT_SIZE)[::HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE), axis=1))
+    log_spec = 20 * np.log10(spectrum + 1e-6)
+
+    # Local maxima: equal to the max of their neighbourhood (separable max filter)
+    padded = np.pad(log_spec, ((PEAK_FRAMES, PEAK_FRAMES), (0, 0)), constant_values=-np.inf)
+    local = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_FRAMES + 1, axis=0).max(axis=-1)
+    padded = np.pad(local, ((0, 0), (PEAK_BINS, PEAK_BINS)), constant_values=-np.inf)
+    local = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_BINS + 1, axis=1).max(axis=-1)
+
+    is_peak = (log_spec == local) & (log_spec > np.median(log_spec) + PEAK_MIN_DB)
+    return np.nonzero(is_peak)
+
+def peak_hashes(times, bins):
+    """Tempo-invariant triplet hashes (uint32) from peaks sorted by time."""
+    n = len(times)
+    first = np.searchsorted(times, times + MIN_DT)
+    hashes = []
+    for a in range(FAN_OUT):
+        for b in range(a + 1, FAN_OUT):
+            i, ja, jb = np.arange(n), first + a, first + b
+            ok = jb < n
+            i, ja, jb = i[ok], ja[ok], jb[ok]
+            dt1, dt2 = times[ja] - times[i], times[jb] - times[i]
+            ok = (dt2 <= MAX_DT) & (dt2 > dt1)
+            i, ja, jb, dt1, dt2 = i[ok], ja[ok], jb[ok], dt1[ok], dt2[ok]
+            ratio = (dt1 * RATIO_STEPS // dt2).astype(np.uint32)
+            # 8 bits per frequency, 3 for the ratio
+            f1, f2, f3 = ((bins[idx] >> BIN_SHIFT).astype(np.uint32) for idx in (i, ja, jb))
+            hashes.append((f1 << 19) | (f2 << 11) | (f3 << 3) | ratio)
+    return np.unique(np.concatenate(hashes)) if hashes else np.zeros(0, dtype=np.uint32)
+
+def fingerprint_file(path):
+    """The set of hashes for one file, sorted (uint32)."""
+    block_samples = BLOCK_SECONDS * FP_SAMPLE_RATE
+    # Blocks overlap so every peak is judged with its full neighbourhood: a
+    # block only keeps peaks from PEAK_FRAMES in, and stops PEAK_FRAMES (plus
+    # one window) before its end, where the next block takes over.
+    tail = (PEAK_FRAMES + 1) * HOP + FFT_SIZE
+    times, bins = [], []
+    pending = np.zeros(0, dtype=np.float32)
+    offset = 0  # frame number of pending[0]
+
+    def flush(data, offset, final):
+        t, f = spectral_peaks(data)
+        keep = t >= (PEAK_FRAMES if offset else 0)
+        if not final:
+            keep &= t < (len(data) - tail) // HOP
+        times.append(t[keep] + offset)
+        bins.append(f[keep])
+
+    for block in stream_pcm_blocks(path, FP_SAMPLE_RATE, BLOCK_SECONDS):
+        pending = np.concatenate([pending, block.astype(np.float32) / 32768])
+        if len(pending) >= block_samples + tail:
+            flush(pending, offset, final=False)
+            # Next block starts PEAK_FRAMES before the first frame it keeps
+            restart = (len(pending) - tail) // HOP - PEAK_FRAMES
+            pending = pending[restart * HOP:]
+            offset += restart
+    flush(pending, offset, final=True)
+
+    times, bins = np.concatenate(times), np.concatenate(bins)
+    order = np.lexsort((bins, times))
+    return peak_hashes(times[order], bins[order])
+
+def fingerprint_many(paths, workers=os.cpu_count() or 4):
+    """Fingerprints files over a process pool, yielding (path, hashes) as each finishes (hashes None on failure)."""
+    if not paths:
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(fingerprint_file, p): p for p in paths}
+        for n, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            p = futures[future]
+            try:
+                hashes = future.result()
+            except Exception as e:
+                print(f"   ⚠️ Could not fingerprint {os.path.basename(p)}: {e}")
+                hashes = None
+            print(f"   ⏳ Fingerprinting... [{n}/{len(paths)}]", end="\r", flush=True)
+            yield p, hashes
+    print()
+
+def scan_folders(folders):
+    paths = []
+    for folder in folders:
+        for root, _, files in os.walk(os.path.expanduser(folder)):
+            paths += [os.path.abspath(os.path.join(root, f)) for f in files if f.lower().endswith(AUDIO_EXTS)]
+    return sorted(set(paths))
+
+def union_groups(pairs, count):
+    """Connected components over (a, b) pairs; returns a group id per item (-1 if unpaired)."""
+    parent = list(range(count))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+
+    paired = {int(x) for pair in pairs for x in pair}
+    roots = {}
+    groups = np.full(count, -1, dtype=np.int32)
+    for x in sorted(paired):
+        groups[x] = roots.setdefault(find(x), len(roots))
+    return groups
+
+class FingerprintIndex:
+    """
+    Hashes for every file in the library, stored as one compressed .npz.
+
+    The index holds each file's path, size, mtime and its hashes (all files'
+    hashes in one uint32 array, sliced by per-file counts), plus the
+    duplicate group each file was last found in. Files whose size and mtime
+    haven't changed are not fingerprinted again on update.
+    """
+
+    def __init__(self, path=FINGERPRINT_INDEX):
+        self.path = path
+        self.lock = threading.Lock()
+        self.paths, self.sizes, self.mtimes, self.counts = [], np.zeros(0, np.int64), np.zeros(0), np.zeros(0, np.int64)
+        self.hashes = np.zeros(0, dtype=np.uint32)
+        self.groups = np.zeros(0, dtype=np.int32)
+        # Files fingerprinted since loading (e.g. new downloads), checked alongside the index
+        self.pending = []
+        self.lookup = None
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if "version" in data.files and int(data["version"]) == HASH_VERSION:
+                    self.paths = data["paths"].tolist()
+                    self.sizes, self.mtimes, self.counts = data["sizes"], data["mtimes"], data["counts"]
+                    self.hashes, self.groups = data["hashes"], data["groups"]
+                else:
+                    print(f"⚠️  {path} holds fingerprints from an older version of fingerprint.py; starting it over.")
+        self.file_ids = np.repeat(np.arange(len(self.paths)), self.counts)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def update(self, paths, workers=os.cpu_count() or 4):
+        """Fingerprints new or changed files among `paths` and drops files no longer present."""
+        known = {p: i for i, p in enumerate(self.paths)}
+        starts = np.concatenate([[0], np.cumsum(self.counts)])
+        entries, todo = [], []
+        for p in paths:
+            st = os.stat(p)
+            i = known.get(p)
+            if i is not None and self.sizes[i] == st.st_size and self.mtimes[i] == st.st_mtime:
+                entries.append((p, st.st_size, st.st_mtime, self.hashes[starts[i]:starts[i + 1]]))
+            else:
+                todo.append((p, st.st_size, st.st_mtime))
+
+        if todo:
+            print(f"🧬 Fingerprinting {len(todo)} new or changed files ({len(entries)} unchanged)...")
+        stats = {p: (size, mtime) for p, size, mtime in todo}
+        for p, hashes in fingerprint_many(list(stats), workers):
+            if hashes is not None:
+                entries.append((p, *stats[p], hashes))
+
+        entries.sort(key=lambda e: e[0])
+        self.set_entries(entries)
+
+    def set_entries(self, entries):
+        """Replaces the index contents with (path, size, mtime, hashes) entries."""
+        self.paths = [e[0] for e in entries]
+        self.sizes = np.array([e[1] for e in entries], dtype=np.int64)
+        self.mtimes = np.array([e[2] for e in entries], dtype=np.float64)
+        self.counts = np.array([len(e[3]) for e in entries], dtype=np.int64)
+        self.hashes = np.concatenate([e[3] for e in entries]) if entries else np.zeros(0, dtype=np.uint32)
+        self.file_ids = np.repeat(np.arange(len(self.paths)), self.counts)
+        self.groups = np.full(len(self.paths), -1, dtype=np.int32)
+        self.lookup = None
+
+    def add(self, new_entries):
+        """
+        Adds or replaces entries given as {key: hashes}. Keys are usually file
+        paths, but any string works (music_identify keys songs by title).
+        """
+        if not new_entries:
+            return
+        starts = np.concatenate([[0], np.cumsum(self.counts)])
+        entries = [(p, int(self.sizes[i]), float(self.mtimes[i]), self.hashes[starts[i]:starts[i + 1]])
+                   for i, p in enumerate(self.paths) if p not in new_entries]
+        for key, hashes in new_entries.items():
+            st = os.stat(key) if os.path.exists(key) else None
+            entries.append((key, st.st_size if st else 0, st.st_mtime if st else 0.0, hashes))
+        self.set_entries(entries)
+
+    def duplicate_pairs(self, threshold=DEFAULT_THRESHOLD):
+        """
+        (a, b, score) for every pair of files sharing enough hashes.
+
+        Sorting all hashes puts equal ones next to each other; every run of
+        equal hashes from k files adds one to the shared count of each of the
+        k*(k-1)/2 pairs among them. Runs are handled by size, all at once.
+        """
+        order = np.argsort(self.hashes, kind="stable")
+        hashes, ids = self.hashes[order], self.file_ids[order]
+        starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]]))
+        sizes = np.diff(np.concatenate([starts, [len(hashes)]]))
+
+        keys = []
+        for k in range(2, MAX_BUCKET + 1):
+            run_starts = starts[sizes == k]
+            if not len(run_starts):
+                continue
+            for x in range(k):
+                for y in range(x + 1, k):
+                    a, b = ids[run_starts + x], ids[run_starts + y]
+                    keys.append(np.minimum(a, b).astype(np.int64) * len(self.paths) + np.maximum(a, b))
+        if not keys:
+            return []
+
+        pair_keys, shared = np.unique(np.concatenate(keys), return_counts=True)
+        a, b = pair_keys // len(self.paths), pair_keys % len(self.paths)
+        smaller = np.minimum(self.counts[a], self.counts[b])
+        score = shared / np.maximum(smaller, 1)
+        ok = (shared >= MIN_SHARED) & (score >= threshold) & (a != b)
+        return list(zip(a[ok].tolist(), b[ok].tolist(), score[ok].tolist()))
+
+    def find_groups(self, threshold=DEFAULT_THRESHOLD):
+        """Groups files into duplicate sets (stored in the index) and returns them as lists of paths."""
+        pairs = self.duplicate_pairs(threshold)
+        self.groups = union_groups([(a, b) for a, b, _ in pairs], len(self.paths))
+        found = {}
+        for i, group in enumerate(self.groups.tolist()):
+            if group >= 0:
+                found.setdefault(group, []).append(self.paths[i])
+        return list(found.values())
+
+    def match(self, hashes, threshold=DEFAULT_THRESHOLD):
+        """Indexed (or pending) files that `hashes` duplicates, best first, as (path, score)."""
+        results = []
+        if len(self.paths) and len(hashes):
+            with self.lock:
+                # Sorted once, then every lookup is a binary search per hash
+                if self.lookup is None:
+                    order = np.argsort(self.hashes, kind="stable")
+                    self.lookup = (self.hashes[order], self.file_ids[order])
+            sorted_hashes, sorted_ids = self.lookup
+            lo = np.searchsorted(sorted_hashes, hashes, "left")
+            runs = np.searchsorted(sorted_hashes, hashes, "right") - lo
+            positions = np.repeat(lo - np.cumsum(runs) + runs, runs) + np.arange(runs.sum())
+            shared = np.bincount(sorted_ids[positions], minlength=len(self.paths))
+            score = shared / np.maximum(np.minimum(self.counts, len(hashes)), 1)
+            for i in np.flatnonzero((shared >= MIN_SHARED) & (score >= threshold)):
+                results.append((self.paths[i], float(score[i])))
+        with self.lock:
+            pending = list(self.pending)
+        for path, other in pending:
+            shared = len(np.intersect1d(hashes, other, assume_unique=True))
+            score = shared / max(1, min(len(hashes), len(other)))
+            if shared >= MIN_SHARED and score >= threshold:
+                results.append((path, score))
+        return sorted(results, key=lambda r: -r[1])
+
+    def check_new_file(self, path, threshold=DEFAULT_THRESHOLD):
+        """
+        Returns the existing file a new file duplicates, or None.
+        Non-duplicates are remembered, so a later file in the same batch is checked against them too.
+        """
+        hashes = fingerprint_file(path)
+        matches = [m for m in self.match(hashes, threshold) if os.path.exists(m[0]) and m[0] != os.path.abspath(path)]
+        if matches:
+            return matches[0][0]
+        with self.lock:
+            self.pending.append((os.path.abspath(path), hashes))
+        return None
+
+    def save(self):
+        """Writes the index atomically (pending files are left out until the next full scan)."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, version=HASH_VERSION, paths=np.array(self.paths, dtype=str), sizes=self.sizes,
+                                mtimes=self.mtimes, counts=self.counts, hashes=self.hashes, groups=self.groups)
+        os.replace(tmp, self.path)
+
+def load_duplicate_groups(index_path=FINGERPRINT_INDEX):
+    """Maps each file found in a duplicate group to its group number (empty if there's no index)."""
+    if not index_path or not os.path.exists(index_path):
+        return {}
+    with np.load(index_path) as data:
+        return {p: int(g) for p, g in zip(data["paths"].tolist(), data["groups"].tolist()) if g >= 0}
+
+def main():
+    args = parse_args()
+    paths = scan_folders(args.folders)
+    if not paths:
+        print("⚠️ No audio files found.")
+        return
+
+    index = FingerprintIndex(args.index)
+    index.update(paths, args.workers)
+    groups = index.find_groups(args.threshold)
+    index.save()
+    print(f"💾 {len(index)} files in {args.index}")
+
+    if not groups:
+        print("✅ No duplicates found.")
+        return
+
+    wasted = 0
+    print(f"\n🧬 {len(groups)} groups of duplicates:")
+    for n, group in enumerate(groups, 1):
+        # Keep the largest file of each group, the rest is what duplication costs
+        group.sort(key=os.path.getsize, reverse=True)
+        wasted += sum(os.path.getsize(p) for p in group[1:])
+        print(f"\n[{n}]")
+        for p in group:
+            print(f"   {p}")
+    print(f"\n{sum(len(g) - 1 for g in groups)} extra copies, {wasted / 1024 ** 2:.0f} MB.")
+
+if __name__ == "__main__":
+    main()
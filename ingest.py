@@ -0,0 +1,266 @@
+import argparse
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+from yt_dlp.utils import DownloadError
+
+from audio_stream import stream_pcm_blocks
+import download
+import music_identify
+from fingerprint import FINGERPRINT_INDEX, FingerprintIndex
+from job_history import JobHistory
+from library_index import LibraryIndex, LIBRARY_DB
+from playlist_2_file import detect_dance_type
+from process import load_config, get_dance_type
+from recognition_cache import RecognitionCache, RECOGNITION_DB
+
+# --- AUDIO ANALYSIS ---
+# Mono at this rate is plenty for levels and silence, and keeps the pipe small
+ANALYSIS_SAMPLE_RATE = 22050
+# Same window and threshold process.py uses to strip trailing silence
+SILENCE_CHUNK_MS = 50
+SILENCE_THRESHOLD_DB = -45.0
+
+# Finished items waiting for the next stage. When a stage falls behind, its
+# queue fills and the stage before it blocks, so nothing piles up unbounded.
+DEFAULT_QUEUE_SIZE = 16
+STOP = object()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download, identify, classify and analyse a list of songs into the library, each song moving on as soon as its previous step is done.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--list", "-l", default="downloads.txt", help="Path to the list file (Format: URL | Name)")
+    parser.add_argument("--output", "-o", default="input_mp3s", help="Folder to save downloads")
+    parser.add_argument("--config", "-cfg", default="dance_config.json", help="Dance config with the known dance types")
+    parser.add_argument("--index", default=LIBRARY_DB, help="Library index database to add the songs to")
+    parser.add_argument("--browser", "-b", help="Load cookies from browser (e.g. 'chrome', 'safari', 'firefox')")
+    parser.add_argument("--audio-format", choices=sorted(download.AUDIO_FORMATS), default="native", help="'native' keeps the original audio stream; 'mp3' converts everything to MP3")
+    parser.add_argument("--force", action="store_true", help="Re-ingest URLs already in the library index")
+    parser.add_argument("--fingerprints", default=FINGERPRINT_INDEX, help="Fingerprint index from fingerprint.py; songs already in it are dropped right after download")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Ingest songs even if the fingerprint index already has them")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Downloads to run at the same time")
+    parser.add_argument("--per-host", type=int, default=2, help="Max simultaneous downloads from any one site")
+    parser.add_argument("--retries", type=int, default=3, help="Retries for network errors (rate limits, timeouts, 5xx)")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Base delay (s) before a retry; doubles on each attempt")
+    parser.add_argument("--local-index", default=music_identify.LOCAL_INDEX, help="Fingerprints of songs recognised before, checked before asking Shazam (shared with music_identify.py)")
+    parser.add_argument("--recognition-cache", default=RECOGNITION_DB, help="Earlier recognition results by file content (shared with music_identify.py)")
+    parser.add_argument("--identify-workers", type=int, default=8, help="Most songrec lookups to run at the same time (fewer while it is slow or failing)")
+    parser.add_argument("--analyse-workers", type=int, default=os.cpu_count() or 4, help="Files to analyse at the same time")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Songs allowed to wait between two steps")
+    return parser.parse_args()
+
+class Stage:
+    """
+    One step of the pipeline: a pool of worker threads fed by a bounded queue.
+
+    `func(item)` returns the item for the next stage, or None to drop it.
+    Handing an item on blocks while the next stage's queue is full, which is
+    how a slow step holds back the ones before it.
+    """
+
+    def __init__(self, name, func, workers, queue_size=DEFAULT_QUEUE_SIZE, downstream=None):
+        self.name = name
+        self.func = func
+        self.downstream = downstream
+        self.inbox = queue.Queue(maxsize=max(1, queue_size))
+        self.threads = [threading.Thread(target=self.run, name=f"{name}-{i}", daemon=True)
+                        for i in range(max(1, workers))]
+        self.failed = 0
+        self.lock = threading.Lock()
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        self.inbox.put(item)
+
+    def run(self):
+        while (item := self.inbox.get()) is not STOP:
+            try:
+                result = self.func(item)
+            except Exception as e:
+                print(f"❌ {self.name} failed for {item.get('name')}: {e}")
+                with self.lock:
+                    self.failed += 1
+                continue
+            if result is not None and self.downstream:
+                self.downstream.put(result)
+
+    def close(self):
+        """Lets the queued items finish, then stops the workers."""
+        for _ in self.threads:
+            self.inbox.put(STOP)
+        for thread in self.threads:
+            thread.join()
+
+def analyse_audio(path):
+    """
+    Levels and length of a song, from one streaming decode.
+
+    Returns duration (s), peak and RMS level (dBFS) and how much silence
+    trails the music (s), measured like process.py's silence stripper.
+    """
+    chunk = ANALYSIS_SAMPLE_RATE * SILENCE_CHUNK_MS // 1000
+    threshold = (10 ** (SILENCE_THRESHOLD_DB / 20)) * 32768
+    samples = 0
+    peak = 0
+    sum_squares = 0.0
+    last_loud = 0
+    carry = np.zeros(0, dtype=np.int16)
+
+    for block in stream_pcm_blocks(path, ANALYSIS_SAMPLE_RATE):
+        if not len(block):
+            continue
+        peak = max(peak, int(np.abs(block.astype(np.int32)).max()))
+        sum_squares += float(np.square(block, dtype=np.float64).sum())
+
+        # Loudness per 50ms chunk; chunks carry over block boundaries
+        data = np.concatenate([carry, block])
+        whole = len(data) - len(data) % chunk
+        if whole:
+            rms = np.sqrt(np.square(data[:whole].reshape(-1, chunk), dtype=np.float64).mean(axis=1))
+            loud = np.nonzero(rms > threshold)[0]
+            if len(loud):
+                last_loud = samples - len(carry) + (int(loud[-1]) + 1) * chunk
+        carry = data[whole:]
+        samples += len(block)
+
+    if not samples:
+        raise ValueError("no audio decoded")
+
+    def db(value):
+        return round(20 * np.log10(value / 32768), 2) if value > 0 else None
+
+    return {
+        'duration': samples / ANALYSIS_SAMPLE_RATE,
+        'peak_db': db(peak),
+        'rms_db': db(np.sqrt(sum_squares / samples)),
+        'trailing_silence': (samples - last_loud) / ANALYSIS_SAMPLE_RATE,
+    }
+
+def classify(name, title, all_dances):
+    """Dance type from the list's name, else from what the song was recognised as."""
+    dtype = get_dance_type(name, all_dances) or (get_dance_type(title, all_dances) if title else None)
+    if not dtype:
+        guess = detect_dance_type(name, title or "")
+        dtype = guess if guess != "Unknown" else None
+    return dtype
+
+def start_stages(all_dances, index, cache, local_index, learned, cargo_path, limiter,
+                 identify_workers, analyse_workers, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Starts the identify -> classify and rename -> analyse stages.
+
+    Returns them in that order, then the list each song is appended to once
+    it is in the library `index`. Songs are fed to the first stage's `put`.
+    """
+    warned = threading.Event()
+    indexed = []
+
+    def identify(item):
+        _, output = music_identify.recognize_cached(item['path'], cargo_path, limiter, cache, local_index, learned)
+        if output == "MISSING_SONGREC":
+            if not warned.is_set():
+                warned.set()
+                print("   ⚠️ 'songrec' CLI not found, keeping list names. (Install via: brew install rust && cargo install songrec)")
+            output = None
+        elif output == music_identify.RECOGNITION_FAILED:
+            output = None
+        return dict(item, title=output)
+
+    def classify_and_rename(item):
+        # A single worker, so two songs never race for the same new filename
+        dtype = classify(item['name'], item['title'], all_dances)
+        path = item['path']
+        if item['title']:
+            path = music_identify.rename_identified(path, item['title'], dtype, rename=cache.rename)
+        return dict(item, path=path, dance_type=dtype)
+
+    def analyse(item):
+        entry = dict(item, **analyse_audio(item['path']))
+        index.add(entry)
+        indexed.append(entry)
+        print(f"   📚 Indexed [{entry['dance_type'] or '?'}] {os.path.basename(entry['path'])} "
+              f"({entry['duration'] / 60:.0f}:{entry['duration'] % 60:02.0f}, peak {entry['peak_db']} dB)")
+
+    analyser = Stage("Analysis", analyse, analyse_workers, queue_size)
+    classifier = Stage("Classification", classify_and_rename, 1, queue_size, analyser)
+    identifier = Stage("Identification", identify, identify_workers, queue_size, classifier)
+    return identifier, classifier, analyser, indexed
+
+def main():
+    args = parse_args()
+
+    if not shutil.which("ffmpeg"):
+        print("❌ Error: 'ffmpeg' is not installed.")
+        return
+
+    if not os.path.exists(args.list):
+        print(f"Error: List file '{args.list}' not found.")
+        return
+
+    os.makedirs(args.output, exist_ok=True)
+    all_dances = list(load_config(args.config).keys())
+    history = JobHistory()
+    index = LibraryIndex(args.index)
+    print(f"📚 {len(index)} songs in the library index.")
+
+    # Songs already indexed are done; anything downloaded but never indexed
+    # (an interrupted run) goes through again, straight from the cache.
+    print(f"Reading queue from {args.list}...")
+    work = download.read_queue(args.list, None if args.force else index)
+    if not work:
+        print("\nNothing to ingest.")
+        return
+
+    try:
+        pool = download.DownloaderPool(args.browser, args.audio_format)
+    except DownloadError as e:
+        print(f"❌ Error: could not load cookies from '{args.browser}': {e}")
+        return
+
+    dedupe = download.load_dedupe_index(args.fingerprints, args.keep_duplicates)
+    # Identification goes through music_identify's cache and local index, so
+    # a song either tool has recognised before costs no songrec call here
+    cache = RecognitionCache(args.recognition_cache)
+    if (resumed := cache.recover()):
+        print(f"↩️  Completed {resumed} renames left over from an interrupted run.")
+    local_index = FingerprintIndex(args.local_index)
+    learned = {}
+    cargo_path = os.path.expanduser("~/.cargo/bin/songrec")
+    limiter = music_identify.AdaptiveLimiter(maximum=args.identify_workers)
+    identifier, classifier, analyser, indexed = start_stages(
+        all_dances, index, cache, local_index, learned, cargo_path, limiter,
+        args.identify_workers, args.analyse_workers, args.queue_size)
+
+    def downloaded(url, name, path):
+        identifier.put({'url': url, 'name': name, 'path': path})
+
+    def duplicate(url, name, original):
+        # Recorded, so the next run skips this URL instead of downloading it again
+        index.add_duplicate(url, name, original)
+
+    started = time.time()
+    print(f"🚀 Ingesting {len(work)} tracks ({args.workers} downloads at a time, max {args.per_host} per site)...")
+    try:
+        progress = download.download_queue(work, args.output, pool, history, args.workers, args.per_host,
+                                           args.retries, args.backoff, on_finished=downloaded,
+                                           params={"audio_format": args.audio_format}, dedupe=dedupe,
+                                           on_duplicate=duplicate)
+    finally:
+        pool.close()
+        for stage in (identifier, classifier, analyser):
+            stage.close()
+
+    if learned:
+        local_index.add(learned)
+        local_index.save()
+        print(f"💾 Remembered {len(learned)} new songs in {args.local_index}")
+
+    failed = progress.failed + sum(stage.failed for stage in (identifier, classifier, analyser))
+    print(f"\nIngest complete in {time.time() - started:.0f}s: {len(indexed)} songs indexed, {failed} failed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+
+from sqlite_store import SQLiteStore
+
+# Shared by download.py, video_splitter.py and split_manual.py
+HISTORY_DB = "download_history.db"
+# The old append-only list of job ids, imported on first use
+LEGACY_HISTORY_FILE = "download_history.log"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    tool        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    params      TEXT,
+    outputs     TEXT,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_tool ON jobs (tool, finished_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def tool_for_legacy_id(job_id):
+    """Old log lines were bare URLs (download.py) or 'tool|...' ids from the splitters."""
+    tool = job_id.split("|", 1)[0]
+    return tool if tool in ("video_splitter", "split_manual") else "download"
+
+class JobHistory(SQLiteStore):
+    """
+    Record of every job the tools have run, in SQLite.
+
+    Membership is an indexed primary-key lookup, so checking a job costs the
+    same whether the history holds ten entries or a million, and nothing is
+    loaded up front.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path=HISTORY_DB, legacy_log=LEGACY_HISTORY_FILE):
+        super().__init__(path)
+        self.migrate_legacy_log(legacy_log)
+
+    def migrate_legacy_log(self, legacy_log):
+        """
+        Imports job ids from the old download_history.log as finished jobs.
+
+        Re-imports only when the log has changed since the last import (an
+        older copy of a tool may still be appending to it); ids already
+        present are left alone.
+        """
+        if not legacy_log or not os.path.exists(legacy_log):
+            return
+        stat = os.stat(legacy_log)
+        stamp = f"{stat.st_size}:{stat.st_mtime}"
+
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'legacy_log'").fetchone()
+            if row and row[0] == stamp:
+                return
+            with open(legacy_log, 'r', encoding='utf-8') as f:
+                ids = {line.strip() for line in f if line.strip()}
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO jobs (job_id, tool, status, finished_at) VALUES (?, ?, 'done', ?)",
+                    [(job_id, tool_for_legacy_id(job_id), stat.st_mtime) for job_id in ids])
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_log', ?)", (stamp,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        print(f"📦 Imported {len(ids)} entries from {legacy_log} into {self.path}")
+
+    def __contains__(self, job_id):
+        """True if the job has completed successfully before."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM jobs WHERE job_id = ? AND status = 'done'", (job_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'done'").fetchone()[0]
+
+    def start(self, job_id, tool, params=None):
+        """Marks a job as running (re-running a job resets its outputs and timing)."""
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO jobs (job_id, tool, status, params, started_at)
+                   VALUES (?, ?, 'running', ?, ?)
+                   ON CONFLICT (job_id) DO UPDATE SET
+                       tool = excluded.tool, status = 'running', params = excluded.params,
+                       outputs = NULL, started_at = excluded.started_at, finished_at = NULL""",
+                (job_id, tool, json.dumps(params or {}), time.time()))
+
+    def finish(self, job_id, outputs=None, status="done"):
+        """Records how a started job ended ('done' or 'failed') and what it produced."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, outputs = ?, finished_at = ? WHERE job_id = ?",
+                (status, json.dumps(outputs or []), time.time(), job_id))
+
+    def get(self, job_id):
+        """Returns everything recorded about a job as a dict, or None."""
+        with self.lock:
+            cur = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([c[0] for c in cur.description], row))
+        for key in ("params", "outputs"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
@@ -0,0 +1,83 @@
+import time
+
+from sqlite_store import SQLiteStore
+
+# Written by ingest.py: one row per song file in the library
+LIBRARY_DB = "library.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path             TEXT PRIMARY KEY,
+    url              TEXT,
+    name             TEXT,
+    title            TEXT,
+    dance_type       TEXT,
+    duration         REAL,
+    peak_db          REAL,
+    rms_db           REAL,
+    trailing_silence REAL,
+    indexed_at       REAL
+);
+CREATE INDEX IF NOT EXISTS entries_url ON entries (url);
+CREATE INDEX IF NOT EXISTS entries_dance_type ON entries (dance_type);
+CREATE TABLE IF NOT EXISTS duplicates (
+    url         TEXT PRIMARY KEY,
+    name        TEXT,
+    path        TEXT,
+    recorded_at REAL
+);
+"""
+COLUMNS = ("path", "url", "name", "title", "dance_type", "duration", "peak_db", "rms_db", "trailing_silence")
+
+class LibraryIndex(SQLiteStore):
+    """
+    Songs in the library with what we know about them: where they came from,
+    what they were recognised as, their dance type and their audio analysis.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path=LIBRARY_DB):
+        super().__init__(path)
+
+    def __contains__(self, url):
+        """True if a song from this URL is already in the library (or was found to duplicate one)."""
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM entries WHERE url = ? UNION ALL "
+                                    "SELECT 1 FROM duplicates WHERE url = ?", (url, url)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def add(self, entry):
+        """Adds or replaces the entry for entry['path']; missing fields are stored as NULL."""
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO entries ({', '.join(COLUMNS)}, indexed_at) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))}, ?)",
+                [entry.get(c) for c in COLUMNS] + [time.time()])
+
+    def add_duplicate(self, url, name, path):
+        """Records that the song at `url` is already in the library as `path`, so it isn't fetched again."""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO duplicates (url, name, path, recorded_at) VALUES (?, ?, ?, ?)",
+                              (url, name, path, time.time()))
+
+    def get(self, path):
+        """Returns the entry for a file as a dict, or None."""
+        with self.lock:
+            cur = self.conn.execute("SELECT * FROM entries WHERE path = ?", (path,))
+            row = cur.fetchone()
+            return dict(zip([c[0] for c in cur.description], row)) if row else None
+
+    def entries(self, dance_type=None):
+        """All entries (or one dance type's), oldest first."""
+        sql, params = "SELECT * FROM entries", ()
+        if dance_type:
+            sql, params = sql + " WHERE dance_type = ?", (dance_type,)
+        with self.lock:
+            cur = self.conn.execute(sql + " ORDER BY indexed_at", params)
+            names = [c[0] for c in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
@@ -0,0 +1,197 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import subprocess
+import sys
+import time
+
+from batch_runner import expand_sources, is_up_to_date
+from source_cache import CACHE_DIR
+from sqlite_store import SQLiteStore
+from volume_adjuster import apply_gain
+
+# Written by loudness_matcher.py
+LOUDNESS_DB = os.path.join(CACHE_DIR, "loudness_cache.db")
+# Streaming services play back around -14 LUFS; dance tracks mastered louder get turned down
+DEFAULT_TARGET_LUFS = -14.0
+# Gain is capped so no track's true peak goes above this (dBTP) and clips
+DEFAULT_MAX_PEAK = -1.0
+# Tracks already this close to the target (dB) are left alone
+DEFAULT_TOLERANCE = 0.5
+# Measuring and re-encoding are CPU-bound, one ffmpeg per file, so one per core
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loudness (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER,
+    mtime       REAL,
+    integrated  REAL,
+    true_peak   REAL,
+    lra         REAL,
+    measured_at REAL
+);
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Match the loudness of a folder of songs: measures each one's integrated loudness (EBU R128) and writes a copy turned up or down to the target.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--source", required=True, nargs="+", help="Audio or video files, folders or globs (e.g. 'input_mp3s_m4as/Rumba*')")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_LUFS, help="Loudness to bring every song to (LUFS)")
+    parser.add_argument("--max-peak", type=float, default=DEFAULT_MAX_PEAK, help="Highest true peak allowed after the gain (dBTP); quiet songs with loud peaks are raised less")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Songs within this many dB of the target are left as they are")
+    parser.add_argument("--measure-only", action="store_true", help="Only measure and print the loudness of each song")
+    parser.add_argument("--cache", default=LOUDNESS_DB, help="Where measurements are kept between runs")
+    parser.add_argument("--workers", "-w", type=int, default=DEFAULT_WORKERS, help="Files to measure or encode at the same time")
+    parser.add_argument("--force", action="store_true", help="Redo files whose output already exists and is newer than the source")
+    return parser.parse_args()
+
+class LoudnessCache(SQLiteStore):
+    """
+    Loudness measurements by path, valid while the file's size and mtime are
+    unchanged, so only new or changed songs are decoded on a rerun.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path=LOUDNESS_DB):
+        super().__init__(path)
+
+    def get(self, path, st):
+        """Returns the stored measurement dict, or None if it's missing or stale."""
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, integrated, true_peak, lra FROM loudness WHERE path = ?",
+                                    (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return {'integrated': row[2], 'true_peak': row[3], 'lra': row[4]}
+        return None
+
+    def put(self, path, st, measurement):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO loudness (path, size, mtime, integrated, true_peak, lra, measured_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, measurement['integrated'], measurement['true_peak'],
+                 measurement['lra'], time.time()))
+
+def measure_loudness(path):
+    """
+    Integrated loudness (LUFS), true peak (dBTP) and loudness range (LU) of
+    the file's audio, from one decode through ffmpeg's loudnorm analysis.
+    """
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-vn",
+           "-af", "loudnorm=print_format=json", "-f", "null", "-"]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    # The report is the last JSON object ffmpeg prints
+    report = json.loads(result.stderr[result.stderr.rindex("{"):result.stderr.rindex("}") + 1])
+    integrated = float(report["input_i"])
+    if integrated == float("-inf"):
+        raise ValueError("no audio above the silence gate")
+    return {'integrated': integrated, 'true_peak': float(report["input_tp"]), 'lra': float(report["input_lra"])}
+
+def measure_many(paths, cache, workers=DEFAULT_WORKERS):
+    """
+    Measures every file, using cached measurements where the file hasn't
+    changed. Returns {path: measurement dict, or the exception that stopped it}.
+    """
+    def measure(path):
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        measurement = cache.get(key, st)
+        if measurement is None:
+            measurement = measure_loudness(path)
+            cache.put(key, st, measurement)
+        return measurement
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(measure, path): path for path in paths}
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                results[path] = future.result()
+            except (subprocess.CalledProcessError, ValueError, OSError) as e:
+                results[path] = e
+            print(f"   ⏳ Measuring... [{len(results)}/{len(paths)}]", end="\r", flush=True)
+    print()
+    return results
+
+def gain_for(measurement, target, max_peak):
+    """
+    dB to add to reach `target`, held back so the true peak stays at or below
+    `max_peak`. A song quieter than the target is never turned down: if it
+    already peaks above `max_peak`, it is left as it is.
+    """
+    wanted = target - measurement['integrated']
+    gain = min(wanted, max_peak - measurement['true_peak'])
+    return max(gain, 0.0) if wanted > 0 else gain
+
+def output_path_for(source_path, target):
+    # Example: "song.mp3" -> "song_-14LUFS.mp3"
+    name, ext = os.path.splitext(source_path)
+    return f"{name}_{target:g}LUFS{ext}"
+
+def main():
+    args = parse_args()
+
+    sources = expand_sources(args.source)
+    if not sources:
+        print("❌ Error: No audio or video files found.")
+        sys.exit(1)
+
+    # 1. Measure everything (cached between runs)
+    cache = LoudnessCache(args.cache)
+    print(f"📏 Measuring loudness of {len(sources)} files ({args.workers} at a time)...")
+    measurements = measure_many(sources, cache, args.workers)
+    cache.close()
+
+    # 2. Work out each file's gain
+    todo = []
+    failed = unchanged = skipped = 0
+    for source in sources:
+        name = os.path.basename(source)
+        measurement = measurements[source]
+        if isinstance(measurement, Exception):
+            print(f"   ❌ {name}: could not measure ({measurement})")
+            failed += 1
+            continue
+        gain = gain_for(measurement, args.target, args.max_peak)
+        print(f"   {measurement['integrated']:6.1f} LUFS  peak {measurement['true_peak']:5.1f} dBTP  "
+              f"-> {gain:+5.1f} dB  {name}")
+        if gain == 0 and measurement['integrated'] < args.target - args.tolerance:
+            print(f"      ⚠️ Quieter than {args.target:g} LUFS but already peaks above {args.max_peak:g} dBTP; left as it is.")
+        if args.measure_only:
+            continue
+        output_path = output_path_for(source, args.target)
+        if abs(gain) < args.tolerance:
+            unchanged += 1
+        elif not args.force and is_up_to_date(source, output_path):
+            skipped += 1
+        else:
+            todo.append((source, output_path, round(gain, 2)))
+
+    if args.measure_only:
+        return
+
+    # 3. One encode per file that needs a change
+    if todo:
+        print(f"\n🔊 Adjusting {len(todo)} files ({args.workers} at a time)...")
+    done = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(apply_gain, *job): job for job in todo}
+        for future in concurrent.futures.as_completed(futures):
+            source, output_path, gain = futures[future]
+            try:
+                future.result()
+                done += 1
+                print(f"   ✅ {os.path.basename(source)} -> {os.path.basename(output_path)} ({gain:+.1f} dB)")
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                failed += 1
+                print(f"   ❌ {os.path.basename(source)}: {e}")
+
+    print(f"\nLoudness matching complete: {done} adjusted, {unchanged} already within {args.tolerance:g} dB "
+          f"of {args.target:g} LUFS, {skipped} up to date, {failed} failed.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import concurrent.futures
+import json
+import os
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from fractions import Fraction
+
+from source_cache import CACHE_DIR
+from sqlite_store import SQLiteStore
+
+# Shared by every tool that needs to know what a media file holds
+PROBE_DB = os.path.join(CACHE_DIR, "probe_cache.db")
+# ffprobe mostly waits on disk, so a batch can run more of them than there are cores
+DEFAULT_PROBE_WORKERS = 8
+# Comment tag on the track MP4s process.py renders: their picture is a single
+# still frame, so tools can rebuild it instead of re-encoding it
+STILL_COVER_COMMENT = "party-music-processor: still cover"
+# Audio codecs that can be stream-copied into a standard audio-only file,
+# with that file's extension and muxer
+NATIVE_AUDIO_CONTAINERS = {
+    "aac": ".m4a",
+    "opus": ".opus",
+    "vorbis": ".ogg",
+    "mp3": ".mp3",
+    "flac": ".flac",
+}
+AUDIO_MUXERS = {".m4a": "ipod", ".opus": "opus", ".ogg": "ogg", ".mp3": "mp3", ".flac": "flac"}
+# Containers whose movie header (moov/mvhd) mp4_duration can read directly
+MP4_EXTS = (".mp4", ".m4a", ".m4v", ".mov")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER,
+    mtime     REAL,
+    result    TEXT,
+    probed_at REAL
+);
+"""
+
+@dataclass(frozen=True)
+class Stream:
+    index: int
+    codec_type: str
+    codec_name: str | None
+    # Cover art embedded in an MP3/M4A is a video stream with this flag set
+    attached_pic: bool = False
+    sample_rate: int = 0
+    channels: int = 0
+    width: int = 0
+    height: int = 0
+    pix_fmt: str | None = None
+    duration: float = 0.0
+    # As ffprobe names them: profile "High", level 41 (i.e. 4.1), frame rate "30000/1001", time base "1/15360"
+    profile: str | None = None
+    level: int = 0
+    frame_rate: str | None = None
+    time_base: str | None = None
+
+@dataclass(frozen=True)
+class MediaInfo:
+    path: str
+    duration: float
+    format_name: str | None
+    streams: list[Stream] = field(default_factory=list)
+    # Container tags (title, comment...), keys lower-cased
+    tags: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def audio_streams(self):
+        return [s for s in self.streams if s.codec_type == "audio"]
+
+    @property
+    def video_streams(self):
+        """Real picture streams, leaving out embedded cover art."""
+        return [s for s in self.streams if s.codec_type == "video" and not s.attached_pic]
+
+    @property
+    def has_audio(self):
+        return bool(self.audio_streams)
+
+    @property
+    def has_video(self):
+        return bool(self.video_streams)
+
+    @property
+    def audio(self):
+        """First audio stream, or None."""
+        return next(iter(self.audio_streams), None)
+
+    @property
+    def video(self):
+        """First (non cover art) video stream, or None."""
+        return next(iter(self.video_streams), None)
+
+def number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return kind(0)
+
+def parse_probe(path, data):
+    """MediaInfo from ffprobe's JSON output."""
+    streams = [
+        Stream(
+            index=number(s.get("index"), int),
+            codec_type=s.get("codec_type", ""),
+            codec_name=s.get("codec_name"),
+            attached_pic=bool(s.get("disposition", {}).get("attached_pic")),
+            sample_rate=number(s.get("sample_rate"), int),
+            channels=number(s.get("channels"), int),
+            width=number(s.get("width"), int),
+            height=number(s.get("height"), int),
+            pix_fmt=s.get("pix_fmt"),
+            duration=number(s.get("duration")),
+            profile=s.get("profile"),
+            level=max(number(s.get("level"), int), 0),
+            frame_rate=s.get("r_frame_rate") if s.get("r_frame_rate") not in (None, "0/0") else None,
+            time_base=s.get("time_base"),
+        )
+        for s in data.get("streams", [])
+    ]
+    fmt = data.get("format", {})
+    # Some containers only time their streams
+    duration = number(fmt.get("duration")) or max((s.duration for s in streams), default=0.0)
+    tags = {k.lower(): v for k, v in fmt.get("tags", {}).items()}
+    return MediaInfo(path=path, duration=duration, format_name=fmt.get("format_name"), streams=streams, tags=tags)
+
+def run_ffprobe(path):
+    """ffprobe's JSON description of the file, or None if it can't be read (or there is no ffprobe)."""
+    cmd = ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        return None
+
+class ProbeCache(SQLiteStore):
+    """
+    ffprobe results by path, valid while the file's size and mtime are
+    unchanged, so a file is probed once however many tools (or reruns) ask.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path=PROBE_DB):
+        super().__init__(path)
+
+    def get(self, path, st):
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, result FROM probes WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return json.loads(row[2])
+        return None
+
+    def put(self, path, st, data):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO probes (path, size, mtime, result, probed_at) VALUES (?, ?, ?, ?, ?)",
+                              (path, st.st_size, st.st_mtime, json.dumps(data), time.time()))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def default_cache():
+    """The process's shared ProbeCache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProbeCache()
+        return _cache
+
+def probe(path, cache=True):
+    """
+    What a media file holds, as a MediaInfo, or None if ffprobe can't read it.
+
+    One ffprobe call gives the streams, their codecs and dispositions and the
+    duration. Pass cache=False to skip the cache, or a ProbeCache to use
+    another one.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    key = os.path.abspath(path)
+    if cache is True:
+        cache = default_cache()
+
+    data = cache.get(key, st) if cache else None
+    if data is None:
+        data = run_ffprobe(path)
+        if data is None:
+            return None
+        if cache:
+            cache.put(key, st, data)
+    return parse_probe(path, data)
+
+def probe_many(paths, workers=DEFAULT_PROBE_WORKERS, cache=True):
+    """Probes many files at once. Returns {path: MediaInfo or None}, in the order given."""
+    paths = list(paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(zip(paths, executor.map(lambda p: probe(p, cache), paths)))
+
+def probe_duration(path):
+    """Duration in seconds, 0.0 if unknown."""
+    info = probe(path)
+    return info.duration if info else 0.0
+
+def mp4_duration(path):
+    """
+    Exact duration of an MP4/MOV as a Fraction of seconds, read from the movie
+    header (moov/mvhd) without decoding or starting ffprobe. None if the file
+    isn't one, or the header doesn't give a duration (fragmented MP4s).
+    """
+    try:
+        with open(path, "rb") as f:
+            end = os.fstat(f.fileno()).st_size
+            # Top-level boxes are skipped by their size, so a moov at the end
+            # of the file (no faststart) costs a seek, not a read through the media
+            pos = 0
+            while pos + 8 <= end:
+                f.seek(pos)
+                size, kind = struct.unpack(">I4s", f.read(8))
+                header = 8
+                if size == 1:
+                    size = struct.unpack(">Q", f.read(8))[0]
+                    header = 16
+                elif size == 0:
+                    size = end - pos
+                if size < header:
+                    return None
+                if kind == b"moov":
+                    return _mvhd_duration(f, pos + header, pos + size)
+                pos += size
+    except (OSError, struct.error):
+        return None
+    return None
+
+def _mvhd_duration(f, pos, end):
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        if size < 8:
+            return None
+        if kind == b"mvhd":
+            version = f.read(4)[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                unknown = 0xFFFFFFFFFFFFFFFF
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                unknown = 0xFFFFFFFF
+            if not timescale or not duration or duration == unknown:
+                return None
+            return Fraction(duration, timescale)
+        pos += size
+    return None
+
+def exact_duration(path):
+    """
+    Duration as a Fraction of seconds: from the MP4 header where there is
+    one, otherwise from ffprobe (exact to the microseconds it prints).
+    0 if unknown.
+    """
+    if path.lower().endswith(MP4_EXTS):
+        duration = mp4_duration(path)
+        if duration is not None:
+            return duration
+    return Fraction(str(probe_duration(path)))
+
+def exact_durations(paths, workers=DEFAULT_PROBE_WORKERS):
+    """exact_duration of many files at once. Returns {path: Fraction}, in the order given."""
+    paths = list(paths)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(zip(paths, executor.map(exact_duration, paths)))
@@ -3,16 +3,115 @@ import os
 import subprocess
 import re
 import concurrent.futures
+import contextlib
+import tempfile
+import threading
+import time
 
-def recognize_single(file_path, cargo_path):
+from fingerprint import FingerprintIndex, fingerprint_file, fingerprint_many
+from media_probe import probe_duration
+from recognition_cache import RecognitionCache, RECOGNITION_DB
+
+# Songs recognised before, fingerprinted and keyed by title, so a file we've
+# already seen (under any name) is recognised locally and offline instead of
+# by another songrec call.
+LOCAL_INDEX = "recognition_index.npz"
+# Share of the file's hashes that must match a known song. The same recording
+# (re-encoded, renamed, cut shorter) clears this easily.
+LOCAL_MATCH_THRESHOLD = 0.1
+
+SUPPORTED_EXTS = ('.mp3', '.m4a', '.opus', '.ogg', '.flac', '.aac', '.webm', '.wav', '.mp4')
+# songrec timed out or errored: unlike "not recognised", this says nothing about the song
+RECOGNITION_FAILED = "RECOGNITION_FAILED"
+# From recognize_single only: songrec ran out of time, so the service may be
+# overloaded and a retry can help. recognize_file reports it as RECOGNITION_FAILED.
+RECOGNITION_TIMED_OUT = "RECOGNITION_TIMED_OUT"
+
+# --- EXCERPTS ---
+# songrec decodes whatever it's given, so an hour-long mix costs an hour of
+# decoding. Instead it gets a few seconds cut out by ffmpeg (seeking on the
+# input side, so only that bit is read), mono at the rate songrec resamples to.
+EXCERPT_SECONDS = 12
+EXCERPT_SAMPLE_RATE = 16000
+# Where to listen, as a share of the file: past the intro first, then later
+# on, then near the start. The next offset is tried only if an excerpt isn't recognised.
+EXCERPT_OFFSETS = (0.35, 0.65, 0.15)
+# Shorter files are sent whole
+WHOLE_FILE_SECONDS = 60
+
+# --- ADAPTIVE SCHEDULING ---
+# Lookups in flight start here and grow while songrec answers, halving on
+# each timeout or error (additive increase, multiplicative decrease).
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# The timeout follows observed latency (smoothed mean + 4x its deviation,
+# as TCP does for retransmits), within these bounds.
+INITIAL_TIMEOUT = 20.0
+MIN_TIMEOUT = 8.0
+MAX_TIMEOUT = 90.0
+# A timed-out excerpt is retried this many times, each with double the timeout.
+# Other errors (a crash, a file songrec can't read) aren't retried.
+TIMEOUT_RETRIES = 2
+
+class AdaptiveLimiter:
+    """Concurrency limit and timeout for songrec calls that adapt to how the service is responding."""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.active = 0
+        self.srtt = None
+        self.rttvar = 0.0
+        self.cond = threading.Condition()
+
+    @property
+    def timeout(self):
+        with self.cond:
+            if self.srtt is None:
+                return INITIAL_TIMEOUT
+            return min(MAX_TIMEOUT, max(MIN_TIMEOUT, self.srtt + 4 * self.rttvar))
+
+    @contextlib.contextmanager
+    def slot(self):
+        with self.cond:
+            while self.active >= int(self.limit):
+                self.cond.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active -= 1
+                self.cond.notify_all()
+
+    def succeeded(self, latency):
+        with self.cond:
+            if self.srtt is None:
+                self.srtt, self.rttvar = latency, latency / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - latency)
+                self.srtt = 0.875 * self.srtt + 0.125 * latency
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def failed(self):
+        with self.cond:
+            self.limit = max(1.0, self.limit / 2)
+
+def extract_excerpt(file_path, offset, output_path):
+    cmd = ["ffmpeg", "-y", "-v", "error", "-ss", f"{offset:.2f}", "-t", str(EXCERPT_SECONDS),
+           "-i", file_path, "-vn", "-ac", "1", "-ar", str(EXCERPT_SAMPLE_RATE), output_path]
+    return subprocess.run(cmd).returncode == 0 and os.path.getsize(output_path) > 0
+
+def recognize_single(file_path, cargo_path, timeout=INITIAL_TIMEOUT):
     """Helper function to run songrec on a single file."""
     try:
         try:
             cmd = ["songrec", "recognize", file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=20)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
         except FileNotFoundError:
             cmd = [cargo_path, "recognize", file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=20)
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
             
         if result.returncode == 0 and result.stdout.strip():
             output = result.stdout.strip()
@@ -20,33 +119,124 @@ def recognize_single(file_path, cargo_path):
                 return file_path, None
             else:
                 return file_path, output
-        else:
+        elif result.returncode == 0:
             return file_path, None
+        else:
+            return file_path, RECOGNITION_FAILED
     except FileNotFoundError:
         return file_path, "MISSING_SONGREC"
     except subprocess.TimeoutExpired:
-        return file_path, None
+        return file_path, RECOGNITION_TIMED_OUT
     except Exception:
-        return file_path, None
+        return file_path, RECOGNITION_FAILED
+
+def recognize_file(file_path, cargo_path, limiter):
+    """
+    Recognises one file from short excerpts, trying the next offset when an
+    excerpt isn't recognised (or songrec errors on it) and retrying with a
+    longer timeout when songrec times out. Only timeouts slow the limiter
+    down. Returns (file_path, output) like recognize_single, with a timeout
+    reported as RECOGNITION_FAILED.
+    """
+    duration = probe_duration(file_path)
+    offsets = [duration * share for share in EXCERPT_OFFSETS] if duration > WHOLE_FILE_SECONDS else [None]
+    unrecognised = False
+
+    with tempfile.TemporaryDirectory(prefix="songrec_") as tmp:
+        for offset in offsets:
+            target = file_path
+            if offset is not None:
+                target = os.path.join(tmp, f"excerpt_{int(offset)}.wav")
+                if not extract_excerpt(file_path, offset, target):
+                    target = file_path
+
+            timeout = limiter.timeout
+            for _ in range(TIMEOUT_RETRIES + 1):
+                with limiter.slot():
+                    started = time.monotonic()
+                    _, output = recognize_single(target, cargo_path, timeout)
+                if output == RECOGNITION_TIMED_OUT:
+                    limiter.failed()
+                    timeout = min(MAX_TIMEOUT, timeout * 2)
+                    continue
+                if output not in ("MISSING_SONGREC", RECOGNITION_FAILED):
+                    limiter.succeeded(time.monotonic() - started)
+                break
+            if output == RECOGNITION_TIMED_OUT:
+                output = RECOGNITION_FAILED
 
-def recognize_batch(files):
-    """Uses the 'songrec' CLI tool to identify audio concurrently."""
+            if output == "MISSING_SONGREC" or (output and output != RECOGNITION_FAILED):
+                return file_path, output
+            unrecognised = unrecognised or output is None
+
+    # One clear "not recognised" beats a timeout or error: it says something about the song
+    return file_path, None if unrecognised else RECOGNITION_FAILED
+
+def try_fingerprint(file_path):
+    """fingerprint_file, or None (with a warning) if the file can't be decoded."""
+    try:
+        return fingerprint_file(file_path)
+    except Exception as e:
+        print(f"   ⚠️ Could not fingerprint {os.path.basename(file_path)}: {e}")
+        return None
+
+def recognize_cached(file_path, cargo_path, limiter, cache, index=None, learned=None):
+    """
+    One file through the steps identify_music takes for a folder: the
+    recognition cache, then the local index, then songrec. Answers are
+    cached (timeouts and errors aren't, so they're asked again next time),
+    and songs songrec recognises are fingerprinted into `learned` for the
+    caller to add to the local index. Returns (file_path, output) like recognize_file.
+    """
+    digest = cache.content_hash(file_path)
+    known, title = cache.lookup(digest)
+    if known:
+        return file_path, title
+
+    hashes = None
+    if index is not None and len(index):
+        hashes = try_fingerprint(file_path)
+        matches = index.match(hashes, LOCAL_MATCH_THRESHOLD) if hashes is not None else []
+        if matches:
+            cache.store(digest, matches[0][0])
+            return file_path, matches[0][0]
+
+    _, output = recognize_file(file_path, cargo_path, limiter)
+    if output in (RECOGNITION_FAILED, "MISSING_SONGREC"):
+        return file_path, output
+    cache.store(digest, output)
+    if output and learned is not None:
+        if hashes is None:
+            hashes = try_fingerprint(file_path)
+        if hashes is not None:
+            learned[output] = hashes
+    return file_path, output
+
+def recognize_batch(files, on_result=None):
+    """
+    Uses the 'songrec' CLI tool to identify audio concurrently.
+    `on_result(file_path, output)` is called as each file's answer arrives.
+    """
     results = {}
     
     cargo_path = os.path.expanduser("~/.cargo/bin/songrec")
+    limiter = AdaptiveLimiter()
     
     total = len(files)
     
-    # Use up to 8 simultaneous threads to process network requests in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
-        future_to_file = {executor.submit(recognize_single, fp, cargo_path): fp for fp in files}
+    # Enough threads for the highest concurrency; the limiter decides how many run
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        future_to_file = {executor.submit(recognize_file, fp, cargo_path, limiter): fp for fp in files}
         
         for future in concurrent.futures.as_completed(future_to_file):
             file_path, output = future.result()
             if output == "MISSING_SONGREC":
+                executor.shutdown(cancel_futures=True)
                 return "MISSING_SONGREC"
             results[file_path] = output
-            print(f"   ⏳ Analyzing... [{len(results)}/{total}]", end="\r", flush=True)
+            if on_result:
+                on_result(file_path, output)
+            print(f"   ⏳ Analyzing... [{len(results)}/{total}] ({limiter.active} in flight, limit {int(limiter.limit)})", end="\r", flush=True)
             
     print() # Add a newline when complete so the following prints start fresh
     return results
@@ -55,66 +245,191 @@ def sanitize_filename(name):
     """Removes illegal characters from filenames."""
     return re.sub(r'[\\/*?:"<>|]', "", name).strip()
 
-def get_unique_filename(directory, filename):
-    """Ensures we don't overwrite existing files."""
+def get_unique_filename(directory, filename, current=None):
+    """Ensures we don't overwrite existing files (other than `current`, the file being renamed)."""
     base, ext = os.path.splitext(filename)
     counter = 1
     new_filename = filename
-    while os.path.exists(os.path.join(directory, new_filename)):
+    while new_filename != current and os.path.exists(os.path.join(directory, new_filename)):
         new_filename = f"{base}_{counter}{ext}"
         counter += 1
     return new_filename
 
-def identify_music(folder, prefix=None):
+def rename_identified(file_path, song_info, prefix=None, rename=os.rename):
+    """
+    Renames a file after its recognition result (or just prefixes it). Returns the new path.
+    A file that already has its name (from an earlier run) is left alone.
+    """
+    directory, filename = os.path.split(file_path)
+    ext = os.path.splitext(filename)[1]
+    
+    if song_info:
+        clean_song_info = sanitize_filename(song_info).replace(' ', '_')
+        
+        # Preserve starting numbers like "01_" if no prefix is given
+        match = re.match(r'^(\d+)[_\-]', filename)
+        idx_str = match.group(1) + "_" if match else ""
+        
+        new_final_name = f"{prefix}-{clean_song_info}{ext}" if prefix else f"{idx_str}{clean_song_info}{ext}"
+        new_final_name = get_unique_filename(directory, new_final_name, filename)
+        if new_final_name == filename:
+            print(f"   ✔️  {filename} already named for '{song_info}'")
+            return file_path
+        new_output_path = os.path.join(directory, new_final_name)
+        
+        rename(file_path, new_output_path)
+        print(f"   🎶 {filename} identified as: '{song_info}' -> {new_final_name}")
+        return new_output_path
+    
+    if prefix and not filename.startswith(prefix):
+        new_final_name = get_unique_filename(directory, f"{prefix}-{filename}")
+        new_output_path = os.path.join(directory, new_final_name)
+        rename(file_path, new_output_path)
+        print(f"   ❓ Could not identify {filename} -> Renamed to {new_final_name}")
+        return new_output_path
+    
+    print(f"   ❓ Could not identify {filename}")
+    return file_path
+
+def recognize_local(files, index):
+    """
+    Looks files up in the local recognition index.
+    Returns {file: title} for the hits and {file: hashes} for the misses,
+    so songrec's answers for those can be added to the index afterwards.
+    An empty index matches nothing, so nothing is fingerprinted for it.
+    """
+    hits, misses = {}, {}
+    if not len(index):
+        return hits, misses
+    print(f"🧬 Checking {len(files)} files against {len(index)} songs recognised before...")
+    for path, hashes in fingerprint_many(files):
+        if hashes is None:
+            continue
+        matches = index.match(hashes, LOCAL_MATCH_THRESHOLD)
+        if matches:
+            hits[path] = matches[0][0]
+        else:
+            misses[path] = hashes
+    return hits, misses
+
+def title_from_filename(filename):
+    """Recovers songrec's 'Artist - Title' from a name this tool gave a file, or None."""
+    base = os.path.splitext(filename)[0]
+    if "_-_" not in base:
+        return None
+    base = re.sub(r'^\d+_', '', base)           # "01_" kept from the original name
+    base = re.sub(r'^[^_]+?-(?!_)', '', base)   # "Prefix-" from --prefix
+    return base.replace('_', ' ').strip() or None
+
+def build_local_index(folder, local_index=LOCAL_INDEX):
+    """Adds files in `folder` that were identified earlier (named 'Artist_-_Title') to the local index."""
+    titled = {}
+    for f in sorted(os.listdir(folder)):
+        title = title_from_filename(f) if f.lower().endswith(SUPPORTED_EXTS) else None
+        if title:
+            titled[os.path.join(folder, f)] = title
+    if not titled:
+        print(f"⚠️ No identified files found in '{folder}'.")
+        return
+
+    index = FingerprintIndex(local_index)
+    print(f"🧬 Fingerprinting {len(titled)} identified files...")
+    learned = {titled[path]: hashes for path, hashes in fingerprint_many(list(titled)) if hashes is not None}
+    index.add(learned)
+    index.save()
+    print(f"💾 {len(index)} songs in {local_index}")
+
+def identify_music(folder, prefix=None, local_index=LOCAL_INDEX, cache_path=RECOGNITION_DB):
     if not os.path.exists(folder):
         print(f"❌ Error: Folder '{folder}' not found.")
         return
 
-    supported_exts = ('.mp3', '.m4a', '.wav', '.mp4')
-    files_to_process = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(supported_exts)])
+    cache = RecognitionCache(cache_path)
+    if (resumed := cache.recover()):
+        print(f"↩️  Completed {resumed} renames left over from an interrupted run.")
+
+    files_to_process = sorted([os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(SUPPORTED_EXTS)])
 
     if not files_to_process:
         print(f"⚠️ No supported audio/video files found in '{folder}'.")
         return
 
-    print(f"🔍 Identifying {len(files_to_process)} songs in '{folder}'...")
-    results = recognize_batch(files_to_process)
-    
-    if results == "MISSING_SONGREC":
-        print("   ⚠️ 'songrec' CLI not found. (Install via: brew install rust && cargo install songrec)")
-        return
-        
+    # Files are renamed the moment their answer is known, so an interrupted
+    # run keeps everything it finished; results are cached by content, so
+    # the rerun only looks up what's left.
+    hashes = {f: cache.content_hash(f) for f in files_to_process}
+
+    def apply(file_path, title, remember=True):
+        if remember:
+            cache.store(hashes[file_path], title)
+        return rename_identified(file_path, title, prefix, rename=cache.rename)
+
+    # 1. Files answered by an earlier run
+    remaining = []
     for file_path in files_to_process:
-        song_info = results.get(file_path)
-        directory, filename = os.path.split(file_path)
-        ext = os.path.splitext(filename)[1]
-        
-        if song_info:
-            clean_song_info = sanitize_filename(song_info).replace(' ', '_')
-            
-            # Preserve starting numbers like "01_" if no prefix is given
-            match = re.match(r'^(\d+)[_\-]', filename)
-            idx_str = match.group(1) + "_" if match else ""
-            
-            new_final_name = f"{prefix}-{clean_song_info}{ext}" if prefix else f"{idx_str}{clean_song_info}{ext}"
-            new_final_name = get_unique_filename(directory, new_final_name)
-            new_output_path = os.path.join(directory, new_final_name)
-            
-            os.rename(file_path, new_output_path)
-            print(f"   🎶 {filename} identified as: '{song_info}' -> {new_final_name}")
+        known, title = cache.lookup(hashes[file_path])
+        if known:
+            apply(file_path, title, remember=False)
         else:
-            if prefix and not filename.startswith(prefix):
-                new_final_name = get_unique_filename(directory, f"{prefix}-{filename}")
-                new_output_path = os.path.join(directory, new_final_name)
-                os.rename(file_path, new_output_path)
-                print(f"   ❓ Could not identify {filename} -> Renamed to {new_final_name}")
-            else:
-                print(f"   ❓ Could not identify {filename}")
+            remaining.append(file_path)
+    if len(remaining) < len(files_to_process):
+        print(f"   ♻️  {len(files_to_process) - len(remaining)} answered from {cache_path}, {len(remaining)} to look up.")
+    if not remaining:
+        return
+
+    # 2. Songs we've recognised before are matched locally
+    misses = {}
+    index = FingerprintIndex(local_index) if local_index else None
+    if index is not None:
+        hits, misses = recognize_local(remaining, index)
+        for file_path, title in hits.items():
+            apply(file_path, title)
+        if hits:
+            print(f"   ⚡ {len(hits)} recognised locally, {len(remaining) - len(hits)} left for Shazam.")
+        remaining = [f for f in remaining if f not in hits]
+    if not remaining:
+        return
+
+    # 3. The rest go to songrec, and what it finds is remembered for next time
+    print(f"🔍 Identifying {len(remaining)} songs in '{folder}'...")
+    learned = {}
+    # Recognised files the local index had no fingerprint for yet (by their new name)
+    to_learn = {}
+
+    def songrec_result(file_path, output):
+        if output == "MISSING_SONGREC":
+            return
+        if output == RECOGNITION_FAILED:
+            # Not cached: the next run asks again
+            apply(file_path, None, remember=False)
+            return
+        new_path = apply(file_path, output)
+        if output and file_path in misses:
+            learned[output] = misses[file_path]
+        elif output:
+            to_learn[new_path] = output
+
+    if recognize_batch(remaining, songrec_result) == "MISSING_SONGREC":
+        print("   ⚠️ 'songrec' CLI not found. (Install via: brew install rust && cargo install songrec)")
+    if index is not None and to_learn:
+        # Only the songs Shazam recognised are worth fingerprinting
+        learned.update({to_learn[path]: hashes for path, hashes in fingerprint_many(list(to_learn)) if hashes is not None})
+    if index is not None and learned:
+        index.add(learned)
+        index.save()
+        print(f"   💾 Remembered {len(learned)} new songs in {local_index}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Identify music files and rename them using Shazam (songrec).", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("--folder", "-f", required=True, help="Folder containing music files to identify")
     parser.add_argument("--prefix", "-p", help="Optional prefix for renamed files (e.g. 'Waltz')")
+    parser.add_argument("--local-index", default=LOCAL_INDEX, help="Fingerprints of songs recognised before, checked before asking Shazam")
+    parser.add_argument("--no-local", action="store_true", help="Always ask Shazam, without checking or updating the local index")
+    parser.add_argument("--cache", default=RECOGNITION_DB, help="Cache of earlier results (by file content) and rename journal, so reruns resume where they stopped")
+    parser.add_argument("--build-local", action="store_true", help="Add the already identified files in --folder (named 'Artist_-_Title') to the local index, then exit")
     args = parser.parse_args()
     
-    identify_music(args.folder, args.prefix)
\ No newline at end of file
+    if args.build_local:
+        build_local_index(args.folder, args.local_index)
+    else:
+        identify_music(args.folder, args.prefix, None if args.no_local else args.local_index, args.cache)
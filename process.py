@@ -11,19 +11,28 @@ import numpy as np
 from pydub import AudioSegment, effects
 from PIL import Image, ImageDraw, ImageFont
 
+from fingerprint import load_duplicate_groups, FINGERPRINT_INDEX
+from media_probe import probe_many, STILL_COVER_COMMENT
+
 # Used only for the final statistics display
 STANDARD_DANCES = ['Waltz', 'Foxtrot', 'Tango', 'Viennese Waltz', 'Quickstep']
 
+# Audio containers picked up from the libraries. Besides MP3/M4A this covers
+# what the splitters and downloader produce when they keep the site's native
+# codec (Opus, Vorbis, FLAC, raw AAC, WebM audio) instead of transcoding.
+AUDIO_EXTS = (".mp3", ".m4a", ".opus", ".ogg", ".flac", ".aac", ".webm")
+
 def parse_args():
     # Added formatter_class to automatically display default values in -h output
     parser = argparse.ArgumentParser(
         description="Generate a Dance Party Video Playlist",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("--source", "-s", default="~/music_dir/general-music-pool/input_mp3s_m4as", help="Path to source audio files (MP3s, M4As)")
+    parser.add_argument("--source", "-s", default="~/music_dir/general-music-pool/input_mp3s_m4as", help="Path to source audio files (MP3, M4A, Opus, ...)")
     parser.add_argument("--favorite", "-f", help="Path to favorite audio files directory or a file containing a list of favorite song paths (prioritized)")
     parser.add_argument("--output", "-o", default="./output_mp4s", help="Path to output folder")
     parser.add_argument("--config", "-cfg", default="dance_config.json", help="Path to weights JSON")
+    parser.add_argument("--fingerprints", default=FINGERPRINT_INDEX, help="Fingerprint index from fingerprint.py; songs it found to be duplicates count only once")
     parser.add_argument("--count", "-c", type=int, default=20, help="Number of songs")
     
     # Export Flags
@@ -71,7 +80,7 @@ def get_dance_type(filename, all_dances):
         return match.group(1).title()
     return None
 
-def parse_libraries(source_dir, favorite_path, all_dances):
+def parse_libraries(source_dir, favorite_path, all_dances, fingerprint_index=None):
     library = {}
     
     def add_songs_from_dir(dir_path, is_favorite):
@@ -79,7 +88,7 @@ def parse_libraries(source_dir, favorite_path, all_dances):
             return 0
         count = 0
         for filename in os.listdir(dir_path):
-            if not filename.lower().endswith((".mp3", ".m4a")):
+            if not filename.lower().endswith(AUDIO_EXTS):
                 continue
                 
             dtype = get_dance_type(filename, all_dances)
@@ -117,7 +126,7 @@ def parse_libraries(source_dir, favorite_path, all_dances):
 
                 dir_path, filename = os.path.split(song_path)
 
-                if not filename.lower().endswith((".mp3", ".m4a")):
+                if not filename.lower().endswith(AUDIO_EXTS):
                     continue
                     
                 dtype = get_dance_type(filename, all_dances)
@@ -156,9 +165,41 @@ def parse_libraries(source_dir, favorite_path, all_dances):
     src_count = add_songs_from_dir(source_dir, False)
     print(f"Parsed {src_count} source songs.")
     total_count += src_count
+
+    dropped = drop_duplicate_songs(library, load_duplicate_groups(fingerprint_index))
+    if dropped:
+        print(f"🧬 Skipped {dropped} duplicate copies found by {fingerprint_index}.")
+        total_count -= dropped
     print(f"Total: {total_count} songs in library.")
     return library
 
+def drop_duplicate_songs(library, duplicate_groups):
+    """
+    Keeps one song per fingerprint duplicate group (a favorite if there is
+    one), so re-downloads, splits and speed-adjusted copies of the same song
+    don't inflate its dance type's quota or get picked twice.
+    Returns how many songs were removed.
+    """
+    if not duplicate_groups:
+        return 0
+    songs = [(dtype, song) for dtype, entries in library.items() for song in entries]
+    songs.sort(key=lambda item: not item[1]['is_favorite'])
+
+    seen_groups = set()
+    dropped = 0
+    for dtype, song in songs:
+        group = duplicate_groups.get(os.path.abspath(os.path.join(song['dir'], song['filename'])))
+        if group is None:
+            continue
+        if group in seen_groups:
+            library[dtype].remove(song)
+            dropped += 1
+        seen_groups.add(group)
+
+    for dtype in [d for d, entries in library.items() if not entries]:
+        del library[dtype]
+    return dropped
+
 def calculate_global_quotas(target_count, dance_config, library):
     # Extract only the 'weight' weights for calculation
     weights = {k: v.get('weight', 0) for k, v in dance_config.items()}
@@ -291,6 +332,12 @@ FADE_FLOOR_DB = -60.0
 # and accelerates, so the fade eases in gently and drifts away at the end.
 # Higher = more of the window spent near full volume. See --fade-curve.
 FADE_CURVE = 2.0
+# The last few ms of the fade ramp linearly to true silence, so nothing clicks
+FADE_TAPER_MS = 40.0
+
+def fade_taper_frames(frames, fade_ms):
+    """How many of a fade's `frames` get the final linear taper to silence."""
+    return max(1, min(frames // 4, int(frames * FADE_TAPER_MS / fade_ms)))
 
 def smooth_fade_out(audio_segment, fade_ms, curve=FADE_CURVE, floor_db=FADE_FLOOR_DB):
     """
@@ -329,7 +376,7 @@ def smooth_fade_out(audio_segment, fade_ms, curve=FADE_CURVE, floor_db=FADE_FLOO
     shaped = 10.0 ** (gain_db / 20.0)
 
     # Land on absolute silence over the final few ms to avoid a click.
-    taper_frames = max(1, min(frames // 4, int(frames * 40.0 / fade_ms)))
+    taper_frames = fade_taper_frames(frames, fade_ms)
     shaped[-taper_frames:] *= np.linspace(1.0, 0.0, taper_frames, endpoint=True)
 
     curve_samples = np.repeat(shaped, channels) if channels > 1 else shaped
@@ -427,21 +474,6 @@ def print_statistics(playlist, dance_config, args, all_dances):
     with open(stats_file_path, "w", encoding="utf-8") as f:
         f.write(output_text)
 
-def get_video_duration(file_path):
-    """Get duration of video file in seconds using ffprobe"""
-    try:
-        cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', 
-               '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            return float(result.stdout.strip())
-        else:
-            print(f"Warning: Could not get duration for {file_path}")
-            return 0
-    except Exception as e:
-        print(f"Warning: Error getting duration for {file_path}: {e}")
-        return 0
-
 def calculate_playlist_total_duration(output_dir):
     """Calculate total duration of all MP4 files in output directory"""
     if not os.path.exists(output_dir):
@@ -453,9 +485,13 @@ def calculate_playlist_total_duration(output_dir):
     
     print(f"\n🔍 Scanning {len(mp4_files)} generated MP4 files...")
     
+    probes = probe_many(os.path.join(output_dir, f) for f in mp4_files)
     for mp4_file in mp4_files:
         file_path = os.path.join(output_dir, mp4_file)
-        duration = get_video_duration(file_path)
+        info = probes[file_path]
+        if info is None:
+            print(f"Warning: Could not get duration for {file_path}")
+        duration = info.duration if info else 0
         total_duration += duration
         print(f"  {mp4_file}: {duration:.1f}s")
     
@@ -551,6 +587,7 @@ def create_media(source_dir, output_dir, audio_filename, index, cover_img_path,
            '-c:v', 'libx264', '-tune', 'stillimage', '-pix_fmt', 'yuv420p', 
            '-c:a', 'aac', '-b:a', '256k', 
            '-ar', '44100', '-ac', '2',
+           '-metadata', f'comment={STILL_COVER_COMMENT}',
            '-t', str(duration_sec), output_mp4_path]
     subprocess.run(cmd)
     os.remove(temp_wav_path)
@@ -569,7 +606,7 @@ def main():
         os.makedirs(args.output_mp3)
         
     print(f"Scanning libraries at: {args.source}" + (f" and {args.favorite}" if args.favorite else ""))
-    library = parse_libraries(args.source, args.favorite, all_dances)
+    library = parse_libraries(args.source, args.favorite, all_dances, args.fingerprints)
     if not library:
         print("No valid songs found.")
         return
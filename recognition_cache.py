@@ -0,0 +1,147 @@
+import hashlib
+import os
+import time
+
+from source_cache import CACHE_DIR
+from sqlite_store import SQLiteStore
+
+# Written by music_identify.py
+RECOGNITION_DB = os.path.join(CACHE_DIR, "recognition_cache.db")
+# Shazam's catalogue keeps growing, so "not recognised" is only trusted for a while
+UNRECOGNIZED_RETRY_SECONDS = 14 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    content_hash  TEXT PRIMARY KEY,
+    title         TEXT,
+    recognized_at REAL,
+    retry_after   REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path          TEXT PRIMARY KEY,
+    size          INTEGER,
+    mtime         REAL,
+    content_hash  TEXT
+);
+CREATE TABLE IF NOT EXISTS journal (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    src           TEXT NOT NULL,
+    dst           TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    created_at    REAL
+);
+CREATE INDEX IF NOT EXISTS journal_status ON journal (status);
+"""
+
+def file_hash(path):
+    """SHA256 of the file's content, so a renamed file is still the same file."""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+class RecognitionCache(SQLiteStore):
+    """
+    What songrec (or the local index) said about each file, keyed by content.
+
+    A rerun answers every file seen before from here without another lookup;
+    "not recognised" is kept too, until its retry time. File hashes are
+    remembered by path, size and mtime so unchanged files aren't re-read.
+    Renames go through a journal: each is written down before it happens and
+    marked done after, so a run killed mid-rename is completed next time.
+    """
+
+    schema = SCHEMA
+
+    def __init__(self, path=RECOGNITION_DB):
+        super().__init__(path)
+
+    def content_hash(self, path):
+        # One cache serves every folder, so files are remembered by absolute path
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+        digest = file_hash(path)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO files (path, size, mtime, content_hash) VALUES (?, ?, ?, ?)",
+                              (path, st.st_size, st.st_mtime, digest))
+        return digest
+
+    def lookup(self, content_hash):
+        """
+        Returns (known, title). `known` is False if the file has to be
+        recognised (never seen, or unrecognised and due for a retry).
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT title, retry_after FROM results WHERE content_hash = ?",
+                                    (content_hash,)).fetchone()
+        if row is None:
+            return False, None
+        title, retry_after = row
+        if title is None and retry_after is not None and retry_after <= time.time():
+            return False, None
+        return True, title
+
+    def store(self, content_hash, title):
+        """Records a recognition result (None = not recognised, retried after UNRECOGNIZED_RETRY_SECONDS)."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (content_hash, title, recognized_at, retry_after) VALUES (?, ?, ?, ?)",
+                (content_hash, title, now, None if title else now + UNRECOGNIZED_RETRY_SECONDS))
+
+    def rename(self, src, dst):
+        """os.rename, journaled, and carrying the file's remembered hash over to its new name."""
+        # Absolute, so the next run can finish it whatever folder it starts in
+        src, dst = os.path.abspath(src), os.path.abspath(dst)
+        with self.lock:
+            cur = self.conn.execute("INSERT INTO journal (src, dst, status, created_at) VALUES (?, ?, 'pending', ?)",
+                                    (src, dst, time.time()))
+            entry = cur.lastrowid
+        os.rename(src, dst)
+        self._finish(entry, src, dst)
+
+    def _finish(self, entry, src, dst):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute("UPDATE OR REPLACE files SET path = ? WHERE path = ?", (dst, src))
+                self.conn.execute("UPDATE journal SET status = 'done' WHERE id = ?", (entry,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def recover(self):
+        """
+        Completes renames an interrupted run left half-done. Returns how many were completed.
+
+        If both names exist, the run stopped after something else put a file
+        at the new name. When it holds the same content the rename is done
+        in effect and the old copy is removed; otherwise both files are left
+        alone, reported, and the entry is marked 'conflict'.
+        """
+        with self.lock:
+            pending = self.conn.execute("SELECT id, src, dst FROM journal WHERE status = 'pending'").fetchall()
+        completed = 0
+        for entry, src, dst in pending:
+            status = None
+            if os.path.exists(src) and os.path.exists(dst):
+                if file_hash(src) == file_hash(dst):
+                    os.remove(src)
+                else:
+                    print(f"   ⚠️ Not renaming {src}: {dst} already exists with different content.")
+                    status = 'conflict'
+            elif os.path.exists(src):
+                os.rename(src, dst)
+            elif not os.path.exists(dst):
+                status = 'abandoned'
+
+            if status:
+                with self.lock:
+                    self.conn.execute("UPDATE journal SET status = ? WHERE id = ?", (status, entry))
+            else:
+                self._finish(entry, src, dst)
+                completed += 1
+        return completed
@@ -0,0 +1,194 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+# Downloaded sources shared by download.py, video_splitter.py and split_manual.py,
+# so re-splitting a video (new prefix, new timestamps) doesn't download it again.
+CACHE_DIR = os.path.expanduser(os.environ.get("PARTY_CACHE_DIR", "~/.cache/party-music-processor"))
+SOURCES_DIR = os.path.join(CACHE_DIR, "sources")
+# Least recently used sources are evicted once the cache grows past this
+MAX_CACHE_BYTES = int(float(os.environ.get("PARTY_CACHE_MAX_GB", "20")) * 1024 ** 3)
+# Leftovers from a download that was killed half way
+STALE_TMP_SECONDS = 24 * 3600
+# Linux ioctl that clones a file's data copy-on-write (btrfs, XFS), so an
+# exported copy costs no space until one side is changed
+FICLONE = 0x40049409
+
+def source_id_for(url, info=None):
+    """
+    Identifies the media behind a URL, so youtu.be links, watch?v= links and
+    links with tracking parameters all share one cache entry.
+
+    Uses yt-dlp's info dict when we already have it, otherwise asks yt-dlp's
+    extractors to pull the id out of the URL (no network involved).
+    """
+    if info and info.get('id'):
+        return f"{info.get('extractor_key', '')}:{info['id']}"
+
+    from yt_dlp.extractor import gen_extractor_classes
+    for ie in gen_extractor_classes():
+        if ie.suitable(url):
+            temp_id = ie.get_temp_id(url) if ie.ie_key() != "Generic" else None
+            if temp_id:
+                return f"{ie.ie_key()}:{temp_id}"
+            break
+    return url.strip()
+
+def cache_key(source_id, fmt):
+    return hashlib.sha256(f"{source_id}|{fmt}".encode("utf-8")).hexdigest()[:32]
+
+def entry_file(entry_dir):
+    """The media file inside a cache entry, or None."""
+    if not os.path.isdir(entry_dir):
+        return None
+    # Skip yt-dlp's partial/fragment leftovers if a download died mid-way
+    files = [f for f in os.listdir(entry_dir) if not f.startswith(".") and not f.endswith((".part", ".ytdl"))]
+    return os.path.join(entry_dir, files[0]) if files else None
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+@contextlib.contextmanager
+def locked(lock_path, mode):
+    """
+    Yields the open lock file for `lock_path`, flocked with `mode`.
+
+    Lock files are deleted once their entry is gone, so the one we opened
+    may have been unlinked while we waited for it; in that case another run
+    may already hold a new file under the same name, and we start over.
+    """
+    while True:
+        with open(lock_path, "a") as lock:
+            fcntl.flock(lock, mode)
+            try:
+                current = os.stat(lock_path)
+            except FileNotFoundError:
+                continue
+            if current.st_ino != os.fstat(lock.fileno()).st_ino:
+                continue
+            yield lock
+            return
+
+def remove_lock(lock_path):
+    """Deletes a lock file whose entry no run is using; skips it if one is."""
+    try:
+        with locked(lock_path, fcntl.LOCK_EX | fcntl.LOCK_NB):
+            os.unlink(lock_path)
+    except BlockingIOError:
+        pass
+
+def evict(max_bytes=MAX_CACHE_BYTES, keep=None):
+    """
+    Deletes least recently used entries until the cache fits in `max_bytes`.
+
+    Entries in use by another run hold a shared lock and are skipped, so a
+    source is never pulled out from under a splitter that's reading it.
+    Evicted entries lose their lock file too, as do lock files left by
+    downloads that produced nothing.
+    """
+    if not os.path.isdir(SOURCES_DIR):
+        return
+
+    entries = []
+    now = time.time()
+    for name in os.listdir(SOURCES_DIR):
+        path = os.path.join(SOURCES_DIR, name)
+        if name.startswith(".tmp-"):
+            if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        if name.endswith(".lock"):
+            if not os.path.exists(path[:-len(".lock")]) and name[:-len(".lock")] != keep:
+                remove_lock(path)
+            continue
+        if not os.path.isdir(path) or name == keep:
+            continue
+        entries.append((os.path.getmtime(path), name, dir_size(path)))
+
+    total = sum(size for _, _, size in entries)
+    if keep:
+        total += dir_size(os.path.join(SOURCES_DIR, keep))
+
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        lock_path = os.path.join(SOURCES_DIR, f"{name}.lock")
+        try:
+            with locked(lock_path, fcntl.LOCK_EX | fcntl.LOCK_NB):
+                shutil.rmtree(os.path.join(SOURCES_DIR, name), ignore_errors=True)
+                os.unlink(lock_path)
+        except BlockingIOError:
+            continue
+        total -= size
+        print(f"   🧹 Evicted cached source {name} ({size / 1024 ** 2:.0f} MB)")
+
+@contextlib.contextmanager
+def cached_source(source_id, fmt, download):
+    """
+    Yields the path of the cached source, downloading it first on a miss
+    (None if the download produced nothing).
+
+    `download(tmp_dir)` must leave exactly one media file in `tmp_dir`. It
+    runs under an exclusive lock, so two runs asking for the same source
+    download it once; the finished file is moved into place with a single
+    rename, so a killed download never leaves a half-written entry behind.
+    While the caller holds the path the entry is shared-locked against
+    eviction. Callers must treat the file as read-only.
+    """
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+    key = cache_key(source_id, fmt)
+    entry_dir = os.path.join(SOURCES_DIR, key)
+
+    with locked(os.path.join(SOURCES_DIR, f"{key}.lock"), fcntl.LOCK_EX) as lock:
+        path = entry_file(entry_dir)
+        if path:
+            print(f"♻️  Using cached source: {path}")
+        else:
+            tmp_dir = tempfile.mkdtemp(prefix=f".tmp-{key}-", dir=SOURCES_DIR)
+            try:
+                download(tmp_dir)
+                if entry_file(tmp_dir):
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                    os.rename(tmp_dir, entry_dir)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            path = entry_file(entry_dir)
+
+        if not path:
+            yield None
+            return
+
+        # Mark as recently used, then let other readers in while we work
+        os.utime(entry_dir)
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        evict(keep=key)
+        yield path
+
+def export(cached_path, output_path):
+    """
+    Puts a copy of a cached file at `output_path`: a copy-on-write clone
+    where the filesystem supports one, otherwise a plain copy. Never a hard
+    link, which would share the cache entry's inode, so anything editing the
+    output in place would change the cached source too.
+    """
+    with open(cached_path, "rb") as src, open(output_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        shutil.copyfile(cached_path, output_path)
+    shutil.copystat(cached_path, output_path)
+    return output_path
@@ -2,36 +2,100 @@ import argparse
 import os
 import subprocess
 import sys
+import tempfile
+
+from batch_runner import add_batch_args, expand_sources, run_batch
+from media_probe import probe, STILL_COVER_COMMENT
 
 VIDEO_EXTS = {".mp4", ".mov", ".m4v", ".mkv", ".avi", ".webm"}
 
+# --- STILL-IMAGE VIDEO ---
+# Untagged videos are checked by comparing small grey thumbnails taken at
+# these points (share of the duration); if they differ by no more than
+# STILL_TOLERANCE on average (0-255 scale), the picture never changes.
+STILL_SAMPLES = (0.1, 0.5, 0.9)
+STILL_THUMBNAIL = (64, 36)
+STILL_TOLERANCE = 2.0
+# Same frame rate process.py renders its track MP4s at
+STILL_FRAMERATE = 30
+
 def probe_streams(source_path):
     """
     Report what the file actually holds: (has_video, has_audio).
 
     Cover art embedded in an MP3/M4A shows up as a video stream, so a plain
     "does it have video?" check would treat a tagged audio file as a movie.
-    Those streams are flagged 'attached_pic', which is what we filter on here.
+    Those streams are flagged 'attached_pic', which media_probe leaves out.
     Falls back to the file extension if ffprobe is unavailable.
     """
-    def stream_dispositions(kind, entries):
-        cmd = ["ffprobe", "-v", "error", "-select_streams", kind,
-               "-show_entries", entries, "-of", "csv=p=0", source_path]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return [line.strip() for line in result.stdout.splitlines() if line.strip() != ""]
-
-    try:
-        video = [d for d in stream_dispositions("v", "stream_disposition=attached_pic") if d == "0"]
-        audio = stream_dispositions("a", "stream=index")
-        return bool(video), bool(audio)
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    info = probe(source_path)
+    if info is None:
         return os.path.splitext(source_path)[1].lower() in VIDEO_EXTS, True
+    return info.has_video, info.has_audio
+
+def sample_frame(source_path, at_s):
+    """Grey thumbnail of the frame at `at_s`, as raw bytes (empty if there is none)."""
+    w, h = STILL_THUMBNAIL
+    cmd = ["ffmpeg", "-v", "error", "-ss", f"{at_s:.2f}", "-i", source_path, "-frames:v", "1",
+           "-vf", f"scale={w}:{h},format=gray", "-f", "rawvideo", "-"]
+    result = subprocess.run(cmd, capture_output=True)
+    return result.stdout if result.returncode == 0 else b""
+
+def is_still_video(source_path, info):
+    """
+    True if the video's picture is one still image: a track MP4 tagged by
+    process.py, or any video whose sampled frames all look the same.
+    """
+    if info is None or not info.has_video:
+        return False
+    if info.tags.get("comment") == STILL_COVER_COMMENT:
+        return True
+    if not info.duration:
+        return False
+
+    frames = [sample_frame(source_path, info.duration * share) for share in STILL_SAMPLES]
+    size = STILL_THUMBNAIL[0] * STILL_THUMBNAIL[1]
+    if any(len(frame) != size for frame in frames):
+        return False
+    first = frames[0]
+    return all(sum(abs(a - b) for a, b in zip(first, frame)) / size <= STILL_TOLERANCE for frame in frames[1:])
+
+def adjust_still_video(source_path, output_path, speed_factor, duration):
+    """
+    Retimes a still-image video by stretching only the audio.
+
+    One frame is pulled out and encoded into a one-second clip, which is then
+    looped by stream copy for the new length, so the cost is close to an
+    audio-only adjustment.
+    """
+    with tempfile.TemporaryDirectory(prefix="speed_") as tmp:
+        frame_path = os.path.join(tmp, "frame.png")
+        still_path = os.path.join(tmp, "still.mp4")
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-ss", f"{duration / 2:.2f}", "-i", source_path,
+                        "-frames:v", "1", frame_path], check=True)
+        # Match the encoding process.py uses for its still-image playlists
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-loop", "1", "-framerate", str(STILL_FRAMERATE),
+                        "-i", frame_path, "-t", "1",
+                        "-c:v", "libx264", "-tune", "stillimage", "-pix_fmt", "yuv420p", still_path], check=True)
+        subprocess.run(["ffmpeg", "-y", "-v", "error", "-stream_loop", "-1", "-i", still_path, "-i", source_path,
+                        "-map", "0:v", "-map", "1:a", "-c:v", "copy",
+                        "-filter:a", f"atempo={speed_factor}", "-c:a", "aac", "-b:a", "256k", "-ar", "44100", "-ac", "2",
+                        "-metadata", f"comment={STILL_COVER_COMMENT}",
+                        "-t", f"{duration / speed_factor:.3f}", output_path], check=True)
+
+def output_path_for(source_path, adjustment_percent):
+    # Example: "mysong.mp3" -> "mysong_+10.mp3" or "mysong_-5.mp3"
+    directory, filename = os.path.split(source_path)
+    name, ext = os.path.splitext(filename)
+    sign_symbol = "+" if adjustment_percent >= 0 else "" # Negative numbers already have '-'
+    return os.path.join(directory, f"{name}_{sign_symbol}{int(adjustment_percent)}{ext}")
 
 def adjust_speed(source_path, adjustment_percent):
+    """Retimes one file. Returns the output path, or None if it failed."""
     # 1. Validation
     if not os.path.exists(source_path):
         print(f"❌ Error: File not found: {source_path}")
-        return
+        return None
 
     # 2. Calculate Speed Factor
     # Factor 1.0 = 100% (Normal)
@@ -43,28 +107,34 @@ def adjust_speed(source_path, adjustment_percent):
     if not (0.5 <= speed_factor <= 2.0):
         print(f"❌ Error: Adjustment {adjustment_percent}% is too extreme.")
         print("   Please keep it between -50 (half speed) and 100 (double speed).")
-        return
+        return None
 
     # 3. Generate Output Filename
-    # Example: "mysong.mp3" -> "mysong_+10.mp3" or "mysong_-5.mp3"
-    directory, filename = os.path.split(source_path)
-    name, ext = os.path.splitext(filename)
-    
-    sign_symbol = "+" if adjustment_percent >= 0 else "" # Negative numbers already have '-'
-    suffix = f"{sign_symbol}{int(adjustment_percent)}"
-    
-    new_filename = f"{name}_{suffix}{ext}"
-    output_path = os.path.join(directory, new_filename)
+    filename = os.path.basename(source_path)
+    output_path = output_path_for(source_path, adjustment_percent)
+    new_filename = os.path.basename(output_path)
 
     has_video, has_audio = probe_streams(source_path)
     if not has_audio and not has_video:
         print(f"❌ Error: No audio or video streams found in: {filename}")
-        return
+        return None
 
     print(f"{'🎬' if has_video else '🎧'} Processing: {filename}")
     print(f"   Target:     {speed_factor:.2f}x speed ({adjustment_percent}%)")
     print(f"   Saving to:  {new_filename}")
 
+    # A track MP4 from process.py is one cover image over the song: only the
+    # audio needs retiming, the picture can be rebuilt from a single frame.
+    info = probe(source_path)
+    if has_video and has_audio and is_still_video(source_path, info):
+        print("   Still image: retiming the audio only")
+        try:
+            adjust_still_video(source_path, output_path, speed_factor, info.duration)
+            print(f"✅ Success! Created: {output_path}")
+            return output_path
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️  Still-image shortcut failed ({e}), re-encoding the video instead.")
+
     # 4. Run FFmpeg
     # The 'atempo' filter changes tempo without altering pitch. For video the
     # picture has to be re-timed to match, or the two drift apart: 'setpts'
@@ -96,18 +166,29 @@ def adjust_speed(source_path, adjustment_percent):
     try:
         subprocess.run(cmd, check=True)
         print(f"✅ Success! Created: {output_path}")
+        return output_path
     except subprocess.CalledProcessError as e:
         print(f"❌ FFmpeg Error: {e}")
     except FileNotFoundError:
         print("❌ Error: FFmpeg is not installed or not in your PATH.")
+    return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Adjust music speed without changing pitch. Audio files keep their format; video files (MP4 etc.) stay in sync with the retimed audio.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     # Required Named Arguments
-    parser.add_argument("--source", required=True, help="Path to the audio file (MP3, M4A...) or video file (MP4...)")
+    parser.add_argument("--source", required=True, nargs="+", help="Audio (MP3, M4A...) or video (MP4...) files, folders or globs (e.g. 'Samba/*.m4a')")
     parser.add_argument("--adjust", required=True, type=float, help="Percentage adjustment (e.g. 10 or -10)")
+    add_batch_args(parser)
 
     args = parser.parse_args()
     
-    adjust_speed(args.source, args.adjust)
\ No newline at end of file
+    if len(args.source) == 1 and os.path.isfile(os.path.expanduser(args.source[0])):
+        adjust_speed(os.path.expanduser(args.source[0]), args.adjust)
+    else:
+        sources = expand_sources(args.source)
+        if not sources:
+            print("❌ Error: No audio or video files found.")
+            sys.exit(1)
+        if run_batch(adjust_speed, sources, (args.adjust,), output_path_for, args.workers, args.force):
+            sys.exit(1)
\ No newline at end of file
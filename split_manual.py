@@ -1,24 +1,13 @@
 import argparse
 import os
 import re
-import subprocess
 import yt_dlp
 import hashlib
 
-# File to store IDs of items we have already processed
-HISTORY_FILE = "download_history.log"
+import source_cache
+from job_history import JobHistory
+from chapter_splitter import split_chapters
 
-def load_history():
-    """Loads the set of previously processed item IDs."""
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
-
-def update_history(item_id):
-    """Appends a new ID to the history file."""
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(item_id + "\n")
 
 def get_file_hash(filepath):
     """Computes the SHA256 hash of a file's content."""
@@ -55,11 +44,13 @@ def parse_timestamps(text_file):
             
     return chapters
 
-def download_full_video(url, output_file):
+VIDEO_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+def download_full_video(url, output_dir):
     print(f"⬇️  Downloading source video...")
     ydl_opts = {
-        'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-        'outtmpl': output_file,
+        'format': VIDEO_FORMAT,
+        'outtmpl': os.path.join(output_dir, "source.%(ext)s"),
         'quiet': True,
     }
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -72,7 +63,7 @@ def get_seconds(time_str):
         return parts[0]*3600 + parts[1]*60 + parts[2]
     return parts[0]*60 + parts[1]
 
-def split_video(url, text_file, prefix=None, output_folder="manual_splits"):
+def split_video(url, text_file, prefix=None, output_folder="manual_splits", smart_cut=False):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
@@ -81,80 +72,84 @@ def split_video(url, text_file, prefix=None, output_folder="manual_splits"):
     if not chapters:
         print("❌ Error: Could not find any timestamps in your text file.")
         print("   Make sure lines look like: '00:00 Song Name'")
-        return
+        return None
 
     print(f"✅ Found {len(chapters)} songs in text file.")
 
-    # 2. Download Source
-    source_filename = "temp_source_video.mp4"
-    if not os.path.exists(source_filename):
-        download_full_video(url, source_filename)
-    else:
-        print("   (Using existing temp_source_video.mp4)")
-
-    # 3. Split Loop
-    for i in range(len(chapters)):
-        current = chapters[i]
-        start_str = current['time']
-        title = current['title']
+    # 2. Get Source (from the shared download cache, so re-splitting with new
+    # timestamps or a new prefix doesn't download the video again)
+    source_id = source_cache.source_id_for(url)
+    with source_cache.cached_source(source_id, VIDEO_FORMAT, lambda tmp_dir: download_full_video(url, tmp_dir)) as source_filename:
+        if not source_filename:
+            print("❌ Error: Could not download the source video.")
+            return None
+
+        # 3. Split (one pass over the source for every chapter)
+        jobs = []
+        for i in range(len(chapters)):
+            current = chapters[i]
+            title = current['title']
         
-        # Determine End Time
-        if i < len(chapters) - 1:
-            end_str = chapters[i+1]['time']
-            # FFmpeg needs duration or "to" position. "-to" works best.
-        else:
-            end_str = None # Last song goes to end of video
-
-        # Filename
-        safe_title = re.sub(r'[\\/*?:"<>|]', "", title)
-        if prefix:
-            outfile = f"{prefix}-{safe_title}.mp4"
-        else:
-            outfile = f"{i+1:02d}_{safe_title}.mp4"
+            # Determine End Time (last song goes to end of video)
+            end_time = get_seconds(chapters[i+1]['time']) if i < len(chapters) - 1 else None
+
+            # Filename
+            safe_title = re.sub(r'[\\/*?:"<>|]', "", title)
+            if prefix:
+                outfile = f"{prefix}-{safe_title}.mp4"
+            else:
+                outfile = f"{i+1:02d}_{safe_title}.mp4"
             
-        output_path = os.path.join(output_folder, outfile)
-        
-        print(f"✂️  Splitting: {start_str} -> {title}")
+            print(f"✂️  Splitting: {current['time']} -> {title}")
+            jobs.append({
+                'start_time': get_seconds(current['time']),
+                'end_time': end_time,
+                'output_path': os.path.join(output_folder, outfile),
+            })
+
+        outputs = [job['output_path'] for job in split_chapters(source_filename, jobs, smart=smart_cut)]
+        if len(outputs) < len(jobs):
+            # Not recorded as done, so a rerun tries again
+            print(f"❌ {len(jobs) - len(outputs)} of {len(jobs)} clips could not be cut (see the ffmpeg errors above).")
+            return None
 
-        cmd = ["ffmpeg", "-y", "-v", "error", "-i", source_filename, "-ss", start_str]
-        
-        if end_str:
-            cmd.extend(["-to", end_str])
-        
-        cmd.extend(["-c", "copy", output_path])
-        
-        subprocess.run(cmd)
-
-    # Optional: Remove source
-    # os.remove(source_filename) 
     print(f"\n🎉 Done! Check folder: {output_folder}")
+    return outputs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Manually split a video using a text file of timestamps.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("url", help="YouTube URL")
     parser.add_argument("textfile", help="File containing the copy-pasted description")
     parser.add_argument("--prefix", "-p", help="Prefix (e.g. 'Waltz')")
+    parser.add_argument("--smart-cut", action="store_true", help="Frame-accurate clips: re-encode only up to the first keyframe of each clip, copy the rest")
     parser.add_argument("--force", action="store_true", help="Ignore history and force re-processing")
     args = parser.parse_args()
 
     # --- History Check ---
-    history = load_history()
+    history = JobHistory()
     
     # Create a unique ID for this specific job
     text_file_hash = get_file_hash(args.textfile)
     job_id = f"split_manual|{args.url}|{text_file_hash}"
+    if args.smart_cut:
+        job_id += "|smart_cut"
 
     if not args.force and job_id in history:
         print(f"⏭️  Skipping (Already in history): {args.url} with {os.path.basename(args.textfile)}")
         exit()
     # --- End History Check ---
 
+    history.start(job_id, "split_manual", vars(args))
     try:
-        split_video(args.url, args.textfile, args.prefix)
+        outputs = split_video(args.url, args.textfile, args.prefix, smart_cut=args.smart_cut)
         
         # If successful, save to history
-        update_history(job_id)
-        print(f"✅ Success. Added to history: {job_id}")
+        if outputs is None:
+            history.finish(job_id, status="failed")
+        else:
+            history.finish(job_id, outputs)
+            print(f"✅ Success. Added to history: {job_id}")
 
     except Exception as e:
+        history.finish(job_id, status="failed")
         print(f"❌ An error occurred during splitting: {e}")
\ No newline at end of file
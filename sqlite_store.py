@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import threading
+
+class SQLiteStore:
+    """
+    An SQLite file shared by the tools, created from the subclass's `schema`.
+
+    WAL mode lets several tools read and write at once without interleaving
+    or blocking each other's reads; within one process the connection is
+    shared by worker threads behind `self.lock`.
+    """
+
+    schema = ""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.schema)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
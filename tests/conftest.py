@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# The tools are flat scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import media_probe  # noqa: E402
+
+@pytest.fixture(autouse=True)
+def probe_cache(tmp_path_factory, monkeypatch):
+    """Each test gets its own ffprobe cache, instead of the shared probe_cache.db in the user's cache directory."""
+    cache = media_probe.ProbeCache(str(tmp_path_factory.mktemp("probe") / "probe_cache.db"))
+    monkeypatch.setattr(media_probe, "_cache", cache)
+    yield cache
+    cache.close()
+
+requires_ffmpeg = pytest.mark.skipif(not shutil.which("ffmpeg"), reason="ffmpeg not installed")
+requires_ffprobe = pytest.mark.skipif(not shutil.which("ffprobe"), reason="ffprobe not installed")
+
+def make_video(path, seconds, gop=25, fps=25, size="160x120"):
+    """Synthetic H.264/AAC test clip: a test pattern and a tone, a keyframe every `gop` frames."""
+    subprocess.run(["ffmpeg", "-y", "-v", "error",
+                    "-f", "lavfi", "-i", f"testsrc=size={size}:rate={fps}:duration={seconds}",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop), "-pix_fmt", "yuv420p",
+                    "-c:a", "aac", "-shortest", str(path)], check=True)
+    return str(path)
+
+def make_tone(path, seconds, sample_rate=44100, frequency=440, channels=1):
+    """Synthetic sine tone in whatever format the extension says."""
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+                    "-i", f"sine=frequency={frequency}:sample_rate={sample_rate}:duration={seconds}",
+                    "-ac", str(channels), str(path)], check=True)
+    return str(path)
+
+def ffmpeg_duration(path):
+    """Duration from a decode with ffmpeg, for when there's no ffprobe."""
+    result = subprocess.run(["ffmpeg", "-v", "error", "-i", str(path), "-f", "null", "-", "-stats"],
+                            capture_output=True, text=True)
+    # Last "time=HH:MM:SS.ss" in the progress output
+    stamp = result.stderr.rsplit("time=", 1)[1].split()[0]
+    h, m, s = stamp.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
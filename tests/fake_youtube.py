@@ -0,0 +1,186 @@
+"""
+A local stand-in for the parts of the YouTube Data API the uploader uses,
+served by http.server, and a real API client pointed at it.
+"""
+import email.parser
+import http.server
+import json
+import random
+import re
+import threading
+import urllib.parse
+
+import googleapiclient.discovery
+import httplib2
+
+class FakeYouTube(http.server.ThreadingHTTPServer):
+    """
+    Resumable video uploads: POST opens a session, each PUT appends a chunk
+    ("bytes a-b/total", total "*" while unknown) and the last one returns the
+    new video. A PUT of "bytes */total" asks how much has been committed.
+
+    Playlists: their item count, inserts (appended, or at a given position;
+    past the end is refused, as YouTube does) answered with where the item
+    landed, and moves of an item to another position. Batch requests run
+    their calls in a shuffled order, since the real API doesn't promise any.
+    Videos in `reject_once` have their first insert fail, those in
+    `reject_always` all of them.
+
+    Everything received is kept for the test to check.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeYouTubeHandler)
+        self.lock = threading.Lock()
+        self.sessions = {}      # session id -> {"title", "data", "video"}
+        self.session_count = 0
+        self.videos = {}        # video id -> bytes
+        self.puts = []          # Content-Range of every chunk, in order
+        self.playlists = {}     # playlist id -> [video ids]
+        self.inserts = []       # (video id, position asked for or None) of every playlist insert tried
+        self.moves = []         # (video id, position) of every playlist item moved
+        self.reject_once = set()
+        self.reject_always = set()
+        self.shuffle = random.Random(0).shuffle
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def call(self, method, url, body):
+        """One API call, returned as (status, response body)."""
+        parsed = urllib.parse.urlparse(url)
+        query = urllib.parse.parse_qs(parsed.query)
+        with self.lock:
+            if parsed.path == "/youtube/v3/playlists" and method == "GET":
+                items = self.playlists.get(query["id"][0])
+                if items is None:
+                    return 200, {"items": []}
+                return 200, {"items": [{"id": query["id"][0], "contentDetails": {"itemCount": len(items)}}]}
+            if parsed.path == "/youtube/v3/playlistItems" and method == "POST":
+                snippet = body["snippet"]
+                items = self.playlists[snippet["playlistId"]]
+                video_id = snippet["resourceId"]["videoId"]
+                self.inserts.append((video_id, snippet.get("position")))
+                position = snippet.get("position", len(items))
+                if video_id in self.reject_once or video_id in self.reject_always:
+                    self.reject_once.discard(video_id)
+                    return 500, {"error": {"code": 500, "message": "Backend error"}}
+                if position > len(items):
+                    return 400, {"error": {"code": 400, "message": "Invalid playlist item position"}}
+                items.insert(position, video_id)
+                return 200, {"id": f"item-{video_id}", "snippet": dict(snippet, position=position)}
+            if parsed.path == "/youtube/v3/playlistItems" and method == "PUT":
+                snippet = body["snippet"]
+                items = self.playlists[snippet["playlistId"]]
+                video_id = snippet["resourceId"]["videoId"]
+                if body["id"] != f"item-{video_id}" or video_id not in items or snippet["position"] >= len(items):
+                    return 400, {"error": {"code": 400, "message": "Invalid playlist item"}}
+                self.moves.append((video_id, snippet["position"]))
+                items.remove(video_id)
+                items.insert(snippet["position"], video_id)
+                return 200, {"id": body["id"], "snippet": snippet}
+        return 404, {"error": {"code": 404, "message": "Not found"}}
+
+class FakeYouTubeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None, raw=None, content_type="application/json"):
+        data = raw if raw is not None else json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.startswith("/upload/youtube/v3/videos"):
+            with self.server.lock:
+                session = str(self.server.session_count)
+                self.server.session_count += 1
+                self.server.sessions[session] = {"title": json.loads(body)["snippet"]["title"], "data": bytearray()}
+            return self.reply(200, headers={"Location": f"{self.server.url}/session/{session}"})
+        if self.path.startswith("/batch"):
+            return self.batch(body)
+        self.reply(*self.server.call("POST", self.path, json.loads(body) if body else None))
+
+    def do_GET(self):
+        self.reply(*self.server.call("GET", self.path, None))
+
+    def batch(self, body):
+        """Runs every call in a multipart/mixed batch and answers each in its own part."""
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        parts = message.get_payload()
+        order = list(range(len(parts)))
+        self.server.shuffle(order)
+        answers = [None] * len(parts)
+        for i in order:
+            head, _, call_body = parts[i].get_payload().replace("\r\n", "\n").partition("\n\n")
+            method, url, _ = head.splitlines()[0].split(" ", 2)
+            answers[i] = self.server.call(method, url, json.loads(call_body) if call_body.strip() else None)
+
+        boundary = "fake_batch"
+        out = []
+        for part, (status, answer) in zip(parts, answers):
+            content = json.dumps(answer)
+            out.append(f"--{boundary}\r\nContent-Type: application/http\r\n"
+                       f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                       f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                       f"Content-Type: application/json\r\nContent-Length: {len(content)}\r\n\r\n{content}\r\n")
+        out.append(f"--{boundary}--\r\n")
+        self.reply(200, raw="".join(out).encode(), content_type=f"multipart/mixed; boundary={boundary}")
+
+    def do_PUT(self):
+        data = self.read_body()
+        if self.path.startswith("/youtube/v3/"):
+            return self.reply(*self.server.call("PUT", self.path, json.loads(data)))
+        session = self.server.sessions.get(self.path.rsplit("/", 1)[-1])
+        if session is None:
+            return self.reply(404, {"error": {"code": 404, "message": "No such upload session"}})
+        content_range = self.headers.get("Content-Range", "")
+        with self.server.lock:
+            self.server.puts.append(content_range)
+        if content_range.startswith("bytes */"):
+            if session.get("video"):
+                return self.reply(200, {"id": session["video"]})
+            committed = len(session["data"])
+            return self.reply(308, headers={"Range": f"bytes=0-{committed - 1}"} if committed else {})
+
+        start, total = re.match(r"bytes (\d+)-\d+/(\S+)", content_range).groups()
+        with self.server.lock:
+            if int(start) != len(session["data"]):
+                return self.reply(400, {"error": {"code": 400, "message": "Chunk out of order"}})
+            session["data"].extend(data)
+            if total != "*" and len(session["data"]) == int(total):
+                video_id = session["video"] = f"vid-{len(self.server.videos)}"
+                self.server.videos[video_id] = bytes(session["data"])
+                return self.reply(200, {"id": video_id})
+            committed = len(session["data"])
+        self.reply(308, headers={"Range": f"bytes=0-{committed - 1}"})
+
+class LocalHttp(httplib2.Http):
+    """httplib2 sending every Google API request to the fake server instead."""
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        # A resumable upload's 308 is an answer, not a redirect
+        self.redirect_codes = self.redirect_codes - {308}
+
+    def request(self, uri, *args, **kwargs):
+        return super().request(re.sub(r"^https://[^/]+", self.url, uri), *args, **kwargs)
+
+def client(server):
+    """A YouTube API client (from the bundled discovery document) talking to `server`."""
+    return googleapiclient.discovery.build("youtube", "v3", developerKey="test", static_discovery=True,
+                                           http=LocalHttp(server.url))
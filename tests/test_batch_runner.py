@@ -0,0 +1,24 @@
+import os
+
+from batch_runner import expand_sources
+
+def touch(folder, *names):
+    for name in names:
+        (folder / name).write_bytes(b"")
+
+def listed(folder, *patterns):
+    return sorted(os.path.basename(p) for p in expand_sources([str(folder / p) for p in patterns] or [str(folder)]))
+
+def test_outputs_next_to_their_source_are_left_out(tmp_path):
+    touch(tmp_path, "song.mp3", "song_cut90s.mp3", "song_cut90s_f3s.mp3", "song_+10.mp3", "song_-3.0dB.mp3", "song_-14LUFS.m4a",
+          "song_cut90s_+10.mp3")
+    assert listed(tmp_path) == ["song.mp3"]
+    assert listed(tmp_path, "*.mp3") == ["song.mp3"]
+
+def test_names_that_only_look_derived_are_kept(tmp_path):
+    touch(tmp_path, "Track_+1.mp3", "Mix_-2.m4a", "Remix_-3.0dB.mp3", "notes.txt")
+    assert listed(tmp_path) == ["Mix_-2.m4a", "Remix_-3.0dB.mp3", "Track_+1.mp3"]
+
+def test_files_named_directly_are_always_used(tmp_path):
+    touch(tmp_path, "song.mp3", "song_+10.mp3")
+    assert listed(tmp_path, "song_+10.mp3") == ["song_+10.mp3"]
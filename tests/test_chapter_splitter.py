@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import chapter_splitter
+import media_probe
+from conftest import requires_ffmpeg, requires_ffprobe, make_video, ffmpeg_duration
+
+pytestmark = requires_ffmpeg
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    return make_video(tmp_path_factory.mktemp("src") / "source.mp4", 12)
+
+def chapters_in(folder, bounds):
+    return [{'start_time': a, 'end_time': b, 'output_path': str(folder / f"{i:02d}.mp4")}
+            for i, (a, b) in enumerate(bounds)]
+
+def test_copy_writes_every_chapter_in_one_pass(source, tmp_path):
+    chapters = chapters_in(tmp_path, [(0, 4), (4, 8), (8, None)])
+    written = chapter_splitter.split_chapters(source, chapters)
+    assert written == chapters
+    for chapter in chapters:
+        assert ffmpeg_duration(chapter['output_path']) == pytest.approx(4, abs=0.1)
+    assert not [f for f in os.listdir(tmp_path) if ".part" in f]
+
+def test_encode_writes_every_chapter(source, tmp_path):
+    chapters = chapters_in(tmp_path, [(1, 3), (5, 7.5)])
+    written = chapter_splitter.split_chapters(source, chapters, codec_args=["-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac"], workers=2)
+    assert written == chapters
+    assert ffmpeg_duration(chapters[1]['output_path']) == pytest.approx(2.5, abs=0.1)
+
+def test_failed_encode_is_not_reported_and_leaves_stale_output_alone(source, tmp_path):
+    stale = tmp_path / "00.mp4"
+    stale.write_bytes(b"from an earlier run")
+    chapters = chapters_in(tmp_path, [(0, 4)])
+    written = chapter_splitter.split_chapters(source, chapters, codec_args=["-c:v", "no_such_encoder"])
+    assert written == []
+    assert stale.read_bytes() == b"from an earlier run"
+    assert os.listdir(tmp_path) == ["00.mp4"]
+
+def test_failed_copy_pass_retries_chapters_one_by_one(source, tmp_path):
+    # A chapter ffmpeg can't open fails the whole multi-output pass; the others are still cut
+    chapters = chapters_in(tmp_path, [(0, 4), (4, 8)])
+    chapters.insert(1, {'start_time': 2, 'end_time': 6, 'output_path': str(tmp_path / "missing" / "x.mp4")})
+    written = chapter_splitter.split_chapters(source, chapters)
+    assert [c['output_path'] for c in written] == [chapters[0]['output_path'], chapters[2]['output_path']]
+    assert all(os.path.getsize(c['output_path']) > 0 for c in written)
+
+@requires_ffprobe
+def test_smart_cut_matches_source_stream(tmp_path):
+    # Keyframes every 2 s, cuts between them
+    source = make_video(tmp_path / "gop.mp4", 20, gop=50, size="320x240")
+    chapters = chapters_in(tmp_path, [(0, 5.3), (5.3, 12.7), (12.7, None)])
+    written = chapter_splitter.split_chapters(source, chapters, smart=True)
+    assert written == chapters
+
+    src = media_probe.probe(source, cache=False).video
+    for chapter, length in zip(chapters, (5.3, 7.4, 7.3)):
+        info = media_probe.probe(chapter['output_path'], cache=False)
+        assert info.duration == pytest.approx(length, abs=chapter_splitter.JOIN_DURATION_TOLERANCE)
+        v = info.video
+        assert (v.profile, v.level, v.pix_fmt, v.width, v.height, v.time_base) == \
+               (src.profile, src.level, src.pix_fmt, src.width, src.height, src.time_base)
+        # The whole clip decodes without an error, join included
+        assert chapter_splitter.decode_errors(chapter['output_path']) == []
+
+@requires_ffprobe
+def test_smart_cut_re_encodes_a_clip_whose_join_fails_its_check(tmp_path, monkeypatch, capsys):
+    source = make_video(tmp_path / "gop.mp4", 10, gop=50)
+    monkeypatch.setattr(chapter_splitter, "join_plays", lambda *args: False)
+    chapters = chapters_in(tmp_path, [(1.3, 7.1)])
+    assert chapter_splitter.split_chapters(source, chapters, smart=True) == chapters
+    assert "re-encoding the whole clip" in capsys.readouterr().out
+    assert ffmpeg_duration(chapters[0]['output_path']) == pytest.approx(5.8, abs=0.1)
@@ -0,0 +1,40 @@
+import wave
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from conftest import make_tone, requires_ffmpeg
+
+import cutter
+from process import smooth_fade_out
+
+# Largest difference allowed between the two paths, in 16-bit steps (about -84 dBFS)
+TOLERANCE = 2
+
+def wav_samples(path):
+    with wave.open(str(path), "rb") as f:
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16).astype(np.int32), f.getnchannels()
+
+@requires_ffmpeg
+@pytest.mark.parametrize("sample_rate, channels", [(44100, 2), (22050, 1)])
+@pytest.mark.parametrize("length_ms, fade_ms", [(6000, 3000), (4321, 1234), (2000, 2000)])
+def test_stream_cut_fades_like_smooth_fade_out(tmp_path, sample_rate, channels, length_ms, fade_ms):
+    source = make_tone(tmp_path / "tone.wav", 10, sample_rate, channels=channels)
+    total_ms = length_ms + fade_ms
+
+    # pydub path: slice by milliseconds, then the NumPy fade
+    expected = smooth_fade_out(AudioSegment.from_file(source)[:total_ms], fade_ms)
+    expected = np.array(expected.get_array_of_samples(), dtype=np.int32)
+
+    # ffmpeg path: input-side cut and the same fade as an aeval expression
+    output = tmp_path / "cut.wav"
+    cutter.cut_audio_stream(source, str(output), ".wav", total_ms, fade_ms, sample_rate)
+    actual, actual_channels = wav_samples(output)
+
+    assert actual_channels == channels
+    assert len(actual) == len(expected)
+    assert np.abs(actual - expected).max() <= TOLERANCE
+    # The fade has really been applied: full level before it, silence at the very end
+    assert np.abs(actual[:channels * sample_rate // 10]).max() > 1000
+    assert np.abs(actual[-channels:]).max() == 0
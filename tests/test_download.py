@@ -0,0 +1,106 @@
+import collections
+import functools
+import http.server
+import os
+import threading
+
+import pytest
+
+from conftest import make_tone, requires_ffmpeg
+
+import download
+import source_cache
+from job_history import JobHistory
+
+class StandIn(http.server.SimpleHTTPRequestHandler):
+    """Serves media files from a folder, failing on request like a real site would."""
+
+    # path -> HTTP status to answer with, a number of times (or forever)
+    failures = {}
+    requests = collections.Counter()
+
+    def do_GET(self):
+        self.requests[self.path] += 1
+        status, times = self.failures.get(self.path, (None, 0))
+        if status and (times is None or self.requests[self.path] <= times):
+            self.send_error(status)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def site(tmp_path):
+    """A local HTTP server standing in for a media site; yields its base URL."""
+    media = tmp_path / "site"
+    media.mkdir()
+    for name in ("one", "two", "three", "flaky"):
+        make_tone(media / f"{name}.m4a", 2)
+    StandIn.failures = {"/flaky.m4a": (503, 2), "/gone.m4a": (404, None)}
+    StandIn.requests = collections.Counter()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(StandIn, directory=str(media)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Runs in a scratch folder with its own download cache."""
+    work = tmp_path / "work"
+    (work / "out").mkdir(parents=True)
+    monkeypatch.chdir(work)
+    monkeypatch.setattr(source_cache, "CACHE_DIR", str(work / "cache"))
+    monkeypatch.setattr(source_cache, "SOURCES_DIR", str(work / "cache" / "sources"))
+    return work
+
+def run_queue(site, queue, **kwargs):
+    history = JobHistory("history.db")
+    pool = download.DownloaderPool()
+    try:
+        progress = download.download_queue([(f"{site}/{path}", name) for path, name in queue], "out", pool,
+                                           history, workers=2, per_host=2, backoff=0.01, **kwargs)
+    finally:
+        pool.close()
+    return progress, history
+
+@requires_ffmpeg
+def test_queue_downloads_from_a_plain_http_site(site, workspace):
+    progress, history = run_queue(site, [("one.m4a", "One"), ("two.m4a", "Two")])
+
+    assert (progress.done, progress.failed) == (2, 0)
+    assert sorted(os.listdir("out")) == ["One.m4a", "Two.m4a"]
+    assert f"{site}/one.m4a" in history
+    assert history.get(f"{site}/two.m4a")["outputs"] == [os.path.join("out", "Two.m4a")]
+
+@requires_ffmpeg
+def test_transient_errors_are_retried_and_missing_files_fail(site, workspace):
+    progress, history = run_queue(site, [("flaky.m4a", "Flaky"), ("gone.m4a", "Gone")])
+
+    assert (progress.done, progress.failed) == (1, 1)
+    # Two 503s, then the download that worked
+    assert StandIn.requests["/flaky.m4a"] >= 3
+    # A 404 is not worth another try
+    assert StandIn.requests["/gone.m4a"] == 1
+    assert os.listdir("out") == ["Flaky.m4a"]
+    assert history.get(f"{site}/gone.m4a")["status"] == "failed"
+
+@requires_ffmpeg
+def test_an_unexpected_error_fails_one_track_and_the_queue_carries_on(site, workspace, monkeypatch):
+    export = source_cache.export
+
+    def broken_export(cached, output_path):
+        if output_path.endswith("Two.m4a"):
+            raise OSError("disk full")
+        export(cached, output_path)
+
+    monkeypatch.setattr(source_cache, "export", broken_export)
+    finished = []
+    progress, history = run_queue(site, [("one.m4a", "One"), ("two.m4a", "Two"), ("three.m4a", "Three")],
+                                  on_finished=lambda url, name, path: finished.append(name))
+
+    assert (progress.done, progress.failed) == (2, 1)
+    assert sorted(finished) == ["One", "Three"]
+    assert history.get(f"{site}/two.m4a")["status"] == "failed"
+    assert f"{site}/three.m4a" in history
@@ -0,0 +1,76 @@
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+import fingerprint
+from conftest import requires_ffmpeg
+
+pytestmark = requires_ffmpeg
+
+RATE = 44100
+
+def make_music(path, seconds, seed):
+    """Three voices of random harmonic notes over a noise-burst beat, as a WAV."""
+    rng = np.random.default_rng(seed)
+    out = np.zeros(int(seconds * RATE))
+    for _ in range(3):
+        t = rng.uniform(0, 0.3)
+        while t < seconds:
+            length = rng.uniform(0.1, 0.6)
+            tt = np.arange(int(length * RATE)) / RATE
+            pitch = np.exp(rng.uniform(np.log(80), np.log(2500)))
+            envelope = np.exp(-tt * rng.uniform(1, 10)) * np.minimum(1, tt * 200)
+            note = sum(np.sin(2 * np.pi * pitch * h * tt + rng.uniform(0, 6)) * rng.uniform(0.2, 1) / h
+                       for h in range(1, 7)) * envelope
+            start = int(t * RATE)
+            end = min(len(out), start + len(note))
+            out[start:end] += note[:end - start]
+            t += length * rng.uniform(0.4, 1.0)
+    beat = int(RATE * 60 / rng.uniform(90, 140) / 2)
+    hit = rng.normal(0, 1, int(0.08 * RATE)) * np.exp(-np.arange(int(0.08 * RATE)) / RATE * 40)
+    for start in range(0, len(out) - len(hit), beat):
+        out[start:start + len(hit)] += hit * 1.2
+    out += rng.normal(0, 0.1, len(out))
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes((out / np.abs(out).max() * 0.9 * 32767).astype(np.int16).tobytes())
+    return str(path)
+
+@pytest.fixture(scope="module")
+def library(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("music")
+    source = make_music(folder / "mix.wav", 60, seed=1)
+    other = make_music(folder / "other.wav", 60, seed=2)
+    # A chapter cut at a point that falls between analysis frames, then made an MP3
+    excerpt = str(folder / "chapter.mp3")
+    subprocess.run(["ffmpeg", "-y", "-v", "error", "-ss", "20.0085", "-t", "25", "-i", source,
+                    "-c:a", "libmp3lame", "-b:a", "128k", excerpt], check=True)
+    index = fingerprint.FingerprintIndex(str(folder / "fingerprints.npz"))
+    index.update([source, other], workers=1)
+    return index, source, other, excerpt
+
+def test_a_shifted_re_encoded_excerpt_matches_its_source(library):
+    index, source, _, excerpt = library
+    matches = index.match(fingerprint.fingerprint_file(excerpt))
+
+    assert [path for path, _ in matches] == [source]
+    # Most of its hashes survive, not just enough to pass the threshold
+    assert matches[0][1] > 0.5
+
+def test_an_unrelated_track_does_not_match(library, tmp_path):
+    index, _, other, excerpt = library
+    assert index.duplicate_pairs() == []
+
+    unrelated = fingerprint.FingerprintIndex(str(tmp_path / "other.npz"))
+    unrelated.add({other: fingerprint.fingerprint_file(other)})
+    assert unrelated.match(fingerprint.fingerprint_file(excerpt)) == []
+
+def test_an_index_from_an_older_version_is_started_over(tmp_path):
+    path = tmp_path / "fingerprints.npz"
+    np.savez_compressed(path, paths=np.array(["a.mp3"]), sizes=np.array([1]), mtimes=np.array([0.0]),
+                        counts=np.array([1]), hashes=np.array([7], dtype=np.uint32), groups=np.array([-1]))
+    assert len(fingerprint.FingerprintIndex(str(path))) == 0
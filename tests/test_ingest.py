@@ -0,0 +1,60 @@
+import collections
+import os
+import threading
+
+import pytest
+
+import ingest
+import music_identify
+from conftest import make_tone, requires_ffmpeg
+from library_index import LibraryIndex
+from recognition_cache import RecognitionCache
+
+@pytest.fixture
+def stores(tmp_path):
+    cache = RecognitionCache(str(tmp_path / "recognition.db"))
+    index = LibraryIndex(str(tmp_path / "library.db"))
+    yield cache, index
+    cache.close()
+    index.close()
+
+@requires_ffmpeg
+def test_every_song_goes_through_each_stage_once(tmp_path, stores, monkeypatch):
+    cache, index = stores
+    titles = {"one.mp3": "Artist - First", "two.mp3": "Artist - Second Waltz",
+              "three.mp3": music_identify.RECOGNITION_FAILED}
+    songs = [{'url': f"https://example.com/{name}", 'name': f"Tango {name[:-4]}",
+              'path': make_tone(tmp_path / name, 2 + i, frequency=300 + 100 * i)}
+             for i, name in enumerate(titles)]
+    calls = collections.Counter()
+    lock = threading.Lock()
+
+    def recognize_cached(file_path, *args):
+        with lock:
+            calls[os.path.basename(file_path)] += 1
+        return file_path, titles[os.path.basename(file_path)]
+
+    monkeypatch.setattr(music_identify, "recognize_cached", recognize_cached)
+    renames = collections.Counter()
+    rename = cache.rename
+    monkeypatch.setattr(cache, "rename", lambda src, dst: renames.update([os.path.basename(src)]) or rename(src, dst))
+    limiter = music_identify.AdaptiveLimiter(maximum=4)
+
+    *stages, indexed = ingest.start_stages(["Tango", "Waltz"], index, cache, None, {}, "songrec", limiter,
+                                           identify_workers=4, analyse_workers=2, queue_size=1)
+    for song in songs:
+        stages[0].put(song)
+    for stage in stages:
+        stage.close()
+
+    assert calls == {name: 1 for name in titles}
+    # Only the recognised songs are renamed, and only once
+    assert renames == {"one.mp3": 1, "two.mp3": 1}
+    assert sum(stage.failed for stage in stages) == 0
+    assert sorted(os.path.basename(e['path']) for e in indexed) == ["Tango-Artist_-_First.mp3",
+                                                                    "Tango-Artist_-_Second_Waltz.mp3", "three.mp3"]
+    entries = {os.path.basename(e['path']): e for e in index.entries()}
+    assert len(entries) == 3
+    assert entries["three.mp3"]['title'] is None
+    assert entries["three.mp3"]['duration'] == pytest.approx(4, abs=0.1)
+    assert all(e['dance_type'] == "Tango" for e in entries.values())
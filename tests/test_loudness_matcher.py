@@ -0,0 +1,15 @@
+import pytest
+
+from loudness_matcher import gain_for
+
+TARGET, MAX_PEAK = -14.0, -1.0
+
+@pytest.mark.parametrize("integrated, true_peak, gain", [
+    (-20.0, -10.0, 6.0),    # quiet with headroom: all the way to the target
+    (-20.0, -4.0, 3.0),     # quiet, boost held back by the peak
+    (-20.0, 0.5, 0.0),      # quiet but already peaking over: never turned down
+    (-8.0, -2.0, -6.0),     # loud: down to the target
+    (-10.0, 6.0, -7.0),     # loud and clipping: down far enough for the peak
+])
+def test_gain_for(integrated, true_peak, gain):
+    assert gain_for({'integrated': integrated, 'true_peak': true_peak}, TARGET, MAX_PEAK) == pytest.approx(gain)
@@ -0,0 +1,38 @@
+import music_identify
+
+def scripted_songrec(monkeypatch, answers):
+    """Replaces recognize_single with one answering from `answers` in turn; returns the list of calls."""
+    calls = []
+
+    def recognize_single(file_path, cargo_path, timeout=music_identify.INITIAL_TIMEOUT):
+        calls.append(timeout)
+        return file_path, answers[len(calls) - 1]
+
+    monkeypatch.setattr(music_identify, "recognize_single", recognize_single)
+    # A short file, so it is sent whole in one excerpt
+    monkeypatch.setattr(music_identify, "probe_duration", lambda path: 30.0)
+    return calls
+
+def test_timeouts_are_retried_with_a_longer_timeout_and_slow_the_limiter(monkeypatch):
+    timed_out = music_identify.RECOGNITION_TIMED_OUT
+    calls = scripted_songrec(monkeypatch, [timed_out, timed_out, "Artist - Song"])
+    limiter = music_identify.AdaptiveLimiter(initial=8)
+
+    assert music_identify.recognize_file("song.mp3", "songrec", limiter) == ("song.mp3", "Artist - Song")
+    assert calls == [music_identify.INITIAL_TIMEOUT, 2 * music_identify.INITIAL_TIMEOUT, 4 * music_identify.INITIAL_TIMEOUT]
+    # Halved twice, then one step back up
+    assert 2 < limiter.limit < 3
+
+def test_other_errors_are_final_and_leave_the_limiter_alone(monkeypatch):
+    calls = scripted_songrec(monkeypatch, [music_identify.RECOGNITION_FAILED])
+    limiter = music_identify.AdaptiveLimiter(initial=8)
+
+    assert music_identify.recognize_file("song.mp3", "songrec", limiter) == ("song.mp3", music_identify.RECOGNITION_FAILED)
+    assert len(calls) == 1
+    assert limiter.limit == 8
+
+def test_a_timeout_on_every_try_is_reported_as_a_failure(monkeypatch):
+    scripted_songrec(monkeypatch, [music_identify.RECOGNITION_TIMED_OUT] * (music_identify.TIMEOUT_RETRIES + 1))
+
+    _, output = music_identify.recognize_file("song.mp3", "songrec", music_identify.AdaptiveLimiter())
+    assert output == music_identify.RECOGNITION_FAILED
@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+import recognition_cache
+from recognition_cache import RecognitionCache
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = RecognitionCache(str(tmp_path / "recognition.db"))
+    yield cache
+    cache.close()
+
+def test_results_are_found_by_content(tmp_path, cache):
+    (tmp_path / "a.mp3").write_bytes(b"song")
+    (tmp_path / "copy.mp3").write_bytes(b"song")
+    digest = cache.content_hash(str(tmp_path / "a.mp3"))
+
+    assert cache.lookup(digest) == (False, None)
+    cache.store(digest, "Artist - Song")
+    assert cache.lookup(cache.content_hash(str(tmp_path / "copy.mp3"))) == (True, "Artist - Song")
+
+def test_not_recognised_is_kept_until_its_retry_time(cache, monkeypatch):
+    cache.store("abc", None)
+    assert cache.lookup("abc") == (True, None)
+
+    later = time.time() + recognition_cache.UNRECOGNIZED_RETRY_SECONDS + 1
+    monkeypatch.setattr(recognition_cache.time, "time", lambda: later)
+    assert cache.lookup("abc") == (False, None)
+
+def test_a_renamed_file_keeps_its_remembered_hash(tmp_path, cache, monkeypatch):
+    src, dst = str(tmp_path / "a.mp3"), str(tmp_path / "Artist_-_Song.mp3")
+    (tmp_path / "a.mp3").write_bytes(b"song")
+    digest = cache.content_hash(src)
+
+    cache.rename(src, dst)
+    monkeypatch.setattr(recognition_cache, "file_hash", lambda path: pytest.fail("hashed again"))
+    assert cache.content_hash(dst) == digest
+
+def interrupted_rename(cache, monkeypatch, src, dst):
+    """Journals a rename, then dies (as if killed) before the file is moved."""
+    def killed(*args):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as m:
+        m.setattr(recognition_cache.os, "rename", killed)
+        with pytest.raises(KeyboardInterrupt):
+            cache.rename(src, dst)
+
+def journal(cache):
+    return dict(cache.conn.execute("SELECT dst, status FROM journal").fetchall())
+
+def test_recover_completes_or_reports_interrupted_renames(tmp_path, cache, monkeypatch, capsys):
+    names = {}
+    for name, content in [("moved", b"one"), ("same", b"two"), ("clash", b"three"), ("gone", b"four")]:
+        src, dst = tmp_path / f"{name}.mp3", tmp_path / f"{name}_renamed.mp3"
+        src.write_bytes(content)
+        interrupted_rename(cache, monkeypatch, str(src), str(dst))
+        names[name] = src, dst
+    # What was on disk when the next run started
+    names["same"][1].write_bytes(b"two")
+    names["clash"][1].write_bytes(b"someone else")
+    names["gone"][0].unlink()
+
+    assert cache.recover() == 2
+
+    src, dst = names["moved"]
+    assert not src.exists() and dst.read_bytes() == b"one"
+    src, dst = names["same"]
+    assert not src.exists() and dst.read_bytes() == b"two"
+    src, dst = names["clash"]
+    assert src.read_bytes() == b"three" and dst.read_bytes() == b"someone else"
+    assert "clash_renamed.mp3 already exists" in capsys.readouterr().out
+    assert {os.path.basename(d): s for d, s in journal(cache).items()} == {
+        "moved_renamed.mp3": "done", "same_renamed.mp3": "done",
+        "clash_renamed.mp3": "conflict", "gone_renamed.mp3": "abandoned"}
+    # Nothing is left pending for the next run
+    assert cache.recover() == 0
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import source_cache
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(source_cache, "SOURCES_DIR", str(tmp_path / "sources"))
+    return tmp_path / "sources"
+
+def fetch(name, size):
+    def download(tmp_dir):
+        with open(os.path.join(tmp_dir, name), "wb") as f:
+            f.write(os.urandom(size))
+    return download
+
+def test_a_cached_source_is_downloaded_once(cache_dir):
+    downloads = []
+
+    for _ in range(2):
+        with source_cache.cached_source("yt:abc", "best", lambda tmp: downloads.append(fetch("a.m4a", 100)(tmp))) as path:
+            assert open(path, "rb").read()
+    assert len(downloads) == 1
+
+def test_export_makes_an_independent_copy(cache_dir, tmp_path):
+    with source_cache.cached_source("yt:abc", "best", fetch("a.m4a", 1000)) as path:
+        output = source_cache.export(path, str(tmp_path / "out.m4a"))
+        cached = open(path, "rb").read()
+
+        assert open(output, "rb").read() == cached
+        assert os.stat(output).st_ino != os.stat(path).st_ino
+        with open(output, "r+b") as f:
+            f.write(b"edited")
+        assert open(path, "rb").read() == cached
+
+def test_eviction_removes_lock_files_with_their_entries(cache_dir):
+    for i in range(3):
+        with source_cache.cached_source(f"yt:{i}", "best", fetch("a.m4a", 1000)):
+            pass
+    # A download that produced nothing leaves only its lock file
+    with source_cache.cached_source("yt:none", "best", lambda tmp: None) as path:
+        assert path is None
+    keep = source_cache.cache_key("yt:2", "best")
+
+    source_cache.evict(max_bytes=1000, keep=keep)
+
+    assert sorted(os.listdir(cache_dir)) == [keep, f"{keep}.lock"]
+
+def test_an_entry_in_use_is_not_evicted(cache_dir):
+    with source_cache.cached_source("yt:busy", "best", fetch("a.m4a", 1000)):
+        source_cache.evict(max_bytes=0)
+        assert len(os.listdir(cache_dir)) == 2
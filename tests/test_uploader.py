@@ -0,0 +1,259 @@
+import functools
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import ffmpeg_duration, make_video, requires_ffmpeg
+from fake_youtube import FakeYouTube, client
+
+import uploader
+from job_history import JobHistory
+
+@pytest.fixture
+def server():
+    server = FakeYouTube()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def concat_list(path, clips):
+    with open(path, "w") as f:
+        f.writelines(f"file '{clip}'\n" for clip in clips)
+    return str(path)
+
+class PacedWriter(threading.Thread):
+    """Stands in for MergeWriter: appends `data` to `path` a piece at a time, slowly."""
+
+    def __init__(self, path, data, piece=100 * 1024, delay=0.02):
+        super().__init__(daemon=True)
+        self.path, self.data, self.piece, self.delay = str(path), data, piece, delay
+        self.written = 0
+        self.returncode = None
+        self.cond = threading.Condition()
+
+    def run(self):
+        with open(self.path, "wb") as f:
+            for start in range(0, len(self.data), self.piece):
+                time.sleep(self.delay)
+                f.write(self.data[start:start + self.piece])
+                f.flush()
+                with self.cond:
+                    self.written = f.tell()
+                    self.cond.notify_all()
+        with self.cond:
+            self.returncode = 0
+            self.cond.notify_all()
+
+    wait_for = uploader.MergeWriter.wait_for
+
+def test_growing_upload_sends_only_full_chunks_until_the_end(tmp_path, server):
+    data = os.urandom(5 * uploader.CHUNK_UNIT + 12345)
+    writer = PacedWriter(tmp_path / "merged.mp4", data)
+    writer.start()
+
+    video_id = uploader.upload_video(client(server), writer.path, "Party", "", "private",
+                                     media=uploader.GrowingFileUpload(writer, chunksize=uploader.CHUNK_UNIT))
+    writer.join()
+
+    assert server.videos[video_id] == data
+    # The first chunks go out while the size is still unknown, each one full
+    assert server.puts[0] == f"bytes 0-{uploader.CHUNK_UNIT - 1}/*"
+    assert server.puts[-1].endswith(f"/{len(data)}")
+    assert len(server.puts) == 6
+
+@requires_ffmpeg
+def test_merge_and_upload_sends_the_merged_file(tmp_path, server, monkeypatch):
+    clips = [make_video(tmp_path / f"clip{i}.mp4", 10, size="320x240") for i in range(3)]
+    monkeypatch.setattr(uploader, "GrowingFileUpload",
+                        functools.partial(uploader.GrowingFileUpload, chunksize=uploader.CHUNK_UNIT))
+    merged = tmp_path / "merged.mp4"
+
+    video_id = uploader.merge_and_upload(client(server), concat_list(tmp_path / "list.txt", clips), str(merged),
+                                         "Party", "", "private")
+
+    assert server.videos[video_id] == merged.read_bytes()
+    assert len(server.puts) > 1
+
+@requires_ffmpeg
+def test_a_failed_merge_is_never_completed_as_a_video(tmp_path, server):
+    clips = [make_video(tmp_path / "clip0.mp4", 2), str(tmp_path / "missing.mp4")]
+
+    video_id = uploader.merge_and_upload(client(server), concat_list(tmp_path / "list.txt", clips),
+                                         str(tmp_path / "merged.mp4"), "Party", "", "private")
+
+    assert video_id is None
+    # The upload was left unfinished
+    assert not server.videos
+
+@requires_ffmpeg
+def test_merge_videos_joins_the_clips(tmp_path):
+    clips = [make_video(tmp_path / f"clip{i}.mp4", 2) for i in range(2)]
+    merged = tmp_path / "merged.mp4"
+
+    assert uploader.merge_videos(concat_list(tmp_path / "list.txt", clips), str(merged))
+    assert ffmpeg_duration(merged) == pytest.approx(4, abs=0.2)
+
+@requires_ffmpeg
+def test_merge_videos_fails_when_a_clip_is_skipped(tmp_path):
+    clips = [make_video(tmp_path / "clip0.mp4", 2), str(tmp_path / "missing.mp4")]
+    merged = tmp_path / "merged.mp4"
+
+    assert not uploader.merge_videos(concat_list(tmp_path / "list.txt", clips), str(merged))
+    # Nothing is left behind for a later run to upload
+    assert not merged.exists()
+
+MB = 1024 * 1024
+
+def upload_request(youtube, path):
+    media = uploader.AdaptiveFileUpload(str(path))
+    return youtube.videos().insert(part="snippet,status", body={"snippet": {"title": "Party"}}, media_body=media)
+
+@pytest.mark.parametrize("sent, seconds, expected", [
+    (50 * MB, 1.0, 2 * MB),                 # fast: grows, but only 2x per chunk
+    (MB, 20.0, uploader.MIN_CHUNK_SIZE),    # slow: never below the minimum
+    (3 * MB, 15.0, 2 * MB),                 # 10 s at 0.2 MB/s, in whole CHUNK_UNITs
+    (0, 1.0, MB),                           # nothing measured: unchanged
+])
+def test_chunks_are_sized_to_the_throughput(tmp_path, sent, seconds, expected):
+    path = tmp_path / "mix.mp4"
+    path.write_bytes(b"x")
+    media = uploader.AdaptiveFileUpload(str(path), chunksize=MB)
+
+    media.tune(sent, seconds)
+    assert media.chunksize() == expected
+
+@pytest.mark.parametrize("committed, finished, expected", [
+    (0, False, (0, None)),                              # 308 with no Range: nothing yet
+    (3000, False, (3000, None)),                        # 308 with "Range: bytes=0-2999"
+    (10000, True, (10000, {"id": "vid-done"})),         # 200: it had actually finished
+])
+def test_query_upload_offset(tmp_path, server, committed, finished, expected):
+    path = tmp_path / "mix.mp4"
+    path.write_bytes(b"x" * 10000)
+    server.sessions["s"] = {"title": "Party", "data": bytearray(committed), "video": "vid-done" if finished else None}
+
+    request = upload_request(client(server), path)
+    assert uploader.query_upload_offset(request, f"{server.url}/session/s", 10000) == expected
+    assert server.puts == ["bytes */10000"]
+
+def test_query_upload_offset_of_an_expired_session(tmp_path, server):
+    path = tmp_path / "mix.mp4"
+    path.write_bytes(b"x" * 10000)
+    request = upload_request(client(server), path)
+    assert uploader.query_upload_offset(request, f"{server.url}/session/gone", 10000) == (None, None)
+
+def interrupt_after(monkeypatch, saves):
+    """Makes upload_video die (as if killed) once it has saved its session `saves` times."""
+    save = uploader.save_upload_session
+    count = []
+
+    def save_then_die(file_path, session):
+        save(file_path, session)
+        if session is not None:
+            count.append(session)
+            if len(count) == saves:
+                raise KeyboardInterrupt
+
+    monkeypatch.setattr(uploader, "save_upload_session", save_then_die)
+
+def test_an_interrupted_upload_resumes_where_it_stopped(tmp_path, server, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(5 * uploader.MIN_CHUNK_SIZE + 12345)
+    (tmp_path / "mix.mp4").write_bytes(data)
+
+    with monkeypatch.context() as m:
+        interrupt_after(m, 2)
+        with pytest.raises(KeyboardInterrupt):
+            uploader.upload_video(client(server), "mix.mp4", "Party", "", "private")
+    committed = len(server.sessions["0"]["data"])
+    assert 0 < committed < len(data)
+    assert os.path.exists(uploader.UPLOAD_STATE_FILE)
+
+    server.puts.clear()
+    video_id = uploader.upload_video(client(server), "mix.mp4", "Party", "", "private")
+
+    assert server.videos[video_id] == data
+    assert len(server.sessions) == 1
+    # Asked where it stood, then carried on from there
+    assert server.puts[0] == f"bytes */{len(data)}"
+    assert server.puts[1].startswith(f"bytes {committed}-")
+    assert not os.path.exists(uploader.UPLOAD_STATE_FILE)
+
+def test_an_expired_session_starts_over(tmp_path, server, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = os.urandom(3 * uploader.MIN_CHUNK_SIZE)
+    (tmp_path / "mix.mp4").write_bytes(data)
+
+    with monkeypatch.context() as m:
+        interrupt_after(m, 1)
+        with pytest.raises(KeyboardInterrupt):
+            uploader.upload_video(client(server), "mix.mp4", "Party", "", "private")
+    server.sessions.pop("0")
+
+    video_id = uploader.upload_video(client(server), "mix.mp4", "Party", "", "private")
+
+    assert server.videos[video_id] == data
+    assert list(server.sessions) == ["1"]
+    assert not os.path.exists(uploader.UPLOAD_STATE_FILE)
+
+@pytest.fixture
+def history(tmp_path):
+    history = JobHistory(str(tmp_path / "history.db"), legacy_log=None)
+    yield history
+    history.close()
+
+def test_videos_are_added_to_the_playlist_in_order(server, history):
+    server.playlists["PL"] = ["old-1", "old-2"]
+    videos = [f"v{i}" for i in range(7)]
+    # Shuffled batches append in the wrong order, and one insert fails outright
+    server.reject_once = {"v3"}
+
+    failed = uploader.add_videos_to_playlist(client(server), videos, "PL", history, batch_size=3)
+
+    assert failed == 0
+    assert server.playlists["PL"] == ["old-1", "old-2"] + videos
+    # One insert per video, plus the retry; nothing refused for its position
+    assert len(server.inserts) == len(videos) + 1
+    assert [p for _, p in server.inserts] == [None] * len(videos) + [2 + videos.index("v3")]
+    # Only the videos that landed out of order were moved
+    assert 0 < len(server.moves) < len(videos)
+    assert all(f"uploader_playlist|PL|{v}" in history for v in videos)
+
+def test_videos_already_in_the_playlist_are_not_added_again(server, history):
+    server.playlists["PL"] = []
+    uploader.add_videos_to_playlist(client(server), ["v0", "v1"], "PL", history)
+    server.inserts.clear()
+
+    failed = uploader.add_videos_to_playlist(client(server), ["v0", "v1", "v2"], "PL", history)
+
+    assert failed == 0
+    assert server.playlists["PL"] == ["v0", "v1", "v2"]
+    assert server.inserts == [("v2", None)]
+
+def test_a_video_that_cannot_be_added_is_counted(server, history):
+    server.playlists["PL"] = []
+    server.reject_always = {"v1"}
+
+    failed = uploader.add_videos_to_playlist(client(server), ["v0", "v1", "v2"], "PL", history)
+
+    assert failed == 1
+    assert server.playlists["PL"] == ["v0", "v2"]
+    assert "uploader_playlist|PL|v1" not in history
+
+def test_upload_tracks_skips_clips_uploaded_before(tmp_path, server, history, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    clips = []
+    for i in range(3):
+        path = tmp_path / f"{i:02d}_clip.mp4"
+        path.write_bytes(os.urandom(1000 + i))
+        clips.append((str(path), f"Clip {i}", ""))
+
+    first = uploader.upload_tracks(lambda: client(server), clips, "private", history, workers=2)
+    again = uploader.upload_tracks(lambda: client(server), clips, "private", history, workers=2)
+
+    assert [server.videos[v] for v in first] == [open(path, "rb").read() for path, _, _ in clips]
+    assert again == first
+    assert len(server.sessions) == 3
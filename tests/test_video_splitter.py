@@ -0,0 +1,75 @@
+import wave
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+
+import chapter_splitter
+import video_splitter
+from conftest import requires_ffmpeg, requires_ffprobe, make_tone
+
+pytestmark = [requires_ffmpeg, requires_ffprobe]
+
+def split_audio(source, tmp_path):
+    chapters = [{'start_time': 0, 'end_time': 3.37, 'title': 'One'},
+                {'start_time': 3.37, 'end_time': 7.81, 'title': 'Two'}]
+    return video_splitter.split_source(source, {}, chapters, True, "native", None, str(tmp_path),
+                                       False, 2000, -40, False, 2, False)
+
+def test_mp3_clips_are_re_encoded_to_start_on_a_clean_frame(tmp_path, monkeypatch):
+    source = make_tone(tmp_path / "source.mp3", 10)
+    calls = []
+    real = video_splitter.split_chapters
+    monkeypatch.setattr(video_splitter, "split_chapters", lambda *a, **k: calls.append(a) or real(*a, **k))
+
+    outputs = split_audio(source, tmp_path)
+    assert [o.rsplit("/", 1)[1] for o in outputs] == ["01_One.mp3", "02_Two.mp3"]
+    assert calls[0][2] == video_splitter.MP3_CODEC_ARGS
+    for output in outputs:
+        with open(output, "rb") as f:
+            head = f.read(3)
+        # ID3 tag or an MP3 frame sync word, never the middle of a frame
+        assert head == b"ID3" or (head[0] == 0xFF and head[1] & 0xE0 == 0xE0)
+        assert chapter_splitter.decode_errors(output) == []
+
+def test_aac_clips_are_stream_copied(tmp_path):
+    source = make_tone(tmp_path / "source.m4a", 10)
+    outputs = split_audio(source, tmp_path)
+    assert [o.rsplit("/", 1)[1] for o in outputs] == ["01_One.m4a", "02_Two.m4a"]
+
+RATE = video_splitter.SILENCE_SAMPLE_RATE
+
+def tone(seconds):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+def quiet(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.int16)
+
+@pytest.mark.parametrize("block_seconds", [video_splitter.SILENCE_BLOCK_SECONDS, 1])
+def test_silence_chapters_agree_with_pydub(tmp_path, monkeypatch, block_seconds):
+    monkeypatch.setattr(video_splitter, "SILENCE_BLOCK_SECONDS", block_seconds)
+    # The second pause runs across the first 30 s block boundary, and the
+    # third has a click short enough for every window over it to stay silent
+    pcm = np.concatenate([tone(20), quiet(3), tone(5.5), quiet(3.5), tone(10),
+                          quiet(2.5), tone(0.005), quiet(2.5), tone(8)])
+    path = tmp_path / "mix.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(pcm.tobytes())
+
+    segment = AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=RATE, channels=1)
+    expected = detect_silence(segment, min_silence_len=2000, silence_thresh=-40)
+    chapters = list(video_splitter.iter_silence_chapters(str(path), 2000, -40, min_track_s=1))
+
+    assert len(expected) == 3
+    assert len(chapters) == len(expected) + 1
+    gaps = [(a['end_time'] * 1000, b['start_time'] * 1000) for a, b in zip(chapters, chapters[1:])]
+    for (start, end), (pydub_start, pydub_end) in zip(gaps, expected):
+        # Windows slide in SILENCE_FRAME_MS steps here, 1 ms in pydub
+        assert abs(start - pydub_start) <= video_splitter.SILENCE_FRAME_MS
+        assert abs(end - pydub_end) <= video_splitter.SILENCE_FRAME_MS
+    assert chapters[-1]['end_time'] == len(pcm) / RATE
@@ -1,19 +1,59 @@
 import os
 import datetime
 import argparse
+import bisect
+import json
 import subprocess
+import time
 import google_auth_oauthlib.flow
 import googleapiclient.discovery
 import googleapiclient.errors
 import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaUpload
+
+from job_history import JobHistory
+from media_probe import exact_durations
 
 # --- CONSTANTS ---
 CLIENT_SECRETS_FILE = "client_secrets.json"
 SCOPES = ["https://www.googleapis.com/auth/youtube", "https://www.googleapis.com/auth/youtube.upload"]
 FFMPEG_LIST_FILE = "ffmpeg_list.txt"
+# --pipeline: the merge is written as fragmented MP4 (no index to go back and
+# fill in at the end), so every byte is final once written and can be sent
+# while the rest is still being merged.
+FRAGMENTED_MP4_FLAGS = ["-movflags", "+frag_keyframe+empty_moov+default_base_moof"]
+# The concat demuxer skips a clip it can't open or read and still exits 0
+MERGE_INPUT_ERRORS = re.compile(r"Impossible to open|Error during demuxing")
+MERGE_READ_SIZE = 1024 * 1024
+# Bigger chunks mean fewer round trips; must be a multiple of 256 KB
+PIPELINE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# --- RESUMABLE UPLOADS ---
+# Upload sessions in progress, so a rerun after a crash carries on where the
+# server says it got to instead of starting over
+UPLOAD_STATE_FILE = "upload_state.json"
+# Chunk size follows measured throughput, aiming for about this long per chunk:
+# long enough that round trips don't dominate, short enough that a dropped
+# connection loses little.
+TARGET_CHUNK_SECONDS = 10
+CHUNK_UNIT = 256 * 1024  # the API requires multiples of this
+MIN_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 128 * 1024 * 1024
+UPLOAD_RETRIES = 3
+
+# --- PER-TRACK MODE ---
+# Each upload mostly waits on the network, but they share one connection
+# and one daily quota, so only a few at a time
+DEFAULT_UPLOAD_WORKERS = 3
+# Playlist inserts sent per batch request
+PLAYLIST_BATCH_SIZE = 50
+# YouTube's limit on video titles
+MAX_TITLE_LENGTH = 100
 
 def parse_args():
     today = datetime.date.today().strftime('%Y-%m-%d')
@@ -35,41 +75,59 @@ def parse_args():
     parser.add_argument("--privacy", choices=['private', 'unlisted', 'public'], default='unlisted',
                         help="Privacy level (default: unlisted)")
 
-    return parser.parse_args()
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--pipeline", action="store_true",
+                      help="Start uploading while the merge is still being written, instead of after it")
+    mode.add_argument("--per-track", action="store_true",
+                      help="Upload every clip as its own video instead of one merged mix")
 
-def get_video_duration(file_path):
-    """Returns duration in seconds using ffprobe."""
-    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", 
-           "-of", "default=noprint_wrappers=1:nokey=1", file_path]
-    try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        return float(result.stdout)
-    except:
-        return 0.0
+    parser.add_argument("--workers", "-w", type=int, default=DEFAULT_UPLOAD_WORKERS,
+                        help="Clips to upload at the same time (--per-track)")
 
-def generate_merge_assets(input_folder):
-    """
-    1. Scans folder for MP4s.
-    2. Creates ffmpeg_list.txt for merging.
-    3. Generates Chapter Timestamps for description.
-    """
+    return parser.parse_args()
+
+def find_clips(input_folder):
+    """The folder's MP4s in playlist order (by their 01_, 02_ prefix), or None if there are none."""
     if not os.path.exists(input_folder):
         print(f"❌ Error: Input folder '{input_folder}' not found.")
-        return None, None
+        return None
 
     files = sorted([f for f in os.listdir(input_folder) if f.endswith(".mp4")])
     if not files:
         print(f"❌ Error: No MP4 files found in '{input_folder}'.")
-        return None, None
+        return None
     
     # Sort by number prefix (01_, 02_)
     files.sort(key=lambda x: int(x.split('_')[0]) if '_' in x else x)
+    return files
+
+def clean_clip_name(filename):
+    # Example: "03_Slow_Waltz_Moon_River.mp4" -> "Slow Waltz Moon River"
+    name_part = os.path.splitext(filename)[0]
+    if '_' in name_part:
+        parts = name_part.split('_', 1)
+        return parts[1].replace('_', ' ') if len(parts) > 1 else name_part
+    return name_part
+
+def generate_merge_assets(input_folder):
+    """
+    1. Scans folder for MP4s.
+    2. Creates ffmpeg_list.txt for merging.
+    3. Generates Chapter Timestamps for description.
+    """
+    files = find_clips(input_folder)
+    if not files:
+        return None, None
     
     print(f"   Found {len(files)} clips to merge.")
 
     chapter_desc = "Auto-generated Dance Playlist.\n\n⏱️ CHAPTERS:\n"
-    current_seconds = 0.0
+    # Kept as an exact fraction, so a long mix's chapters don't drift from rounding
+    current_seconds = 0
     
+    # Read from the MP4 headers, all clips at once
+    durations = exact_durations(os.path.join(input_folder, f) for f in files)
+
     with open(FFMPEG_LIST_FILE, "w") as f:
         for filename in files:
             file_path = os.path.join(input_folder, filename)
@@ -84,43 +142,222 @@ def generate_merge_assets(input_folder):
             time_str = f"{h:02d}:{m:02d}:{s:02d}" if h > 0 else f"{m:02d}:{s:02d}"
             
             # 3. Clean Name
-            name_part = os.path.splitext(filename)[0]
-            if '_' in name_part:
-                parts = name_part.split('_', 1)
-                clean_name = parts[1].replace('_', ' ') if len(parts) > 1 else name_part
-            else:
-                clean_name = name_part
-                
-            chapter_desc += f"{time_str} {clean_name}\n"
+            chapter_desc += f"{time_str} {clean_clip_name(filename)}\n"
             
             # 4. Add duration
-            current_seconds += get_video_duration(file_path)
+            current_seconds += durations[file_path]
 
     return FFMPEG_LIST_FILE, chapter_desc
 
+def merge_succeeded(returncode, errors):
+    """True if the merge ffmpeg exited 0 without skipping any input (`errors` is its stderr)."""
+    return returncode == 0 and not MERGE_INPUT_ERRORS.search(errors)
+
 def merge_videos(list_file, output_filename):
     print(f"⏳ Merging videos into '{output_filename}'...")
     if os.path.exists(output_filename):
         os.remove(output_filename)
 
     cmd = [
-        "ffmpeg", "-y", 
+        "ffmpeg", "-y", "-v", "error",
         "-fflags", "+genpts",
         "-f", "concat", "-safe", "0",
         "-i", list_file,
         "-c", "copy",
         output_filename
     ]
-    subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    
-    if os.path.exists(output_filename):
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    errors = result.stderr.decode("utf-8", "replace")
+
+    if merge_succeeded(result.returncode, errors) and os.path.exists(output_filename):
         print(f"   ✅ Merge Success!")
         return True
     else:
         print("   ❌ Merge Failed.")
+        if errors.strip():
+            print(f"      {errors.strip().splitlines()[0]}")
+        # An incomplete merge must not be uploaded (or resumed) later
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+        return False
+
+class MergeWriter(threading.Thread):
+    """
+    Runs the merge as fragmented MP4 into a pipe and appends it to the
+    output file as it arrives, keeping count of the bytes on disk so an
+    upload can follow right behind.
+    """
+
+    def __init__(self, list_file, output_filename):
+        super().__init__(daemon=True)
+        self.list_file = list_file
+        self.path = output_filename
+        self.written = 0
+        self.returncode = None
+        self.cond = threading.Condition()
+
+    def run(self):
+        cmd = [
+            "ffmpeg", "-v", "error",
+            "-fflags", "+genpts",
+            "-f", "concat", "-safe", "0",
+            "-i", self.list_file,
+            "-c", "copy",
+            *FRAGMENTED_MP4_FLAGS,
+            "-f", "mp4", "pipe:1"
+        ]
+        self.cmd = cmd
+        returncode = 1
+        try:
+            with tempfile.TemporaryFile() as errors:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+                with open(self.path, "wb") as f:
+                    while chunk := proc.stdout.read(MERGE_READ_SIZE):
+                        f.write(chunk)
+                        f.flush()
+                        with self.cond:
+                            self.written += len(chunk)
+                            self.cond.notify_all()
+                returncode = proc.wait()
+                errors.seek(0)
+                if not merge_succeeded(returncode, errors.read().decode("utf-8", "replace")):
+                    returncode = returncode or 1
+        finally:
+            with self.cond:
+                self.returncode = returncode
+                self.cond.notify_all()
+
+    def wait_for(self, size):
+        """
+        Blocks until more than `size` bytes are on disk or the merge has
+        ended. Returns (bytes written, finished); raises if the merge failed.
+        """
+        with self.cond:
+            while self.returncode is None and self.written <= size:
+                self.cond.wait()
+            if self.returncode not in (None, 0):
+                raise subprocess.CalledProcessError(self.returncode, self.cmd)
+            return self.written, self.returncode is not None
+
+class GrowingFileUpload(MediaUpload):
+    """
+    Resumable upload of a file that MergeWriter is still writing.
+
+    The total size is reported as unknown until the merge ends, and each
+    chunk is only handed out once the file has grown past it, so no chunk is
+    sent short - the client library takes a short chunk to mean the end.
+    """
+
+    def __init__(self, writer, chunksize=PIPELINE_CHUNK_SIZE, mimetype="video/mp4"):
+        super().__init__()
+        self.writer = writer
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+        self.position = 0
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
         return False
 
-def get_authenticated_service():
+    def size(self):
+        # Called before every chunk, so this is where the upload waits for the merge
+        written, finished = self.writer.wait_for(self.position + self._chunksize)
+        return written if finished else None
+
+    def getbytes(self, begin, length):
+        with open(self.writer.path, "rb") as f:
+            f.seek(begin)
+            data = f.read(length)
+        self.position = begin + len(data)
+        return data
+
+class AdaptiveFileUpload(MediaFileUpload):
+    """MediaFileUpload whose chunk size is retuned between chunks from the measured throughput."""
+
+    def __init__(self, file_path, chunksize=MIN_CHUNK_SIZE):
+        super().__init__(file_path, mimetype="video/mp4", chunksize=chunksize, resumable=True)
+        self.next_chunksize = chunksize
+
+    def chunksize(self):
+        return self.next_chunksize
+
+    def tune(self, sent, seconds):
+        """Sizes the next chunk to take about TARGET_CHUNK_SECONDS at the throughput just measured."""
+        if sent <= 0 or seconds <= 0:
+            return
+        target = sent / seconds * TARGET_CHUNK_SECONDS
+        # Grow at most 2x per chunk, so one fast chunk doesn't overshoot
+        target = min(target, self.next_chunksize * 2)
+        self.next_chunksize = int(min(MAX_CHUNK_SIZE, max(MIN_CHUNK_SIZE, target)) // CHUNK_UNIT * CHUNK_UNIT)
+
+def load_upload_sessions():
+    if not os.path.exists(UPLOAD_STATE_FILE):
+        return {}
+    try:
+        with open(UPLOAD_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_state_lock = threading.Lock()
+
+def save_upload_session(file_path, session):
+    """Records (or with session=None, forgets) the upload session for a file. Written atomically."""
+    with _state_lock:
+        _save_upload_session(file_path, session)
+
+def _save_upload_session(file_path, session):
+    sessions = load_upload_sessions()
+    key = os.path.abspath(file_path)
+    if session is None:
+        if key not in sessions:
+            return
+        sessions.pop(key)
+        if not sessions:
+            os.remove(UPLOAD_STATE_FILE)
+            return
+    else:
+        sessions[key] = session
+    tmp = UPLOAD_STATE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(sessions, f, indent=2)
+    os.replace(tmp, UPLOAD_STATE_FILE)
+
+def find_upload_session(file_path):
+    """The saved session for this exact file (same size and mtime), or None."""
+    session = load_upload_sessions().get(os.path.abspath(file_path))
+    if not session or not os.path.exists(file_path):
+        return None
+    st = os.stat(file_path)
+    if session.get("size") != st.st_size or session.get("mtime") != st.st_mtime:
+        return None
+    return session
+
+def query_upload_offset(request, session_uri, total_size):
+    """
+    Asks the server how much of an interrupted upload it has committed.
+    Returns (offset, response body if the upload had actually finished),
+    or (None, None) if the session has expired.
+    """
+    headers = {"Content-Range": f"bytes */{total_size}", "Content-Length": "0"}
+    resp, content = request.http.request(session_uri, "PUT", headers=headers)
+    if resp.status in (200, 201):
+        return total_size, json.loads(content)
+    if resp.status == 308:
+        # "Range: bytes=0-N" is what it has; no header means nothing yet
+        committed = resp.get("range")
+        return (int(committed.split("-")[1]) + 1 if committed else 0), None
+    return None, None
+
+def get_credentials():
     creds = None
     if os.path.exists("token.json"):
         try:
@@ -146,7 +383,10 @@ def get_authenticated_service():
         with open("token.json", "w") as token:
             token.write(creds.to_json())
 
-    return googleapiclient.discovery.build("youtube", "v3", credentials=creds)
+    return creds
+
+def get_authenticated_service(creds=None):
+    return googleapiclient.discovery.build("youtube", "v3", credentials=creds or get_credentials())
 
 def get_or_create_playlist(youtube, title, privacy_status):
     print(f"🔍 Checking Playlist: '{title}'...")
@@ -172,8 +412,14 @@ def get_or_create_playlist(youtube, title, privacy_status):
     print(f"   ✅ Created (ID: {response['id']})")
     return response["id"]
 
-def upload_video(youtube, file_path, title, description, privacy_status):
-    print(f"🚀 Uploading '{title}' (Privacy: {privacy_status})...")
+def upload_video(youtube, file_path, title, description, privacy_status, media=None, verbose=True):
+    """
+    Uploads the file (or `media`, e.g. a GrowingFileUpload) and returns the
+    video ID. verbose=False prints nothing, for when several uploads share
+    the terminal.
+    """
+    if verbose:
+        print(f"🚀 Uploading '{title}' (Privacy: {privacy_status})...")
     
     body = {
         "snippet": {
@@ -188,22 +434,82 @@ def upload_video(youtube, file_path, title, description, privacy_status):
         }
     }
 
-    media = MediaFileUpload(file_path, chunksize=1024*1024, resumable=True)
+    # A plain file upload can be resumed by a later run and has its chunk size
+    # tuned; a growing file can't be resumed, since the merge that feeds it
+    # would start again from scratch, and its chunks are paced by the merge.
+    persist = media is None
+    if media is None:
+        media = AdaptiveFileUpload(file_path)
     request = youtube.videos().insert(part="snippet,status", body=body, media_body=media)
 
     response = None
+    session = find_upload_session(file_path) if persist else None
+    if session:
+        offset, response = query_upload_offset(request, session["uri"], media.size())
+        if offset is None:
+            if verbose:
+                print("   ⚠️ The earlier upload session has expired, starting over.")
+            save_upload_session(file_path, None)
+        else:
+            if verbose:
+                print(f"   ↩️  Resuming the earlier upload: {offset / 1e6:.0f} of {media.size() / 1e6:.0f} MB already on YouTube.")
+            request.resumable_uri = session["uri"]
+            request.resumable_progress = offset
+
     last_progress = 0
+    counting = False
     while response is None:
-        status, response = request.next_chunk()
-        if status:
-            progress = int(status.progress() * 100)
-            if progress > last_progress:
-                print(f"   Uploading... {progress}%")
-                last_progress = progress
+        started, sent_before = time.monotonic(), request.resumable_progress
+        status, response = request.next_chunk(num_retries=UPLOAD_RETRIES)
+        if persist and response is None and request.resumable_uri:
+            media.tune(request.resumable_progress - sent_before, time.monotonic() - started)
+            st = os.stat(file_path)
+            save_upload_session(file_path, {"uri": request.resumable_uri, "offset": request.resumable_progress,
+                                            "size": st.st_size, "mtime": st.st_mtime, "title": title})
+        if not verbose:
+            continue
+        if status and status.total_size:
+            percent = int(status.progress() * 100)
+            if percent > last_progress:
+                if counting:
+                    print()
+                    counting = False
+                print(f"   Uploading... {percent}% ({media.chunksize() // (1024 * 1024)} MB chunks)")
+                last_progress = percent
+        elif status:
+            # Still merging, so the total isn't known yet
+            print(f"   Uploading... {status.resumable_progress / 1e6:.0f} MB sent", end="\r", flush=True)
+            counting = True
+    if counting:
+        print()
+    if persist:
+        save_upload_session(file_path, None)
                 
-    print(f"   🎉 Upload Complete! Video ID: {response['id']}")
+    if verbose:
+        print(f"   🎉 Upload Complete! Video ID: {response['id']}")
     return response['id']
 
+def merge_and_upload(youtube, list_file, output_filename, title, description, privacy_status):
+    """
+    Merges and uploads at the same time: the upload follows the merge through
+    the file, so the total time is about whichever of the two is slower.
+    Returns the video ID, or None if the merge failed (the unfinished upload
+    is abandoned, never completed with a broken file).
+    """
+    print(f"⏳ Merging videos into '{output_filename}' while uploading...")
+    writer = MergeWriter(list_file, output_filename)
+    writer.start()
+    try:
+        video_id = upload_video(youtube, output_filename, title, description, privacy_status,
+                                media=GrowingFileUpload(writer))
+    except subprocess.CalledProcessError:
+        print("   ❌ Merge Failed.")
+        return None
+    finally:
+        writer.join()
+    print(f"   ✅ Merge Success! ({writer.written / 1e6:.0f} MB)")
+    return video_id
+
 def add_video_to_playlist(youtube, video_id, playlist_id):
     print(f"🔗 Adding to playlist...")
     body = {
@@ -218,6 +524,195 @@ def add_video_to_playlist(youtube, video_id, playlist_id):
     except Exception as e:
         print(f"   ⚠️ Failed to add to playlist: {e}")
 
+def upload_job_id(file_path):
+    # A clip that is re-rendered (new size or mtime) is uploaded again
+    st = os.stat(file_path)
+    return f"uploader|{os.path.abspath(file_path)}|{st.st_size}|{st.st_mtime}"
+
+def upload_tracks(make_service, clips, privacy_status, history, workers=DEFAULT_UPLOAD_WORKERS):
+    """
+    Uploads each (file_path, title, description) as its own video, `workers`
+    at a time. Each worker thread gets its own client from `make_service()`,
+    as the API client's connection can't be shared between threads.
+
+    Clips uploaded by an earlier run (per `history`) are not uploaded again.
+    Returns the video IDs in clip order, None for clips that failed.
+    """
+    local = threading.local()
+    print_lock = threading.Lock()
+
+    def report(line):
+        with print_lock:
+            print(line)
+
+    def upload(clip):
+        file_path, title, description = clip
+        name = os.path.basename(file_path)
+        job_id = upload_job_id(file_path)
+        if job_id in history:
+            report(f"   ⏭️  {name} (already uploaded)")
+            return history.get(job_id)["outputs"][0]
+        if not hasattr(local, "youtube"):
+            local.youtube = make_service()
+        history.start(job_id, "uploader", {"title": title, "privacy": privacy_status})
+        started = time.time()
+        try:
+            video_id = upload_video(local.youtube, file_path, title, description, privacy_status, verbose=False)
+        except Exception as e:
+            history.finish(job_id, status="failed")
+            report(f"   ❌ {name}: {e}")
+            return None
+        history.finish(job_id, [video_id])
+        report(f"   ✅ {name} -> https://youtu.be/{video_id} ({time.time() - started:.0f}s)")
+        return video_id
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(upload, clips))
+
+def playlist_length(youtube, playlist_id):
+    response = youtube.playlists().list(part="contentDetails", id=playlist_id).execute()
+    items = response.get("items", [])
+    return items[0]["contentDetails"]["itemCount"] if items else 0
+
+def out_of_order(ranks):
+    """
+    Indexes of `ranks` outside one longest increasing run through it: the
+    fewest items to move to put the rest in order.
+    """
+    # Patience sorting: tails[k] ends the best run of length k + 1 found so far
+    tails, tail_ranks, links = [], [], [None] * len(ranks)
+    for i, rank in enumerate(ranks):
+        k = bisect.bisect_left(tail_ranks, rank)
+        links[i] = tails[k - 1] if k else None
+        tails[k:k + 1] = [i]
+        tail_ranks[k:k + 1] = [rank]
+    keep = set()
+    i = tails[-1] if tails else None
+    while i is not None:
+        keep.add(i)
+        i = links[i]
+    return [i for i in range(len(ranks)) if i not in keep]
+
+def add_videos_to_playlist(youtube, video_ids, playlist_id, history, batch_size=PLAYLIST_BATCH_SIZE):
+    """
+    Appends the videos to the playlist in the order given, up to `batch_size`
+    inserts per batch request instead of one request each. Videos `history`
+    already has in this playlist are left out.
+
+    The calls in a batch may run in any order, so each insert just appends
+    and its response says where it landed. Afterwards only the videos that
+    landed out of order are moved, and any inserts that failed are retried
+    one at a time straight into their place. Returns the number of videos
+    that couldn't be added.
+    """
+    pending = [v for v in video_ids if f"uploader_playlist|{playlist_id}|{v}" not in history]
+    if not pending:
+        return 0
+    print(f"🔗 Adding {len(pending)} videos to the playlist...")
+    base = playlist_length(youtube, playlist_id)
+    item_ids = {}
+    landed = {}     # video id -> position its insert reported
+    errors = {}
+
+    def snippet(video_id, position=None):
+        body = {"playlistId": playlist_id, "resourceId": {"kind": "youtube#video", "videoId": video_id}}
+        if position is not None:
+            body["position"] = position
+        return body
+
+    def inserted(request_id, response, exception):
+        video_id = pending[int(request_id)]
+        if exception is not None:
+            errors[video_id] = exception
+            return
+        item_ids[video_id] = response["id"]
+        landed[video_id] = response["snippet"]["position"]
+        job_id = f"uploader_playlist|{playlist_id}|{video_id}"
+        history.start(job_id, "uploader", {"playlist": playlist_id})
+        history.finish(job_id, [response["id"]])
+
+    for start in range(0, len(pending), batch_size):
+        batch = youtube.new_batch_http_request(callback=inserted)
+        for i, video_id in enumerate(pending[start:start + batch_size]):
+            batch.add(youtube.playlistItems().insert(part="snippet", body={"snippet": snippet(video_id)}),
+                      request_id=str(start + i))
+        try:
+            batch.execute()
+        except googleapiclient.errors.HttpError as e:
+            for video_id in pending[start:start + batch_size]:
+                errors.setdefault(video_id, e)
+
+    # The added videos in the order they landed, after the `base` already there
+    order = sorted(landed, key=landed.get)
+    rank = {v: i for i, v in enumerate(pending)}
+
+    def place(others, video_id):
+        """Index in `others` right after the nearest video that comes before `video_id` in `pending`."""
+        before = [j for j, v in enumerate(others) if rank[v] < rank[video_id]]
+        return before[-1] + 1 if before else 0
+
+    # Moves and retries go one at a time, each to a position that exists by
+    # then. Taken in the order given, each misplaced video goes right after
+    # the one before it, which is already in place.
+    misplaced = [order[i] for i in out_of_order([rank[v] for v in order])]
+    for video_id in sorted(misplaced, key=rank.get):
+        others = [v for v in order if v != video_id]
+        index = place(others, video_id)
+        body = {"id": item_ids[video_id], "snippet": snippet(video_id, base + index)}
+        try:
+            youtube.playlistItems().update(part="snippet", body=body).execute()
+        except googleapiclient.errors.HttpError as e:
+            print(f"   ⚠️ Could not move {video_id} into place in the playlist: {e}")
+            continue
+        order = others[:index] + [video_id] + others[index:]
+
+    failed = 0
+    for i, video_id in enumerate(pending):
+        if video_id in item_ids:
+            continue
+        index = place(order, video_id)
+        try:
+            request = youtube.playlistItems().insert(part="snippet", body={"snippet": snippet(video_id, base + index)})
+            inserted(str(i), request.execute(), None)
+            order.insert(index, video_id)
+        except googleapiclient.errors.HttpError as e:
+            failed += 1
+            print(f"   ⚠️ Failed to add {video_id} to playlist: {e}")
+    print(f"   ✅ Done! ({len(pending) - failed} added)")
+    return failed
+
+def upload_per_track(args):
+    """--per-track: every clip in the folder as its own video, added to the playlist in order."""
+    files = find_clips(args.folder)
+    if not files: return
+    clips = [(os.path.join(args.folder, f),
+              f"{clean_clip_name(f)} | {args.title}"[:MAX_TITLE_LENGTH],
+              f"{clean_clip_name(f)}\n\nFrom {args.title}.")
+             for f in files]
+
+    try:
+        print("🔐 Authenticating with YouTube...")
+        creds = get_credentials()
+        youtube = get_authenticated_service(creds)
+    except Exception as e:
+        print(f"❌ Auth Error: {e}")
+        return
+
+    history = JobHistory()
+    print(f"🚀 Uploading {len(clips)} clips ({args.workers} at a time)...")
+    video_ids = upload_tracks(lambda: get_authenticated_service(creds), clips, args.privacy, history, args.workers)
+    uploaded = [v for v in video_ids if v]
+
+    playlist_id = get_or_create_playlist(youtube, args.playlist, args.privacy)
+    failed = add_videos_to_playlist(youtube, uploaded, playlist_id, history)
+    history.close()
+
+    print("\n" + "="*50)
+    print(f"✨ {len(uploaded)} of {len(clips)} clips uploaded. Playlist: https://www.youtube.com/playlist?list={playlist_id}")
+    if len(uploaded) < len(clips) or failed:
+        print("   Run the same command again to retry the rest; finished clips are skipped.")
+    print("="*50)
+
 def reformat_stats_for_youtube(stats_text):
     """
     Parses the space-aligned statistics text from process.py and reformats it
@@ -267,6 +762,9 @@ def reformat_stats_for_youtube(stats_text):
 
 def main():
     args = parse_args()
+    if args.per_track:
+        upload_per_track(args)
+        return
 
     # 1. Prepare Content (Merge)
     print("📦 Preparing Content...")
@@ -284,8 +782,13 @@ def main():
         youtube_friendly_stats = reformat_stats_for_youtube(stats_content)
         full_description += "\n\n" + youtube_friendly_stats
 
-    success = merge_videos(list_file, args.file)
-    if not success: return
+    # With --pipeline the merge runs during the upload, in step 3
+    if not args.pipeline:
+        if find_upload_session(args.file):
+            # Merging again would change the file under the half-finished upload
+            print(f"↩️  '{args.file}' has an unfinished upload, resuming it instead of merging again.")
+        elif not merge_videos(list_file, args.file):
+            return
 
     # 2. Authenticate
     try:
@@ -296,7 +799,11 @@ def main():
         return
 
     # 3. Upload
-    video_id = upload_video(youtube, args.file, args.title, full_description, args.privacy)
+    if args.pipeline:
+        video_id = merge_and_upload(youtube, list_file, args.file, args.title, full_description, args.privacy)
+        if not video_id: return
+    else:
+        video_id = upload_video(youtube, args.file, args.title, full_description, args.privacy)
 
     # 4. Playlist
     playlist_id = get_or_create_playlist(youtube, args.playlist, args.privacy)
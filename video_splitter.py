@@ -5,21 +5,35 @@ import subprocess
 import re
 import yt_dlp
 import hashlib
+import numpy as np
 
-# File to store IDs of items we have already processed
-HISTORY_FILE = "download_history.log"
+import media_probe
+from audio_stream import stream_pcm_blocks
+from media_probe import NATIVE_AUDIO_CONTAINERS
+import source_cache
+from job_history import JobHistory
+from chapter_splitter import split_chapters, DEFAULT_WORKERS, COPY_ALL
 
-def load_history():
-    """Loads the set of previously processed item IDs."""
-    if not os.path.exists(HISTORY_FILE):
-        return set()
-    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-        return set(line.strip() for line in f if line.strip())
 
-def update_history(item_id):
-    """Appends a new ID to the history file."""
-    with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
-        f.write(item_id + "\n")
+# --- STREAMING SILENCE DETECTION ---
+# Silence detection only needs a coarse mono signal, so ffmpeg downmixes and
+# resamples for us and we read it back a block at a time. Memory stays at one
+# block no matter how long the mix is.
+SILENCE_SAMPLE_RATE = 8000
+SILENCE_FRAME_MS = 10
+SILENCE_BLOCK_SECONDS = 30
+# Anything shorter than this between two silences is a glitch, not a song
+MIN_TRACK_SECONDS = 15
+
+# --- NATIVE AUDIO ---
+# With --audio the site's own audio stream is kept and clips are stream-copied
+# into the container that matches its codec (NATIVE_AUDIO_CONTAINERS) - no
+# lossy transcode at all. MP3 is the exception (see MP3_CODEC_ARGS).
+# Samples per coded frame. Copied audio can only be cut between frames, so clip
+# boundaries are snapped to this grid and neighbouring clips meet exactly.
+AUDIO_FRAME_SAMPLES = {"aac": 1024, "opus": 960}
+# Explicit --audio-format mp3: transcode each clip once, straight from the source
+MP3_CODEC_ARGS = ["-vn", "-c:a", "libmp3lame", "-b:a", "192k"]
 
 def get_file_hash(filepath):
     """Computes the SHA256 hash of a file's content."""
@@ -36,12 +50,12 @@ def sanitize_filename(name):
     """Removes illegal characters from filenames."""
     return re.sub(r'[\\/*?:"<>|]', "", name).strip()
 
-def get_unique_filename(directory, filename):
-    """Ensures we don't overwrite existing files."""
+def get_unique_filename(directory, filename, reserved=()):
+    """Ensures we don't overwrite existing files (or names already claimed in `reserved`)."""
     base, ext = os.path.splitext(filename)
     counter = 1
     new_filename = filename
-    while os.path.exists(os.path.join(directory, new_filename)):
+    while new_filename in reserved or os.path.exists(os.path.join(directory, new_filename)):
         new_filename = f"{base}_{counter}{ext}"
         counter += 1
     return new_filename
@@ -92,7 +106,107 @@ def parse_timestamps_from_text(text, duration):
         valid_chapters[-1]['end_time'] = duration if duration else valid_chapters[-1]['start_time'] + 300
     return valid_chapters
 
-def split_video(url, prefix=None, output_folder="split_output", audio_only=False, textfile=None, auto_silence=False, min_silence=2000, silence_thresh=-40, download_only=False):
+def iter_silence_chapters(path, min_silence=2000, silence_thresh=-40, min_track_s=MIN_TRACK_SECONDS):
+    """
+    Yields chapters split on silent gaps, as soon as each gap has been heard.
+
+    Same rule as pydub's detect_silence: a window of `min_silence` ms is
+    silent if its RMS is at or below `silence_thresh` dBFS, and overlapping
+    silent windows join into one gap, so a click inside a pause doesn't end
+    it. pydub slides the window over the whole decoded file in 1 ms steps;
+    here it slides in SILENCE_FRAME_MS steps over running sums of per-frame
+    energy, block by block as ffmpeg decodes. Tracks shorter than
+    `min_track_s` are dropped.
+    """
+    frame_len = SILENCE_SAMPLE_RATE * SILENCE_FRAME_MS // 1000
+    # pydub measures dBFS against the full 16-bit range
+    thresh_rms = (10 ** (silence_thresh / 20.0)) * 32768
+    window = max(1, int(np.ceil(min_silence / SILENCE_FRAME_MS)))
+    # A window is silent when its mean square is under this
+    thresh_sum = thresh_rms * thresh_rms * frame_len * window
+
+    leftover = np.empty(0, dtype=np.int16)
+    # Energies of the last window-1 frames, for windows spanning two blocks
+    carry = np.empty(0, dtype=np.float64)
+    windows_seen = 0    # window start positions evaluated so far
+    total_samples = 0
+    run_start = run_end = None   # frames covered by the current gap
+    start_t = 0.0
+    count = 0
+
+    def close_run():
+        nonlocal start_t, count
+        chapter = None
+        end_t = run_start * SILENCE_FRAME_MS / 1000.0
+        if end_t - start_t > min_track_s:
+            count += 1
+            chapter = {'start_time': start_t, 'end_time': end_t, 'title': f"AutoTrack_{count:02d}"}
+        start_t = run_end * SILENCE_FRAME_MS / 1000.0
+        return chapter
+
+    for block in stream_pcm_blocks(path, SILENCE_SAMPLE_RATE, SILENCE_BLOCK_SECONDS):
+        total_samples += len(block)
+        samples = np.concatenate((leftover, block)) if len(leftover) else block
+        usable = len(samples) - len(samples) % frame_len
+        leftover = samples[usable:]
+        if not usable:
+            continue
+
+        frames = samples[:usable].astype(np.float64).reshape(-1, frame_len)
+        energy = np.concatenate((carry, np.einsum('ij,ij->i', frames, frames)))
+        if len(energy) < window:
+            carry = energy
+            continue
+        carry = energy[len(energy) - window + 1:]
+
+        sums = np.cumsum(np.concatenate(([0.0], energy)))
+        silent = (sums[window:] - sums[:-window]) <= thresh_sum
+        base = windows_seen
+        windows_seen += len(silent)
+
+        # Consecutive silent window starts a..b cover frames a..b+window
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], silent.astype(np.int8), [0]))))
+        for a, b in zip((edges[::2] + base).tolist(), (edges[1::2] + base).tolist()):
+            if run_start is not None and a > run_end:
+                chapter = close_run()
+                run_start = None
+                if chapter:
+                    yield chapter
+            if run_start is None:
+                run_start = a
+            run_end = b - 1 + window
+
+        # Nothing later can reach back into a gap that ended before the windows seen so far
+        if run_start is not None and windows_seen > run_end:
+            chapter = close_run()
+            run_start = None
+            if chapter:
+                yield chapter
+
+    # A trailing silence counts as a gap; whatever follows the last gap is a track
+    duration_sec = total_samples / SILENCE_SAMPLE_RATE
+    if run_start is not None:
+        chapter = close_run()
+        if chapter:
+            yield chapter
+    if duration_sec - start_t > min_track_s:
+        count += 1
+        yield {'start_time': start_t, 'end_time': duration_sec, 'title': f"AutoTrack_{count:02d}"}
+
+def probe_audio_stream(path):
+    """Returns (codec_name, sample_rate) of the file's first audio stream, or (None, 0)."""
+    info = media_probe.probe(path)
+    if info is None or info.audio is None:
+        return None, 0
+    return info.audio.codec_name, info.audio.sample_rate
+
+def snap_to_frame(seconds, frame_s):
+    """Rounds a timestamp to the nearest coded audio frame boundary."""
+    if seconds is None or not frame_s:
+        return seconds
+    return round(round(seconds / frame_s) * frame_s, 6)
+
+def split_video(url, prefix=None, output_folder="split_output", audio_only=False, textfile=None, auto_silence=False, min_silence=2000, silence_thresh=-40, download_only=False, workers=DEFAULT_WORKERS, smart_cut=False, audio_format="native"):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
@@ -126,90 +240,93 @@ def split_video(url, prefix=None, output_folder="split_output", audio_only=False
     if chapters and not auto_silence:
         print(f"✅ Found {len(chapters)} chapters.")
 
-    # 2. Download the FULL Source File
-    print("⬇️  Downloading full source file (will split locally)...")
-    
-    temp_filename = "temp_full_source"
-    
+    # 2. Get the FULL Source File
+    # Sources live in the shared download cache, so re-splitting the same video
+    # (different prefix, timestamps or silence settings) skips the download.
     ydl_opts_download = {
-        'outtmpl': temp_filename,
         'quiet': False,
-        # Force MP4 for video or MP3/Best for audio
+        # Force MP4 for video; for audio keep the best stream exactly as the site serves it
         'format': 'bestaudio/best' if audio_only else 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
     }
-    
-    if audio_only:
-        ydl_opts_download['postprocessors'] = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }]
-        ext = ".mp3"
-    else:
+
+    def download(tmp_dir):
+        print("⬇️  Downloading full source file (will split locally)...")
+        opts = dict(ydl_opts_download, outtmpl=os.path.join(tmp_dir, "source.%(ext)s"))
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.download([url])
+
+    with source_cache.cached_source(source_cache.source_id_for(url, info), ydl_opts_download['format'], download) as full_file_path:
+        if not full_file_path:
+            print("❌ Error: Could not find downloaded source file.")
+            return
+        return split_source(full_file_path, info, chapters, audio_only, audio_format, prefix, output_folder,
+                            auto_silence, min_silence, silence_thresh, download_only, workers, smart_cut)
+
+def split_source(full_file_path, info, chapters, audio_only, audio_format, prefix, output_folder,
+                 auto_silence, min_silence, silence_thresh, download_only, workers, smart_cut):
+    """
+    Splits (or, with download_only, exports) a downloaded source. The source
+    itself is left in place. Returns the files written, or None on failure.
+    """
+    # Work out the clip format: video clips and native audio are stream-copied,
+    # MP3 is only produced when explicitly asked for.
+    codec_args, copy_args, frame_s = None, COPY_ALL, None
+    if not audio_only:
         ext = ".mp4"
+    elif audio_format == "mp3":
+        ext, codec_args = ".mp3", MP3_CODEC_ARGS
+    else:
+        codec, sample_rate = probe_audio_stream(full_file_path)
+        if codec == "mp3":
+            # Re-encode MP3 to avoid corrupted frame headers which cause Shazamio to segfault
+            # (a copied clip can start part-way through a frame)
+            print("🎵 Source audio is MP3, clips are re-encoded to MP3 so each starts on a clean frame.")
+            ext, codec_args = ".mp3", MP3_CODEC_ARGS
+        elif codec in NATIVE_AUDIO_CONTAINERS:
+            ext, copy_args = NATIVE_AUDIO_CONTAINERS[codec], ["-vn", "-c:a", "copy"]
+            if codec in AUDIO_FRAME_SAMPLES and sample_rate:
+                frame_s = AUDIO_FRAME_SAMPLES[codec] / sample_rate
+            print(f"🎵 Keeping the original {codec} audio (no transcoding), clips will be {ext}")
+        else:
+            print(f"⚠️  Can't stream-copy '{codec}' audio into a standard container, transcoding clips to MP3.")
+            ext, codec_args = ".mp3", MP3_CODEC_ARGS
 
-    full_file_path = f"{temp_filename}{ext}"
-    
-    # If the file ended up being .webm or .mkv, yt-dlp might have appended the extension
-    # We let yt-dlp handle the download, then find the file.
-    with yt_dlp.YoutubeDL(ydl_opts_download) as ydl:
-        ydl.download([url])
-
-    # Find the actual downloaded file (handling potential extension mismatches)
-    if not os.path.exists(full_file_path):
-        # Fallback search
-        for f in os.listdir("."):
-            if f.startswith(temp_filename):
-                full_file_path = f
-                break
-    
-    if not os.path.exists(full_file_path):
-        print("❌ Error: Could not find downloaded source file.")
-        return
-        
     if download_only:
         video_title = info.get('title', 'Downloaded_File')
         clean_title = sanitize_filename(video_title)
         final_name = f"{prefix}-{clean_title}{ext}" if prefix else f"{clean_title}{ext}"
         final_name = get_unique_filename(output_folder, final_name)
         output_path = os.path.join(output_folder, final_name)
-        os.rename(full_file_path, output_path)
+        if audio_only:
+            # Remux (or, for mp3, transcode) the whole file into the chosen container
+            if not split_chapters(full_file_path, [{'start_time': 0, 'end_time': None, 'output_path': output_path}],
+                                  codec_args, copy_args=copy_args):
+                print(f"❌ Error: Could not write '{output_path}'.")
+                return
+        else:
+            source_cache.export(full_file_path, output_path)
         print(f"✅ Download complete! Saved without splitting to: {output_path}")
-        return
+        return [output_path]
 
     if not chapters or auto_silence:
         print(f"🎧 Analyzing audio for silence (min {min_silence}ms at {silence_thresh}dBFS) to detect song boundaries...")
-        from pydub import AudioSegment
-        from pydub.silence import detect_silence
-        
-        audio = AudioSegment.from_file(full_file_path)
-        silences = detect_silence(audio, min_silence_len=min_silence, silence_thresh=silence_thresh)
-        
         chapters = []
-        start_t = 0
-        duration_sec = len(audio) / 1000.0
-        
-        for sil_start, sil_end in silences:
-            end_t = sil_start / 1000.0
-            if end_t - start_t > 15:  # Minimum song length of 15s to avoid glitches
-                chapters.append({'start_time': start_t, 'end_time': end_t, 'title': f"AutoTrack_{len(chapters)+1:02d}"})
-            start_t = sil_end / 1000.0
-            
-        if duration_sec - start_t > 15:
-            chapters.append({'start_time': start_t, 'end_time': duration_sec, 'title': f"AutoTrack_{len(chapters)+1:02d}"})
-            
+        for chapter in iter_silence_chapters(full_file_path, min_silence, silence_thresh):
+            chapters.append(chapter)
+            print(f"   Found track {len(chapters)}: {chapter['start_time']:.1f}s -> {chapter['end_time']:.1f}s", end="\r", flush=True)
+        print()
+
         if not chapters:
              print("❌ Error: Could not detect any clear songs via silence.")
-             os.remove(full_file_path)
              return
         print(f"✅ Auto-detected {len(chapters)} tracks from audio silence.")
 
     print(f"✂️  Splitting {full_file_path} into {len(chapters)} clips...")
 
     # 3. Split using FFmpeg
+    jobs = []
+    reserved = set()
     for i, chapter in enumerate(chapters):
-        start_time = chapter['start_time']
-        end_time = chapter['end_time']
         title = chapter.get('title', 'NA')
         
         # Determine Filename
@@ -231,50 +348,48 @@ def split_video(url, prefix=None, output_folder="split_output", audio_only=False
             clean_title = sanitize_filename(title) if not is_title_bad else f"Track_{i+1:02d}"
             final_name = f"{i+1:02d}_{clean_title}{ext}"
 
-        # Prevent Overwrites
-        final_name = get_unique_filename(output_folder, final_name)
-        output_path = os.path.join(output_folder, final_name)
+        # Prevent Overwrites (including two chapters sharing a title)
+        final_name = get_unique_filename(output_folder, final_name, reserved)
+        reserved.add(final_name)
+        jobs.append({
+            'start_time': snap_to_frame(chapter['start_time'], frame_s),
+            'end_time': snap_to_frame(chapter['end_time'], frame_s),
+            'output_path': os.path.join(output_folder, final_name),
+        })
 
-        # FFmpeg Split Command
-        cmd = [
-            "ffmpeg", "-y", "-v", "error",
-            "-i", full_file_path,
-            "-ss", str(start_time),
-            "-to", str(end_time)
-        ]
-        
-        if ext == ".mp3":
-            # Re-encode MP3 to avoid corrupted frame headers which cause Shazamio to segfault
-            cmd.extend(["-c:a", "libmp3lame", "-b:a", "192k"])
-        else:
-            cmd.extend(["-c", "copy"])
-            
-        cmd.append(output_path)
-        
-        subprocess.run(cmd)
-        print(f"   Generated: {final_name}")
+    outputs = []
+    for job in split_chapters(full_file_path, jobs, codec_args, workers, smart=smart_cut and not audio_only, copy_args=copy_args):
+        print(f"   Generated: {os.path.basename(job['output_path'])}")
+        outputs.append(job['output_path'])
+    if len(outputs) < len(jobs):
+        # Not recorded as done, so a rerun tries again
+        print(f"❌ {len(jobs) - len(outputs)} of {len(jobs)} tracks could not be cut (see the ffmpeg errors above).")
+        return None
 
-    # 4. Cleanup
-    os.remove(full_file_path)
     print(f"\n🎉 Done! All files are in '{output_folder}/'")
+    return outputs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Download and Split YouTube video by Chapters.", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("url", help="YouTube Video URL")
     parser.add_argument("--prefix", "-p", help="Prefix (e.g. 'Waltz'). If chapters have no names, 'Waltz-01' is used.")
     parser.add_argument("--folder", "-f", default="split_output", help="Output folder")
-    parser.add_argument("--audio", "-a", action="store_true", help="Download as MP3 audio only")
+    parser.add_argument("--audio", "-a", action="store_true", help="Download audio only")
+    parser.add_argument("--audio-format", choices=["native", "mp3"], default="native",
+                        help="With --audio: 'native' keeps the site's own codec (AAC/Opus...) with no transcoding; 'mp3' transcodes each clip to MP3")
     parser.add_argument("--textfile", "-t", help="Optional text file with timestamps to use instead of video description")
     parser.add_argument("--auto-silence", "-s", action="store_true", help="Auto-detect song boundaries using silence if no chapters are found")
     parser.add_argument("--min-silence", type=int, default=2000, help="Minimum silence length in ms for auto-split (default: 2000)")
     parser.add_argument("--silence-thresh", type=int, default=-40, help="Silence threshold in dBFS for auto-split (default: -40)")
     parser.add_argument("--download-only", "-d", action="store_true", help="Download the video/audio only without splitting")
+    parser.add_argument("--workers", "-w", type=int, default=DEFAULT_WORKERS, help="Max parallel ffmpeg processes when re-encoding clips")
+    parser.add_argument("--smart-cut", action="store_true", help="Frame-accurate video clips: re-encode only up to the first keyframe of each clip, copy the rest")
     parser.add_argument("--force", action="store_true", help="Ignore history and force re-processing")
 
     args = parser.parse_args()
 
     # --- History Check ---
-    history = load_history()
+    history = JobHistory()
     
     # Create a unique ID for this specific job
     base_id = f"video_splitter|{args.url}|{args.prefix or ''}"
@@ -289,20 +404,29 @@ if __name__ == "__main__":
         mode_id = "chapters"
         
     job_id = f"{base_id}|{mode_id}|audio_only={args.audio}"
+    if args.audio and args.audio_format == "native":
+        job_id += "|native"
+    if args.smart_cut:
+        job_id += "|smart_cut"
 
     if not args.force and job_id in history:
         print(f"⏭️  Skipping (Already in history): {args.url} with mode {mode_id}")
         exit()
     # --- End History Check ---
     
+    history.start(job_id, "video_splitter", vars(args))
     try:
-        split_video(args.url, args.prefix, args.folder, args.audio, args.textfile, args.auto_silence, args.min_silence, args.silence_thresh, args.download_only)
+        outputs = split_video(args.url, args.prefix, args.folder, args.audio, args.textfile, args.auto_silence, args.min_silence, args.silence_thresh, args.download_only, args.workers, args.smart_cut, args.audio_format)
         
         # If successful, save to history
-        update_history(job_id)
-        print(f"✅ Success. Added to history: {job_id}")
+        if outputs is None:
+            history.finish(job_id, status="failed")
+        else:
+            history.finish(job_id, outputs)
+            print(f"✅ Success. Added to history: {job_id}")
 
     except Exception as e:
+        history.finish(job_id, status="failed")
         print(f"❌ An error occurred during splitting: {e}")
         # Optionally, re-raise the exception if you want to see a full traceback
         # raise
\ No newline at end of file
@@ -3,54 +3,100 @@ import os
 import subprocess
 import sys
 
-def adjust_volume(source_path, db_adjustment):
-    # 1. Validation
-    if not os.path.exists(source_path):
-        print(f"❌ Error: File not found: {source_path}")
-        return
+from batch_runner import add_batch_args, expand_sources, run_batch
+from media_probe import probe
 
-    # 2. Generate Output Filename
+# Encoder settings for re-encoding each codec after a gain change
+AUDIO_ENCODERS = {
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "0"],
+    "aac": ["-c:a", "aac", "-b:a", "256k"],
+    "opus": ["-c:a", "libopus", "-b:a", "160k"],
+    "vorbis": ["-c:a", "libvorbis", "-q:a", "6"],
+    "flac": ["-c:a", "flac"],
+    "pcm_s16le": ["-c:a", "pcm_s16le"],
+}
+# Codec to assume from the extension when the file can't be probed
+CODEC_BY_EXT = {".mp3": "mp3", ".m4a": "aac", ".mp4": "aac", ".aac": "aac", ".mov": "aac",
+                ".opus": "opus", ".webm": "opus", ".ogg": "vorbis", ".flac": "flac", ".wav": "pcm_s16le"}
+
+def volume_suffix(db_adjustment):
+    # Format the suffix nicely (e.g., "+5dB", "-3dB")
+    sign_symbol = "+" if db_adjustment >= 0 else "" 
+    return f"{sign_symbol}{db_adjustment}dB"
+
+def output_path_for(source_path, db_adjustment):
     # Example: "song.mp3" -> "song_+5dB.mp3" or "song_-3dB.mp3"
     directory, filename = os.path.split(source_path)
     name, ext = os.path.splitext(filename)
-    
-    # Format the suffix nicely (e.g., "+5dB", "-3dB")
-    sign_symbol = "+" if db_adjustment >= 0 else "" 
-    suffix = f"{sign_symbol}{db_adjustment}dB"
-    
-    new_filename = f"{name}_{suffix}{ext}"
-    output_path = os.path.join(directory, new_filename)
+    return os.path.join(directory, f"{name}_{volume_suffix(db_adjustment)}{ext}")
 
-    print(f"🔊 Processing: {filename}")
-    print(f"   Adjustment: {suffix}")
-    print(f"   Saving to:  {new_filename}")
+def apply_gain(source_path, output_path, db_adjustment):
+    """
+    Writes a copy of the file with its audio `db_adjustment` dB louder (or
+    quieter), in one encode. The audio is re-encoded in its own codec; any
+    video or cover art is stream-copied untouched.
+    """
+    info = probe(source_path)
+    codec = info.audio.codec_name if info and info.audio else None
+    codec = codec if codec in AUDIO_ENCODERS else CODEC_BY_EXT.get(os.path.splitext(output_path)[1].lower(), "aac")
 
-    # 3. Run FFmpeg Command
     # The 'volume' filter uses dB. "volume=5dB" increases, "volume=-5dB" decreases.
     cmd = [
         "ffmpeg", "-y",
         "-v", "error",            # Less verbose
         "-i", source_path,
+        "-map", "0:v?", "-map", "0:a",
+        "-c", "copy",             # Video/cover art as they are
         "-filter:a", f"volume={db_adjustment}dB",
-        "-vn",                    # Audio only
+        *AUDIO_ENCODERS[codec],
         output_path
     ]
+    subprocess.run(cmd, check=True)
+
+def adjust_volume(source_path, db_adjustment):
+    """Changes one file's volume. Returns the output path, or None if it failed."""
+    # 1. Validation
+    if not os.path.exists(source_path):
+        print(f"❌ Error: File not found: {source_path}")
+        return None
+
+    # 2. Generate Output Filename
+    filename = os.path.basename(source_path)
+    suffix = volume_suffix(db_adjustment)
+    output_path = output_path_for(source_path, db_adjustment)
+    new_filename = os.path.basename(output_path)
+
+    print(f"🔊 Processing: {filename}")
+    print(f"   Adjustment: {suffix}")
+    print(f"   Saving to:  {new_filename}")
 
+    # 3. Run FFmpeg
     try:
-        subprocess.run(cmd, check=True)
+        apply_gain(source_path, output_path, db_adjustment)
         print(f"✅ Success! Created: {output_path}")
+        return output_path
     except subprocess.CalledProcessError as e:
         print(f"❌ FFmpeg Error: {e}")
     except FileNotFoundError:
         print("❌ Error: FFmpeg is not installed or not in your PATH.")
+    return None
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Adjust music volume (loudness) in decibels (dB).", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     
     # Arguments
-    parser.add_argument("--source", required=True, help="Path to the mp3 file")
+    parser.add_argument("--source", required=True, nargs="+", help="Audio or video files, folders or globs (e.g. 'Rumba*.mp3'); video is copied as is")
     parser.add_argument("--adjust", required=True, type=float, help="Volume change in dB (e.g. 5 for louder, -3 for quieter)")
+    add_batch_args(parser)
 
     args = parser.parse_args()
     
-    adjust_volume(args.source, args.adjust)
\ No newline at end of file
+    if len(args.source) == 1 and os.path.isfile(os.path.expanduser(args.source[0])):
+        adjust_volume(os.path.expanduser(args.source[0]), args.adjust)
+    else:
+        sources = expand_sources(args.source)
+        if not sources:
+            print("❌ Error: No audio files found.")
+            sys.exit(1)
+        if run_batch(adjust_volume, sources, (args.adjust,), output_path_for, args.workers, args.force):
+            sys.exit(1)
\ No newline at end of file